@@ -7,6 +7,13 @@ from flask_pagedown import PageDown
 from flask_sqlalchemy import SQLAlchemy
 
 from config import config
+from .compress import Compress
+from .follow_graph import FollowGraph
+from .fragments import FragmentCache
+from .last_seen import LastSeenTracker
+from .metrics import Metrics
+from .outbox import Outbox
+from .query_analyzer import QueryAnalyzer
 
 
 bootstrap = Bootstrap()
@@ -14,6 +21,13 @@ mail = Mail()
 moment = Moment()
 db = SQLAlchemy()
 pagedown = PageDown()
+compress = Compress()
+fragment_cache = FragmentCache()
+follow_graph = FollowGraph()
+last_seen = LastSeenTracker()
+metrics = Metrics()
+outbox = Outbox()
+query_analyzer = QueryAnalyzer()
 
 login_manager = LoginManager()
 login_manager.session_protection = 'strong'
@@ -31,6 +45,13 @@ def create_app(config_name):
     db.init_app(app)
     pagedown.init_app(app)
     login_manager.init_app(app)
+    compress.init_app(app)
+    fragment_cache.init_app(app)
+    follow_graph.init_app(app)
+    last_seen.init_app(app)
+    metrics.init_app(app)
+    outbox.init_app(app)
+    query_analyzer.init_app(app)
 
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
@@ -2,4 +2,5 @@ from flask import Blueprint
 
 api = Blueprint('api', __name__)
 
-from . import authentication, comments, errors, posts, users
\ No newline at end of file
+from . import (authentication, comments, errors, export, posts, search,
+               users)
\ No newline at end of file
@@ -3,7 +3,8 @@ from flask_httpauth import HTTPBasicAuth
 
 from . import api
 from .errors import forbidden, unauthorized
-from ..models import AnonymousUser, User
+from ..credentials import authenticate
+from ..models import AnonymousUser, Principal
 
 auth = HTTPBasicAuth()
 
@@ -14,15 +15,12 @@ def verify_password(email_or_token, password):
         g.current_user = AnonymousUser()
         return True
     if password == '':
-        g.current_user = User.verify_auth_token(email_or_token)
+        g.current_user = Principal.from_token(email_or_token)
         g.token_used = True
         return g.current_user is not None
-    user = User.query.filter_by(email=email_or_token).first()
-    if not user:
-        return False
-    g.current_user = user
     g.token_used = False
-    return user.verify_password(password)
+    g.current_user = authenticate(email_or_token, password)
+    return g.current_user is not None
 
 
 @auth.error_handler
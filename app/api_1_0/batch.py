@@ -0,0 +1,68 @@
+from flask import current_app, jsonify, request
+from ..exceptions import ValidationError
+from .representation import serialize
+
+
+def load_batch(key, from_json):
+    """Build an object from every item in the ``key`` array of the request.
+
+    Every item is validated, and its body rendered, before anything is
+    written. Returns ``(objects, None)``, or ``(None, response)`` with a
+    400 response listing the index and error of every invalid item.
+    """
+    data = request.json
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValidationError('{} must be a non-empty array'.format(key))
+    limit = current_app.config['APP_API_BATCH_SIZE']
+    if len(items) > limit:
+        raise ValidationError('at most {} {} per request'.format(limit, key))
+    objects = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValidationError('item is not an object')
+            objects.append(from_json(item))
+        except ValidationError as e:
+            errors.append({'index': index, 'message': e.args[0]})
+    if errors:
+        response = jsonify({
+            'error': 'bad request',
+            'message': '{} of {} {} are invalid'.format(
+                len(errors), len(items), key),
+            'errors': errors,
+        })
+        response.status_code = 400
+        return None, response
+    return objects, None
+
+
+def parse_ids(value):
+    """Parse a comma separated ``ids`` argument, keeping order and repeats."""
+    try:
+        ids = [int(id) for id in value.split(',') if id.strip()]
+    except ValueError:
+        raise ValidationError('invalid ids')
+    if not ids:
+        raise ValidationError('invalid ids')
+    limit = current_app.config['APP_API_BATCH_SIZE']
+    if len(ids) > limit:
+        raise ValidationError('at most {} ids per request'.format(limit))
+    return ids
+
+
+def get_many(model, key):
+    """Return the JSON response for the ``ids`` argument of a list endpoint.
+
+    All ids are loaded with one ``IN`` query. Results follow the order of
+    the requested ids, with ``null`` for ids that do not exist, which are
+    also listed under ``not_found``.
+    """
+    ids = parse_ids(request.args['ids'])
+    found = model.query.filter(model.id.in_(set(ids))).all()
+    objects = dict(zip([item.id for item in found], serialize(found)))
+    return jsonify({
+        key: [objects.get(id) for id in ids],
+        'not_found': [id for id in ids if id not in objects],
+    })
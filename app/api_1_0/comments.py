@@ -1,59 +1,51 @@
 from flask import current_app, g, jsonify, request, url_for
 from .. import db
 from ..models import Comment, Permission, Post
+from ..pagination import envelope, paginate
 from . import api
+from .batch import get_many, load_batch
+from .conditional import conditional, row_version
 from .decorators import permission_required
+from .representation import serialize, serialize_one
 
 
 @api.route('/comments/')
+@conditional()
 def get_comments():
-    page = request.args.get('page', 1, type=int)
-    pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(
-        page,
+    if 'ids' in request.args:
+        return get_many(Comment, 'comments')
+    pagination = paginate(
+        Comment.query,
+        (Comment.timestamp, Comment.id),
         per_page=current_app.config['APP_COMMENTS_PER_PAGE'],
-        error_out=False
     )
     comments = pagination.items
-    prev_page = None
-    if pagination.has_prev:
-        prev_page = url_for('api.get_comments', page=page-1, _external=True)
-    next_page=None
-    if pagination.has_next:
-        next_page = url_for('api.get_comments', page=page+1, _external=True)
-    return jsonify({
-        'comments': [comment.to_json() for comment in comments],
-        'prev': prev_page,
-        'next': next_page,
-        'count': pagination.total
-    })
+    json_response = envelope(pagination, 'api.get_comments')
+    json_response['comments'] = serialize(comments)
+    return jsonify(json_response)
 
 
 @api.route('/comments/<int:id>')
+@conditional(lambda id: row_version(Comment, id))
 def get_comment(id):
     comment = Comment.query.get_or_404(id)
-    return jsonify(comment.to_json())
+    return jsonify(serialize_one(comment))
 
 
 @api.route('/posts/<int:id>/comments/')
+@conditional()
 def get_post_comments(id):
     post = Post.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
-    pagination = post.comments.order_by(Comment.timestamp.asc()).paginate(
-        page, per_page=current_app.config['APP_COMMENTS_PER_PAGE'],
-        error_out=False)
+    pagination = paginate(
+        post.comments,
+        (Comment.timestamp, Comment.id),
+        per_page=current_app.config['APP_COMMENTS_PER_PAGE'],
+        ascending=True,
+    )
     comments = pagination.items
-    prev_page = None
-    if pagination.has_prev:
-        prev_page = url_for('api.get_comments', page=page-1, _external=True)
-    next_page = None
-    if pagination.has_next:
-        next_page = url_for('api.get_comments', page=page+1, _external=True)
-    return jsonify({
-        'comments': [comment.to_json() for comment in comments],
-        'prev': prev_page,
-        'next': next_page,
-        'count': pagination.total
-    })
+    json_response = envelope(pagination, 'api.get_post_comments', id=id)
+    json_response['comments'] = serialize(comments)
+    return jsonify(json_response)
 
 
 @api.route('/posts/<int:id>/comments/', methods=['POST'])
@@ -61,10 +53,26 @@ def get_post_comments(id):
 def new_post_comment(id):
     post = Post.query.get_or_404(id)
     comment = Comment.from_json(request.json)
-    comment.author = g.current_user
+    comment.author_id = g.current_user.id
     comment.post = post
     db.session.add(comment)
     db.session.commit()
     return jsonify(comment.to_json()), 201, \
         {'Location': url_for('api.get_comment',
                              id=comment.id, _external=True)}
+
+
+@api.route('/posts/<int:id>/comments/batch', methods=['POST'])
+@permission_required(Permission.COMMENT)
+def new_post_comments(id):
+    post = Post.query.get_or_404(id)
+    comments, error = load_batch('comments', Comment.from_json)
+    if error is not None:
+        return error
+    for comment in comments:
+        comment.author_id = g.current_user.id
+        comment.post_id = post.id
+    Comment.insert_many(comments)
+    db.session.commit()
+    return jsonify({'comments': [comment.to_json()
+                                 for comment in comments]}), 201
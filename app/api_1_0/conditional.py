@@ -0,0 +1,92 @@
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, request
+
+from .representation import embeds_related
+
+
+def row_version(model, id):
+    """Return the ``updated_at`` of one row, None when it does not exist.
+
+    The row is loaded through the session identity map, so the ``get`` of
+    the view that follows, or precedes, the probe costs no second query.
+    """
+    row = model.query.get(id)
+    return None if row is None else (row.updated_at,)
+
+
+def _naive(value):
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _is_conditional():
+    return bool(request.if_none_match) or \
+        request.if_modified_since is not None
+
+
+def conditional(probe=None):
+    """Answer conditional GETs of a view.
+
+    ``probe`` is called with the view arguments and returns a tuple whose
+    first item is the last modification time of the resource, or None to
+    let the view run unconditionally. The ETag hashes that tuple together
+    with the request URL. On requests with ``If-None-Match`` or
+    ``If-Modified-Since`` the probe runs first, so the 304 is sent before
+    the view serializes anything; other requests run the view and probe
+    afterwards, for the headers only.
+
+    Without a probe, or when the request embeds related objects the probe
+    does not cover, the ETag is a hash of the response body. The view
+    always runs then and a 304 only saves the transfer. List views use
+    this: a version covering deletes would have to scan every row the
+    list could contain, while the body hash is built from the page the
+    view loads anyway.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if probe is None or embeds_related():
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code == 200:
+                    response.add_etag(weak=True)
+                    response.make_conditional(request)
+                return response
+            version = None
+            modified = True
+            if _is_conditional():
+                version = probe(*args, **kwargs)
+                if version is not None:
+                    etag, last_modified = _validators(version)
+                    if request.if_none_match:
+                        modified = not request.if_none_match.contains_weak(
+                            etag)
+                    elif last_modified is not None:
+                        modified = last_modified > \
+                            _naive(request.if_modified_since)
+            if not modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code == 200:
+                    version = probe(*args, **kwargs)
+            if response.status_code in (200, 304) and version is not None:
+                etag, last_modified = _validators(version)
+                response.set_etag(etag, weak=True)
+                if last_modified is not None:
+                    response.last_modified = last_modified
+            return response
+        return decorated_function
+    return decorator
+
+
+def _validators(version):
+    etag = hashlib.sha1(repr(
+        (request.url,) + version).encode('utf-8')).hexdigest()
+    last_modified = version[0]
+    if last_modified is not None:
+        last_modified = last_modified.replace(microsecond=0)
+    return etag, last_modified
@@ -0,0 +1,20 @@
+from flask import Response, current_app, request, stream_with_context
+from ..export import export_ndjson, export_query, parse_since
+from ..models import Permission
+from . import api
+from .decorators import permission_required
+
+
+@api.route('/export/<any(posts, comments, users):kind>')
+@permission_required(Permission.ADMINISTER)
+def export(kind):
+    query = export_query(
+        kind,
+        since=parse_since(request.args.get('since')),
+        author=request.args.get('author', type=int),
+    )
+    return Response(
+        stream_with_context(export_ndjson(
+            query, current_app.config['APP_EXPORT_BATCH_SIZE'])),
+        mimetype='application/x-ndjson',
+    )
@@ -1,56 +1,67 @@
 from flask import current_app, g, jsonify, request, url_for
 from .. import db
 from ..models import Permission, Post
+from ..pagination import envelope, paginate
 from . import api
+from .batch import get_many, load_batch
+from .conditional import conditional, row_version
 from .decorators import permission_required
 from .errors import forbidden
+from .representation import serialize, serialize_one
 
 
 @api.route('/posts/')
+@conditional()
 def get_posts():
-    page = request.args.get('page', 1, type=int)
-    pagination = Post.query.paginate(
-        page,
+    if 'ids' in request.args:
+        return get_many(Post, 'posts')
+    pagination = paginate(
+        Post.query,
+        (Post.timestamp, Post.id),
         per_page=current_app.config['APP_POSTS_PER_PAGE'],
-        error_out=False
     )
     posts = pagination.items
-    prev_page = None
-    if pagination.has_prev:
-        prev_page = url_for('api.get_posts', page=page - 1, _external=True)
-    next_page = None
-    if pagination.has_next:
-        next_page = url_for('api.get_posts', page=page + 1, _external=True)
-    return jsonify({
-        'posts': [post.to_json() for post in posts],
-        'prev': prev_page,
-        'next': next_page,
-        'count': pagination.total
-    })
+    json_response = envelope(pagination, 'api.get_posts')
+    json_response['posts'] = serialize(posts)
+    return jsonify(json_response)
 
 
 @api.route('/posts/<int:id>')
+@conditional(lambda id: row_version(Post, id))
 def get_post(id):
     post = Post.query.get_or_404(id)
-    return jsonify(post.to_json())
+    return jsonify(serialize_one(post))
 
 
 @api.route('/posts/', methods=['POST'])
 @permission_required(Permission.WRITE_ARTICLES)
 def new_post():
-    post = Post.form_json(request.json)
-    post.author = g.current_user
+    post = Post.from_json(request.json)
+    post.author_id = g.current_user.id
     db.session.add(post)
     db.session.commit()
     return jsonify(post.to_json()), 201, \
         {'Location': url_for('api.get_post', id=post.id, _external=True)}
 
 
+@api.route('/posts/batch', methods=['POST'])
+@permission_required(Permission.WRITE_ARTICLES)
+def new_posts():
+    posts, error = load_batch('posts', Post.from_json)
+    if error is not None:
+        return error
+    for post in posts:
+        post.author_id = g.current_user.id
+    Post.insert_many(posts)
+    db.session.commit()
+    return jsonify({'posts': [post.to_json() for post in posts]}), 201
+
+
 @api.route('/posts/<int:id>', methods=['PUT'])
 @permission_required(Permission.WRITE_ARTICLES)
 def edit_post(id):
     post = Post.query.get_or_404(id)
-    if g.current_user != post.author and \
+    if g.current_user.id != post.author_id and \
             not g.current_user.can(Permission.ADMINISTER):
         return forbidden('Insufficient permissions')
     post.body = request.json.get('body', post.body)
@@ -0,0 +1,87 @@
+from flask import request
+from ..exceptions import ValidationError
+from ..loading import load_users
+from ..models import Comment, Post
+
+
+def _load_posts(ids):
+    ids = set(id for id in ids if id is not None)
+    if not ids:
+        return {}
+    return dict((post.id, post) for post in
+                Post.query.filter(Post.id.in_(ids)))
+
+
+# Relations that ?expand= can embed, by model: the foreign key attribute
+# and a loader returning ``{id: object}`` for a set of keys in one query.
+EXPANSIONS = {
+    Post: {'author': ('author_id', load_users)},
+    Comment: {'author': ('author_id', load_users),
+              'post': ('post_id', _load_posts)},
+}
+
+
+def _arg_list(name):
+    return [value.strip() for value in request.args.get(name, '').split(',')
+            if value.strip()]
+
+
+def _select(data, fields):
+    if not fields:
+        return data
+    unknown = fields - set(data)
+    if unknown:
+        raise ValidationError('unknown field {}'.format(sorted(unknown)[0]))
+    return dict((key, value) for key, value in data.items() if key in fields)
+
+
+def embeds_related():
+    """Tell whether the request asks for related objects to be embedded."""
+    return bool(_arg_list('expand')) or \
+        any('.' in field for field in _arg_list('fields'))
+
+
+def serialize(items):
+    """Return the JSON of ``items`` shaped by ``?fields=`` and ``?expand=``.
+
+    ``expand`` embeds the related objects in place of their URL, loading
+    each relation for the whole page with a single query. ``fields``
+    keeps only the named keys; ``author.username`` style names expand the
+    relation and trim the embedded object.
+    """
+    expand = _arg_list('expand')
+    fields = set()
+    nested = {}
+    for field in _arg_list('fields'):
+        name, _, subfield = field.partition('.')
+        fields.add(name)
+        if subfield:
+            nested.setdefault(name, set()).add(subfield)
+    if not items:
+        return []
+    # trimming an embedded object implies expanding it, and nothing is
+    # loaded for relations that fields leaves out
+    expand += [name for name in sorted(nested) if name not in expand]
+    relations = EXPANSIONS.get(type(items[0]), {})
+    for name in expand:
+        if name not in relations:
+            raise ValidationError('cannot expand {}'.format(name))
+    if fields:
+        expand = [name for name in expand if name in fields]
+    loaded = {}
+    for name in expand:
+        key, loader = relations[name]
+        loaded[name] = loader(getattr(item, key) for item in items)
+    result = []
+    for item in items:
+        data = item.to_json()
+        for name in expand:
+            related = loaded[name].get(getattr(item, relations[name][0]))
+            data[name] = None if related is None else \
+                _select(related.to_json(), nested.get(name))
+        result.append(_select(data, fields))
+    return result
+
+
+def serialize_one(item):
+    return serialize([item])[0]
@@ -0,0 +1,16 @@
+from flask import jsonify, request
+from ..pagination import envelope
+from ..search import search as search_index
+from . import api
+from .representation import serialize
+
+
+@api.route('/search')
+def search():
+    q = request.args.get('q', '')
+    kind = request.args.get('kind', 'posts')
+    pagination = search_index(kind, q, request.args.get('cursor'))
+    json_response = envelope(pagination, 'api.search', q=q, kind=kind)
+    json_response['query'] = q
+    json_response[kind] = serialize(pagination.items)
+    return jsonify(json_response)
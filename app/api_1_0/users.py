@@ -1,57 +1,53 @@
-from flask import current_app, jsonify, request, url_for
+from flask import current_app, jsonify, request
 from . import api
+from .batch import get_many
+from .conditional import conditional, row_version
+from .representation import serialize, serialize_one
+from ..exceptions import ValidationError
 from ..models import Post, User
+from ..pagination import envelope, paginate
+
+
+@api.route('/users/')
+def get_users():
+    if 'ids' not in request.args:
+        raise ValidationError('ids is required')
+    return get_many(User, 'users')
 
 
 @api.route('/users/<int:id>')
+@conditional(lambda id: row_version(User, id))
 def get_user(id):
     user = User.query.get_or_404(id)
-    return jsonify(user.to_json())
+    return jsonify(serialize_one(user))
 
 
 @api.route('/users/<int:id>/posts/')
+@conditional()
 def get_user_posts(id):
     user = User.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
-    pagination = user.posts.order_by(Post.timestamp.desc()).paginate(
-        page,
+    pagination = paginate(
+        user.posts,
+        (Post.timestamp, Post.id),
         per_page=current_app.config['APP_POSTS_PER_PAGE'],
-        error_out=False
     )
     posts = pagination.items
-    prev_page = None
-    if pagination.has_prev:
-        prev_page = url_for('api.get_posts', page=page-1, _external=True)
-    next_page = None
-    if pagination.has_next:
-        next_page = url_for('api.get_posts', page=page+1, _external=True)
-    return jsonify({
-        'posts': [post.to_json() for post in posts],
-        'prev': prev_page,
-        'next': next_page,
-        'count': pagination.total
-    })
+    json_response = envelope(pagination, 'api.get_user_posts', id=id)
+    json_response['posts'] = serialize(posts)
+    return jsonify(json_response)
 
 
 @api.route('/users/<int:id>/timeline/')
+@conditional()
 def get_user_followed_posts(id):
     user = User.query.get_or_404(id)
-    page = request.args.get('page', 1, type=int)
-    pagination = user.followed_posts.order_by(Post.timestamp.desc()).paginate(
-        page,
+    query, keys = user.timeline()
+    pagination = paginate(
+        query,
+        keys,
         per_page=current_app.config['APP_POSTS_PER_PAGE'],
-        error_out=False
     )
     posts = pagination.items
-    prev_page = None
-    if pagination.has_prev:
-        prev_page = url_for('api.get_posts', page=page-1, _external=True)
-    next_page = None
-    if pagination.has_next:
-        next_page = url_for('api.get_posts', page=page+1, _external=True)
-    return jsonify({
-        'posts': [post.to_json() for post in posts],
-        'prev': prev_page,
-        'next': next_page,
-        'count': pagination.total
-    })
\ No newline at end of file
+    json_response = envelope(pagination, 'api.get_user_followed_posts', id=id)
+    json_response['posts'] = serialize(posts)
+    return jsonify(json_response)
\ No newline at end of file
@@ -2,7 +2,7 @@ from flask import flash, redirect, request, render_template, url_for
 from flask_login import current_user, login_required, login_user, logout_user
 
 from . import auth
-from .. import db
+from .. import db, last_seen
 from .forms import (ChangeEmailForm, ChangePasswordForm, LoginForm,
                     PasswordResetForm, PasswordResetRequestForm,
                     RegistrationForm)
@@ -13,7 +13,7 @@ from ..models import User
 @auth.before_app_request
 def before_request():
     if current_user.is_authenticated:
-        current_user.ping()
+        last_seen.ping(current_user._get_current_object())
         if not current_user.confirmed and request.endpoint[:5] != 'auth.' \
                 and request.endpoint != 'static':
             return redirect(url_for('auth.unconfirmed'))
@@ -57,7 +57,8 @@ def register():
             password=form.password.data,
         )
         db.session.add(user)
-        db.session.commit()
+        # flushed for its id; committed with the email on teardown
+        db.session.flush()
         token = user.generate_confirmation_token()
         send_email(
             to=user.email,
@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Thread-safe in-process cache that evicts the least recently used key.
+
+    Implements the ``get``/``set``/``delete`` interface of the caches in
+    ``werkzeug.contrib.cache``, so either can back the application caches.
+    A ``timeout`` of 0 keeps the entry until it is evicted.
+    """
+
+    def __init__(self, maxsize=1024, default_timeout=0):
+        self.maxsize = maxsize
+        self.default_timeout = default_timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                return None
+            if expires and expires <= time.time():
+                return None
+            self._data[key] = (expires, value)
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        expires = time.time() + timeout if timeout else 0
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        return True
+
+
+class NullCache(object):
+    """Cache that stores nothing, used to switch a cache off."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout=None):
+        return True
+
+    def delete(self, key):
+        return False
+
+    def clear(self):
+        return True
+
+
+def create_cache(kind, maxsize=1024, options=None):
+    """Build a cache backend from its configured name.
+
+    ``lru`` and ``null`` are in-process; ``redis`` and ``memcached`` are
+    shared between processes and take their connection ``options`` from
+    the configuration.
+    """
+    options = options or {}
+    if kind == 'lru':
+        return LRUCache(maxsize)
+    if kind == 'null':
+        return NullCache()
+    if kind == 'redis':
+        from werkzeug.contrib.cache import RedisCache
+        return RedisCache(**options)
+    if kind == 'memcached':
+        from werkzeug.contrib.cache import MemcachedCache
+        return MemcachedCache(**options)
+    raise ValueError('unknown cache backend: {}'.format(kind))
@@ -0,0 +1,174 @@
+import gzip
+import io
+import os
+import zlib
+
+from flask import current_app, request, send_file
+
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.html', '.txt',
+                           '.json', '.xml', '.eot', '.ttf', '.ico')
+
+
+class Compress(object):
+    """Negotiated gzip/deflate compression of responses.
+
+    Dynamic responses of a compressible type and at least
+    ``APP_COMPRESS_MIN_SIZE`` bytes are compressed on the fly. Static files
+    are served from the gzip copies written by ``manage.py
+    compress_static`` when the client accepts gzip, so they cost nothing
+    to compress per request. Every response that would be compressed for
+    a client accepting it carries ``Vary: Accept-Encoding``, whether or
+    not this client did, so shared caches keep both representations apart.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('APP_COMPRESS_LEVEL', 6)
+        app.config.setdefault('APP_COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('APP_COMPRESS_MIMETYPES', [
+            'text/html', 'text/css', 'text/plain', 'text/xml',
+            'application/json', 'application/javascript',
+        ])
+        app.config.setdefault('APP_PRECOMPRESSED_DIR', os.path.join(
+            os.path.dirname(app.root_path), 'precompressed'))
+        app.after_request(self.after_request)
+
+    @staticmethod
+    def static_folders(app):
+        """Return ``{endpoint: folder}`` for every static file endpoint."""
+        folders = {}
+        if app.static_folder:
+            folders['static'] = app.static_folder
+        for name, blueprint in app.blueprints.items():
+            if blueprint.static_folder:
+                folders[name + '.static'] = blueprint.static_folder
+        return folders
+
+    @staticmethod
+    def precompressed_path(app, endpoint, filename):
+        return os.path.join(app.config['APP_PRECOMPRESSED_DIR'], endpoint,
+                            filename + '.gz')
+
+    def compress_static(self, app, progress=None):
+        """Write a gzip copy of every compressible static file.
+
+        Copies that are up to date, or files that gzip does not make
+        smaller, are skipped. Returns the number of files written.
+        """
+        written = 0
+        for endpoint, folder in sorted(self.static_folders(app).items()):
+            for root, dirs, files in os.walk(folder):
+                for name in sorted(files):
+                    if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                        continue
+                    source = os.path.join(root, name)
+                    filename = os.path.relpath(source, folder)
+                    target = self.precompressed_path(app, endpoint, filename)
+                    mtime = os.path.getmtime(source)
+                    if os.path.exists(target) and \
+                            os.path.getmtime(target) >= mtime:
+                        continue
+                    with open(source, 'rb') as f:
+                        data = f.read()
+                    compressed = _gzip(data, 9, mtime=int(mtime))
+                    if len(compressed) >= len(data):
+                        continue
+                    if not os.path.isdir(os.path.dirname(target)):
+                        os.makedirs(os.path.dirname(target))
+                    with open(target, 'wb') as f:
+                        f.write(compressed)
+                    written += 1
+                    if progress is not None:
+                        progress(endpoint, filename, len(data),
+                                 len(compressed))
+        return written
+
+    def _static_folders(self):
+        # computed on the first request, once every blueprint is registered
+        folders = current_app.extensions.get('compress_static_folders')
+        if folders is None:
+            folders = current_app.extensions['compress_static_folders'] = \
+                self.static_folders(current_app)
+        return folders
+
+    def after_request(self, response):
+        if response.status_code != 200 or \
+                'Content-Encoding' in response.headers:
+            return response
+        encoding = request.accept_encodings.best_match(['gzip', 'deflate'])
+        folders = self._static_folders()
+        if request.endpoint in folders:
+            target = self._precompressed_target(folders[request.endpoint])
+            if target is None:
+                return response
+            response.vary.add('Accept-Encoding')
+            if encoding != 'gzip':
+                return response
+            return self._precompressed(response, target)
+        if not self._compressible(response):
+            return response
+        response.vary.add('Accept-Encoding')
+        if encoding is None:
+            return response
+        return self._compress(response, encoding)
+
+    def _precompressed_target(self, folder):
+        # the up to date gzip copy of the requested static file, if any
+        filename = (request.view_args or {}).get('filename')
+        if not filename:
+            return None
+        source = os.path.join(folder, filename)
+        target = self.precompressed_path(current_app, request.endpoint,
+                                         filename)
+        try:
+            if os.path.getmtime(target) < os.path.getmtime(source):
+                return None
+        except OSError:
+            return None
+        return target
+
+    def _precompressed(self, response, target):
+        compressed = send_file(target, mimetype=response.mimetype)
+        for header in ('Cache-Control', 'Expires'):
+            if header in response.headers:
+                compressed.headers[header] = response.headers[header]
+        response.close()
+        compressed.headers['Content-Encoding'] = 'gzip'
+        compressed.vary.update(response.vary)
+        return compressed.make_conditional(request)
+
+    @staticmethod
+    def _compressible(response):
+        config = current_app.config
+        return not response.direct_passthrough and \
+            not response.is_streamed and \
+            response.mimetype in config['APP_COMPRESS_MIMETYPES'] and \
+            len(response.get_data()) >= config['APP_COMPRESS_MIN_SIZE']
+
+    def _compress(self, response, encoding):
+        data = response.get_data()
+        level = current_app.config['APP_COMPRESS_LEVEL']
+        if encoding == 'gzip':
+            data = _gzip(data, level)
+        else:
+            data = zlib.compress(data, level)
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        # the compressed body is a different representation of the same
+        # resource, so a strong validator no longer applies
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def _gzip(data, level, mtime=0):
+    buf = io.BytesIO()
+    with gzip.GzipFile(filename='', mode='wb', fileobj=buf,
+                       compresslevel=level, mtime=mtime) as f:
+        f.write(data)
+    return buf.getvalue()
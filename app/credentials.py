@@ -0,0 +1,107 @@
+import hashlib
+import hmac
+import threading
+import time
+
+from flask import current_app
+from werkzeug.security import check_password_hash
+
+from . import db
+from .cache import LRUCache
+from .models import Principal, Role, User
+
+
+class CredentialCache(object):
+    """Short lived cache of verified email and password pairs.
+
+    Entries are keyed by an HMAC of the credentials and of the password
+    hash stored for the user under the application secret, so neither the
+    password nor an offline-crackable hash of it is held in memory. A hit
+    skips the password hash check, which is what makes HTTP Basic requests
+    expensive. The user row is still read on every request, so a password
+    or email change made by any process stops matching entries at once.
+    """
+
+    def __init__(self, secret, maxsize=10000, timeout=300):
+        if not isinstance(secret, bytes):
+            secret = secret.encode('utf-8')
+        self.secret = secret
+        self.cache = LRUCache(maxsize, default_timeout=timeout)
+        self.hits = 0
+        self.misses = 0
+        self.hash_count = 0
+        self.hash_time = 0.0
+        self._lock = threading.Lock()
+
+    def key(self, email, password, password_hash):
+        data = u'{}\0{}\0{}'.format(email, password,
+                                    password_hash).encode('utf-8')
+        return hmac.new(self.secret, data, hashlib.sha256).hexdigest()
+
+    def get(self, email, password, password_hash):
+        """Tell whether the credentials were verified against the hash."""
+        hit = self.cache.get(self.key(email, password, password_hash)) \
+            is not None
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return hit
+
+    def set(self, email, password, password_hash):
+        self.cache.set(self.key(email, password, password_hash), True)
+
+    def verify(self, password_hash, password):
+        """Check ``password`` against ``password_hash``, timed."""
+        start = time.time()
+        try:
+            return password_hash is not None and \
+                check_password_hash(password_hash, password)
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                self.hash_count += 1
+                self.hash_time += elapsed
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.cache),
+            'hash_count': self.hash_count,
+            'hash_time': self.hash_time,
+            'hash_time_avg': (self.hash_time / self.hash_count
+                              if self.hash_count else 0.0),
+        }
+
+
+def credential_cache():
+    """Return the credential cache of the current application."""
+    if 'credential_cache' not in current_app.extensions:
+        current_app.extensions['credential_cache'] = CredentialCache(
+            current_app.config['SECRET_KEY'],
+            current_app.config['APP_CREDENTIAL_CACHE_SIZE'],
+            current_app.config['APP_CREDENTIAL_CACHE_TTL'],
+        )
+    return current_app.extensions['credential_cache']
+
+
+def authenticate(email, password):
+    """Return the ``Principal`` of the user with these credentials.
+
+    Reads the user and role permissions with one query and only checks
+    the password hash when the credentials are not cached for it.
+    """
+    row = db.session.query(
+        User.id, User.password_hash, User.confirmed, Role.permissions
+    ).outerjoin(Role, Role.id == User.role_id)\
+        .filter(User.email == email).first()
+    if row is None:
+        return None
+    credentials = credential_cache()
+    if not credentials.get(email, password, row.password_hash):
+        if not credentials.verify(row.password_hash, password):
+            return None
+        credentials.set(email, password, row.password_hash)
+    return Principal(row.id, row.permissions or 0, bool(row.confirmed))
@@ -1,21 +1,13 @@
 from flask import current_app, render_template
-from flask_mail import Message
-from threading import Thread
 
-from app import mail
-
-
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+from app import outbox
 
 
 def send_email(to, subject, template, **kwargs):
     app = current_app._get_current_object()
-    msg = Message(app.config['APP_MAIL_SUBJECT_PREFIX'] + ' ' + subject,
-                  sender=app.config['APP_MAIL_SENDER'], recipients=[to])
-    msg.body = render_template(template + '.txt', **kwargs)
-    msg.html = render_template(template + '.html', **kwargs)
-    thr = Thread(target=send_async_email, args=[app, msg])
-    thr.start()
-    return thr
+    return outbox.enqueue(
+        to=to,
+        subject=app.config['APP_MAIL_SUBJECT_PREFIX'] + ' ' + subject,
+        body=render_template(template + '.txt', **kwargs),
+        html=render_template(template + '.html', **kwargs),
+    )
@@ -0,0 +1,99 @@
+import json
+from datetime import datetime
+
+from . import db
+from .exceptions import ValidationError
+from .models import Comment, Post, User
+
+
+_DATETIME_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
+
+
+def _columns(kind):
+    posts = Post.__table__
+    comments = Comment.__table__
+    users = User.__table__
+    if kind == 'posts':
+        return posts, posts.c.timestamp, posts.c.author_id, [
+            posts.c.id, posts.c.author_id, posts.c.timestamp, posts.c.body,
+            posts.c.body_html, posts.c.comment_count]
+    if kind == 'comments':
+        return comments, comments.c.timestamp, comments.c.author_id, [
+            comments.c.id, comments.c.post_id, comments.c.author_id,
+            comments.c.timestamp, comments.c.body, comments.c.body_html,
+            comments.c.disabled]
+    if kind == 'users':
+        return users, users.c.member_since, None, [
+            users.c.id, users.c.username, users.c.name, users.c.location,
+            users.c.about_me, users.c.member_since, users.c.last_seen,
+            users.c.post_count, users.c.follower_count, users.c.followed_count]
+    raise ValidationError('unknown export {}'.format(kind))
+
+
+def parse_since(value):
+    if not value:
+        return None
+    for format in _DATETIME_FORMATS:
+        try:
+            return datetime.strptime(value, format)
+        except ValueError:
+            pass
+    raise ValidationError('invalid since')
+
+
+def export_query(kind, since=None, author=None):
+    """Return the select statement for an export of ``kind``.
+
+    ``since`` keeps rows created at or after a datetime, ``author`` the
+    posts or comments of one user id.
+    """
+    table, timestamp, author_id, columns = _columns(kind)
+    query = db.select(columns).order_by(table.c.id)
+    if since is not None:
+        query = query.where(timestamp >= since)
+    if author is not None:
+        if author_id is None:
+            raise ValidationError('{} cannot be filtered by author'
+                                  .format(kind))
+        query = query.where(author_id == author)
+    return query
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def export_rows(query, batch_size=1000):
+    """Yield the rows of an export query as dicts.
+
+    Rows are read through a server-side cursor where the driver supports
+    one (``stream_results``), ``batch_size`` at a time, so memory use does
+    not grow with the size of the table.
+    """
+    connection = db.engine.connect()
+    try:
+        result = connection.execution_options(stream_results=True)\
+            .execute(query)
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row.items())
+    finally:
+        connection.close()
+
+
+def export_ndjson(query, batch_size=1000):
+    """Yield an export query as newline-delimited JSON, a batch per chunk."""
+    lines = []
+    for row in export_rows(query, batch_size):
+        lines.append(json.dumps(row, default=_default, sort_keys=True,
+                                separators=(',', ':')))
+        if len(lines) >= batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
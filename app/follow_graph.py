@@ -0,0 +1,98 @@
+from array import array
+from bisect import bisect_left
+
+from flask import current_app
+
+from .cache import LRUCache
+
+
+class FollowGraph(object):
+    """Per-process cache of the ids each user follows.
+
+    Followee ids are kept as sorted ``array('q')`` instances, 8 bytes per
+    follow, and searched with ``bisect``. Each entry is tagged with the
+    ``users.followed_version`` it was read with; the follow listeners
+    change that version on every follow and unfollow, so entries cached
+    by other processes stop matching as soon as they see the new user row.
+    Reads never flush the session; ``User.follow`` and ``User.unfollow``
+    flush their changes themselves.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('APP_FOLLOW_GRAPH_SIZE', 10000)
+        app.extensions['follow_graph'] = LRUCache(
+            app.config['APP_FOLLOW_GRAPH_SIZE'])
+
+    def _cache(self):
+        return current_app.extensions['follow_graph']
+
+    def followed_ids(self, user):
+        """Return the sorted ids followed by ``user``."""
+        from . import db
+        from .models import Follow, User
+
+        if user.id is None:
+            return array('q')
+        entry = self._cached(user)
+        if entry is not None:
+            return entry
+        users = User.__table__
+        follows = Follow.__table__
+        rows = db.session.execute(
+            db.select([users.c.followed_version, follows.c.followed_id])
+            .select_from(users.outerjoin(
+                follows, follows.c.follower_id == users.c.id))
+            .where(users.c.id == user.id)
+            .order_by(follows.c.followed_id)
+        ).fetchall()
+        if not rows:
+            return array('q')
+        ids = array('q', (row[1] for row in rows if row[1] is not None))
+        self._cache().set(user.id, (rows[0][0], ids))
+        return ids
+
+    def _cached(self, user):
+        entry = self._cache().get(user.id)
+        if entry is not None and entry[0] == user.followed_version:
+            return entry[1]
+        return None
+
+    @staticmethod
+    def _contains(ids, id):
+        i = bisect_left(ids, id)
+        return i < len(ids) and ids[i] == id
+
+    def is_following(self, user, followed_id):
+        return self._contains(self.followed_ids(user), followed_id)
+
+    def is_followed_by(self, user, follower):
+        """Tell whether ``follower`` follows ``user``.
+
+        Answered from the followees of ``follower`` when they are cached,
+        otherwise with a single row lookup rather than loading them all.
+        """
+        from . import db
+        from .models import Follow
+
+        ids = self._cached(follower)
+        if ids is not None:
+            return self._contains(ids, user.id)
+        follows = Follow.__table__
+        return db.session.execute(
+            db.select([follows.c.follower_id]).where(db.and_(
+                follows.c.follower_id == follower.id,
+                follows.c.followed_id == user.id,
+            ))
+        ).first() is not None
+
+    def following_among(self, user, ids):
+        """Return the subset of ``ids`` that ``user`` follows."""
+        followed = self.followed_ids(user)
+        return set(id for id in ids if self._contains(followed, id))
+
+    def invalidate(self, user_id):
+        self._cache().delete(user_id)
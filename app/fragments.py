@@ -0,0 +1,61 @@
+import hashlib
+
+from flask import Markup, current_app, has_app_context, request
+
+from .cache import create_cache
+
+
+class FragmentCache(object):
+    """Cache of rendered template fragments keyed by object and version.
+
+    Templates wrap the viewer-independent part of a list item in the
+    ``cached`` macro, passing the values the markup depends on. The
+    fragment is only re-rendered when those values change or when the
+    object is invalidated explicitly.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('APP_FRAGMENT_CACHE', 'lru')
+        app.config.setdefault('APP_FRAGMENT_CACHE_SIZE', 10000)
+        app.config.setdefault('APP_FRAGMENT_CACHE_OPTIONS', {})
+        app.config.setdefault('APP_FRAGMENT_CACHE_TIMEOUT', 24 * 60 * 60)
+        app.extensions['fragment_cache'] = create_cache(
+            app.config['APP_FRAGMENT_CACHE'],
+            maxsize=app.config['APP_FRAGMENT_CACHE_SIZE'],
+            options=app.config['APP_FRAGMENT_CACHE_OPTIONS'],
+        )
+        app.jinja_env.globals['fragment_cache'] = self
+
+    @property
+    def backend(self):
+        return current_app.extensions['fragment_cache']
+
+    @staticmethod
+    def key(kind, id):
+        return 'fragment:{}:{}'.format(kind, id)
+
+    @staticmethod
+    def version(parts):
+        # gravatar URLs depend on the scheme of the request
+        parts = list(parts) + [request.is_secure]
+        data = u'\0'.join(u'{}'.format(part) for part in parts)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def render(self, kind, id, parts, caller):
+        key = self.key(kind, id)
+        version = self.version(parts)
+        entry = self.backend.get(key)
+        if entry is not None and entry[0] == version:
+            return Markup(entry[1])
+        html = caller()
+        self.backend.set(key, (version, u'{}'.format(html)),
+                         current_app.config['APP_FRAGMENT_CACHE_TIMEOUT'])
+        return html
+
+    def invalidate(self, kind, id):
+        if id is not None and has_app_context():
+            self.backend.delete(self.key(kind, id))
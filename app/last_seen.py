@@ -0,0 +1,138 @@
+import atexit
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+
+class _State(object):
+    def __init__(self):
+        self.pending = {}
+        self.flushed_at = time.time()
+        self.lock = threading.Lock()
+        # held while a flush writes, so flush() returns after the writes
+        # of a concurrent flush are committed
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+
+class LastSeenTracker(object):
+    """Buffers ``last_seen`` updates and writes them in bulk.
+
+    A user is recorded at most once per ``APP_LAST_SEEN_GRANULARITY``
+    seconds. Recorded users are written with a single ``UPDATE`` by a
+    background thread of each process every ``APP_LAST_SEEN_FLUSH_INTERVAL``
+    seconds, or as soon as ``APP_LAST_SEEN_FLUSH_SIZE`` are pending, and at
+    process exit. The thread is started by the first request that records
+    a user and stops once nothing is pending. Writing outside of the
+    request keeps the update off the connection and locks of the request
+    session, which commits in its own teardown.
+    """
+
+    def __init__(self, app=None):
+        # flushed at exit by a single hook, however many applications the
+        # process creates
+        self._apps = weakref.WeakSet()
+        atexit.register(self._flush_at_exit)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('APP_LAST_SEEN_GRANULARITY', 60)
+        app.config.setdefault('APP_LAST_SEEN_FLUSH_INTERVAL', 10)
+        app.config.setdefault('APP_LAST_SEEN_FLUSH_SIZE', 500)
+        app.extensions['last_seen'] = _State()
+        app.teardown_request(self._teardown)
+        self._apps.add(app)
+
+    def _state(self, app=None):
+        return (app or current_app).extensions['last_seen']
+
+    def ping(self, user):
+        """Record that ``user`` was seen now, unless seen recently."""
+        now = datetime.utcnow()
+        granularity = timedelta(
+            seconds=current_app.config['APP_LAST_SEEN_GRANULARITY'])
+        state = self._state()
+        with state.lock:
+            last_seen = state.pending.get(user.id) or user.last_seen
+            if last_seen is not None and now - last_seen < granularity:
+                return False
+            state.pending[user.id] = now
+        return True
+
+    def flush(self):
+        """Write all buffered timestamps and return how many were written."""
+        from . import db
+        from .models import User
+
+        state = self._state()
+        with state.flush_lock:
+            with state.lock:
+                pending, state.pending = state.pending, {}
+                state.flushed_at = time.time()
+            if not pending:
+                return 0
+            users = User.__table__
+            ids = list(pending)
+            size = current_app.config['APP_LAST_SEEN_FLUSH_SIZE']
+            try:
+                with db.engine.begin() as connection:
+                    for i in range(0, len(ids), size):
+                        chunk = dict((id, pending[id])
+                                     for id in ids[i:i + size])
+                        connection.execute(
+                            users.update().where(users.c.id.in_(list(chunk)))
+                            .values(last_seen=db.case(chunk,
+                                                      value=users.c.id))
+                        )
+            except Exception:
+                # put the timestamps back for the next flush, unless newer
+                # ones were recorded meanwhile
+                with state.lock:
+                    for id, seen in pending.items():
+                        if state.pending.get(id, seen) <= seen:
+                            state.pending[id] = seen
+                raise
+        return len(pending)
+
+    def _teardown(self, exc):
+        state = self._state()
+        with state.lock:
+            if not state.pending:
+                return
+            if state.thread is None or not state.thread.is_alive():
+                # not inherited by forked workers, which start their own
+                state.thread = threading.Thread(
+                    target=self._run,
+                    args=(current_app._get_current_object(), state))
+                state.thread.daemon = True
+                state.thread.start()
+            if len(state.pending) >= \
+                    current_app.config['APP_LAST_SEEN_FLUSH_SIZE']:
+                state.wake.set()
+
+    def _run(self, app, state):
+        while True:
+            state.wake.wait(max(state.flushed_at - time.time() +
+                                app.config['APP_LAST_SEEN_FLUSH_INTERVAL'],
+                                0))
+            state.wake.clear()
+            try:
+                with app.app_context():
+                    self.flush()
+            except Exception:
+                app.logger.exception('Could not write last_seen updates')
+            with state.lock:
+                if not state.pending:
+                    state.thread = None
+                    return
+
+    def _flush_at_exit(self):
+        for app in list(self._apps):
+            if self._state(app).pending:
+                with app.app_context():
+                    self.flush()
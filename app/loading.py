@@ -0,0 +1,38 @@
+from flask import g
+from sqlalchemy.orm.attributes import set_committed_value
+
+from . import db
+from .models import User
+
+
+def _request_users():
+    # Users hydrated during the current request, by id. Holding them here
+    # also keeps them alive in the session's weak-referencing identity map.
+    if not hasattr(g, 'loaded_users'):
+        g.loaded_users = {}
+    return g.loaded_users
+
+
+def load_users(ids):
+    """Return a ``{id: user}`` dict, fetching unseen users in one query."""
+    users = _request_users()
+    missing = set(id for id in ids if id is not None and (
+        id not in users or db.inspect(users[id]).expired_attributes))
+    if missing:
+        for user in User.query.options(db.joinedload(User.role))\
+                .filter(User.id.in_(missing)):
+            users[user.id] = user
+    return users
+
+
+def load_authors(items):
+    """Attach the author of every post or comment in ``items``.
+
+    Authors and their roles are loaded with a single query per call, so
+    rendering a page does not lazy load them one row at a time.
+    """
+    users = load_users(item.author_id for item in items)
+    for item in items:
+        if item.author_id in users:
+            set_committed_value(item, 'author', users[item.author_id])
+    return items
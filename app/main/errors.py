@@ -1,7 +1,18 @@
 from flask import jsonify, request, render_template
+from ..exceptions import ValidationError
 from . import main
 
 
+@main.errorhandler(ValidationError)
+def bad_request(e):
+    if request.accept_mimetypes.accept_json and \
+            not request.accept_mimetypes.accept_html:
+        response = jsonify({'error': 'bad request', 'message': e.args[0]})
+        response.status_code = 400
+        return response
+    return render_template('400.html'), 400
+
+
 @main.app_errorhandler(403)
 def forbidden(e):
     if request.accept_mimetypes.acccept_json and \
@@ -1,25 +1,15 @@
 from flask import (abort, current_app, flash, make_response, redirect, request,
                    render_template, url_for)
 from flask_login import current_user, login_required
-from flask_sqlalchemy import get_debug_queries
 
 from ..models import Comment, Permission, Post, Role, User
 from .forms import CommentForm, EditProfileAdminForm, EditProfileForm, PostForm
 from . import main
 from .. import db
 from ..decorators import admin_required, permission_required
-
-
-@main.after_app_request
-def after_request(response):
-    for query in get_debug_queries():
-        if query.duration >= current_app.config['APP_SLOW_DB_QUERY_TIME']:
-            current_app.logger.warning(
-                'Slow query: {}\nParameters: {}\nDuration: {}\n'
-                'Context: {}\n'.format(query.statement, query.parameters,
-                                       query.duration, query.context)
-            )
-    return response
+from ..loading import load_authors
+from ..pagination import paginate
+from ..search import search as search_index
 
 
 @main.route('/shutdown')
@@ -44,21 +34,20 @@ def index():
         )
         db.session.add(post)
         return redirect(url_for('main.index'))
-    page = request.args.get('page', 1, type=int)
     show_followed = False
     if current_user.is_authenticated:
         show_followed = bool(request.cookies.get('show_followed', ''))
     if show_followed:
-        query = current_user.followed_posts
+        query, (timestamp, post_id) = current_user.timeline()
     else:
-        query = Post.query
+        query, (timestamp, post_id) = Post.query, (Post.timestamp, Post.id)
 
-    pagination = query.order_by(Post.timestamp.desc()).paginate(
-        page,
+    pagination = paginate(
+        query,
+        (timestamp, post_id),
         per_page=current_app.config['APP_POSTS_PER_PAGE'],
-        error_out=False,
     )
-    posts = pagination.items
+    posts = load_authors(pagination.items)
     return render_template(
         'index.html',
         form=form,
@@ -71,13 +60,12 @@ def index():
 @main.route('/user/<username>')
 def user(username):
     user = User.query.filter_by(username=username).first_or_404()
-    page = request.args.get('page', 1, type=int)
-    pagination = user.posts.order_by(Post.timestamp.desc()).paginate(
-        page,
+    pagination = paginate(
+        user.posts,
+        (Post.timestamp, Post.id),
         per_page=current_app.config['APP_POSTS_PER_PAGE'],
-        error_out=False
     )
-    posts = pagination.items
+    posts = load_authors(pagination.items)
     return render_template(
         'user.html',
         user=user,
@@ -86,6 +74,24 @@ def user(username):
     )
 
 
+@main.route('/search')
+def search():
+    q = request.args.get('q', '')
+    kind = request.args.get('kind', 'posts')
+    if kind not in ('posts', 'comments'):
+        abort(404)
+    pagination = search_index(kind, q, request.args.get('cursor'))
+    results = load_authors(pagination.items)
+    return render_template(
+        'search.html',
+        q=q,
+        kind=kind,
+        posts=results if kind == 'posts' else [],
+        comments=results if kind == 'comments' else [],
+        pagination=pagination,
+    )
+
+
 @main.route('/edit-profile', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
@@ -143,16 +149,19 @@ def post(id):
         db.session.add(comment)
         flash('Your comment has been published.')
         return redirect(url_for('main.post', id=post.id, page=-1))
+    per_page = current_app.config['APP_COMMENTS_PER_PAGE']
+    keys = (Comment.timestamp, Comment.id)
     page = request.args.get('page', 1, type=int)
     if page == -1:
-        page = (post.comments.count() - 1) // \
-               current_app.config['APP_COMMENTS_PER_PAGE'] + 1
-    pagination = post.comments.order_by(Comment.timestamp.asc()).paginate(
-        page,
-        per_page=current_app.config['APP_COMMENTS_PER_PAGE'],
-        error_out=False
-    )
+        page = (post.comment_count - 1) // per_page + 1
+        pagination = post.comments.order_by(
+            Comment.timestamp.asc(), Comment.id.asc()
+        ).paginate(page, per_page=per_page, error_out=False)
+    else:
+        pagination = paginate(post.comments, keys, per_page=per_page,
+                              ascending=True)
     comments = pagination.items
+    load_authors([post] + comments)
     return render_template(
         'post.html',
         posts=[post],
@@ -211,6 +220,13 @@ def unfollow(username):
     return redirect(url_for('main.user', username=username))
 
 
+def followed_among(follows):
+    # Ids of the listed users the current user follows, for the buttons.
+    if not current_user.can(Permission.FOLLOW):
+        return set()
+    return current_user.following_among(follow['user'] for follow in follows)
+
+
 @main.route('/followers/<username>')
 def followers(username):
     user = User.query.filter_by(username=username).first()
@@ -232,6 +248,7 @@ def followers(username):
         endpoint='main.followers',
         pagination=pagination,
         follows=follows,
+        following=followed_among(follows),
     )
 
 
@@ -256,6 +273,7 @@ def followed_by(username):
         endpoint='main.followed_by',
         pagination=pagination,
         follows=follows,
+        following=followed_among(follows),
     )
 
 
@@ -279,18 +297,18 @@ def show_followed():
 @login_required
 @permission_required(Permission.MODERATE_COMMENTS)
 def moderate():
-    page = request.args.get('page', 1, type=int)
-    pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(
-        page,
+    pagination = paginate(
+        Comment.query,
+        (Comment.timestamp, Comment.id),
         per_page=current_app.config['APP_COMMENTS_PER_PAGE'],
-        error_out=False,
     )
-    comments = pagination.items
+    comments = load_authors(pagination.items)
     return render_template(
         'moderate.html',
         comments=comments,
         pagination=pagination,
-        page=page,
+        page=request.args.get('page', type=int),
+        cursor=request.args.get('cursor'),
     )
 
 
@@ -303,7 +321,8 @@ def moderate_enable(id):
     db.session.add(comment)
     return redirect(url_for(
         'main.moderate',
-        page=request.args.get('page', 1, type=int)
+        page=request.args.get('page', type=int),
+        cursor=request.args.get('cursor'),
     ))
 
 
@@ -316,5 +335,6 @@ def moderate_disable(id):
     db.session.add(comment)
     return redirect(url_for(
         'main.moderate',
-        page=request.args.get('page', 1, type=int)
+        page=request.args.get('page', type=int),
+        cursor=request.args.get('cursor'),
     ))
@@ -0,0 +1,371 @@
+import atexit
+import bisect
+import errno
+import fcntl
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+import weakref
+
+from flask import abort, current_app, g, has_app_context, request
+from flask_sqlalchemy import get_debug_queries
+from jinja2 import Template
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+
+# name: (type, help, buckets config key)
+METRICS = {
+    'app_request_duration_seconds': (
+        'histogram', 'Request latency by endpoint.', 'APP_METRICS_BUCKETS'),
+    'app_request_queries': (
+        'histogram', 'Database queries per request by endpoint.',
+        'APP_METRICS_QUERY_COUNT_BUCKETS'),
+    'app_request_query_duration_seconds': (
+        'histogram', 'Database time per request by endpoint.',
+        'APP_METRICS_BUCKETS'),
+    'app_template_render_seconds': (
+        'histogram', 'Template render time by template.',
+        'APP_METRICS_BUCKETS'),
+    'app_requests_total': (
+        'counter', 'Requests by endpoint, method and status.', None),
+    'app_requests_in_flight': (
+        'gauge', 'Requests being handled.', None),
+}
+
+
+class _State(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # Called again in forked workers, so they neither report nor
+        # overwrite what their parent process recorded.
+        self.pid = os.getpid()
+        self.token = '{}-{}'.format(self.pid, uuid.uuid4().hex[:8])
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.flushed_at = time.time()
+
+    def check_pid(self):
+        if self.pid != os.getpid():
+            self.reset()
+
+
+class TimedTemplate(Template):
+    """Jinja template that records how long each render takes."""
+
+    def render(self, *args, **kwargs):
+        start = time.time()
+        try:
+            return super(TimedTemplate, self).render(*args, **kwargs)
+        finally:
+            if has_app_context() and 'metrics' in current_app.extensions:
+                current_app.extensions['metrics'].observe(
+                    'app_template_render_seconds',
+                    (('template', self.name or ''),), time.time() - start)
+
+
+class Metrics(object):
+    """Per-endpoint request metrics in Prometheus text format.
+
+    Each process keeps its own histograms and counters. With
+    ``APP_METRICS_DIR`` set, processes write snapshots of them to that
+    directory from the request teardown every
+    ``APP_METRICS_FLUSH_INTERVAL`` seconds and at exit, and ``/metrics``
+    adds up the snapshots of all gunicorn workers. The histograms and
+    counters of exited workers are folded into ``metrics-archive.json``
+    when ``/metrics`` is collected, so the totals never go down, and their
+    gauges are dropped. Empty the directory when the application is
+    redeployed.
+
+    ``/metrics`` is off unless ``APP_METRICS_TOKEN`` is set; clients then
+    send it as a bearer token. ``APP_METRICS_ALLOWED_IPS``, when set,
+    further limits the client addresses, which are those of the reverse
+    proxy if there is one.
+    """
+
+    def __init__(self, app=None):
+        self._apps = weakref.WeakSet()
+        atexit.register(self._flush_at_exit)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('APP_METRICS_DIR', None)
+        app.config.setdefault('APP_METRICS_FLUSH_INTERVAL', 5)
+        app.config.setdefault('APP_METRICS_TOKEN', None)
+        app.config.setdefault('APP_METRICS_ALLOWED_IPS', None)
+        app.config.setdefault('APP_METRICS_BUCKETS', LATENCY_BUCKETS)
+        app.config.setdefault('APP_METRICS_QUERY_COUNT_BUCKETS',
+                              QUERY_COUNT_BUCKETS)
+        app.extensions['metrics'] = self
+        app.extensions['metrics_state'] = _State()
+        app.jinja_env.template_class = TimedTemplate
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+        self._apps.add(app)
+
+    def _state(self, app=None):
+        state = (app or current_app).extensions['metrics_state']
+        state.check_pid()
+        return state
+
+    def observe(self, name, labels, value):
+        buckets = current_app.config[METRICS[name][2]]
+        state = self._state()
+        with state.lock:
+            histogram = state.histograms.get((name, labels))
+            if histogram is None:
+                histogram = state.histograms[(name, labels)] = \
+                    [list(buckets), [0] * (len(buckets) + 1), 0.0]
+            histogram[1][bisect.bisect_left(histogram[0], value)] += 1
+            histogram[2] += value
+
+    def inc(self, name, labels, value=1):
+        state = self._state()
+        with state.lock:
+            table = state.gauges if METRICS[name][0] == 'gauge' \
+                else state.counters
+            table[(name, labels)] = table.get((name, labels), 0) + value
+
+    def _before_request(self):
+        g.metrics_start = time.time()
+        g.metrics_queries = len(get_debug_queries())
+        self.inc('app_requests_in_flight', ())
+
+    def _after_request(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _teardown(self, exc):
+        if 'metrics_start' not in g:
+            return
+        self.inc('app_requests_in_flight', (), -1)
+        endpoint = (('endpoint', request.endpoint or ''),)
+        status = g.get('metrics_status', 500)
+        self.inc('app_requests_total', endpoint + (
+            ('method', request.method), ('status', str(status))))
+        self.observe('app_request_duration_seconds', endpoint,
+                     time.time() - g.metrics_start)
+        if current_app.config.get('SQLALCHEMY_RECORD_QUERIES'):
+            queries = get_debug_queries()[g.metrics_queries:]
+            self.observe('app_request_queries', endpoint, len(queries))
+            self.observe('app_request_query_duration_seconds', endpoint,
+                         sum(query.duration for query in queries))
+        state = self._state()
+        interval = current_app.config['APP_METRICS_FLUSH_INTERVAL']
+        if current_app.config['APP_METRICS_DIR'] and \
+                time.time() - state.flushed_at >= interval:
+            self.flush()
+
+    def snapshot(self, app=None):
+        """Return the metrics of this process as JSON serializable data."""
+        state = self._state(app)
+        with state.lock:
+            return {
+                'pid': state.pid,
+                'histograms': [[name, labels, h[0], list(h[1]), h[2]]
+                               for (name, labels), h
+                               in state.histograms.items()],
+                'counters': [[name, labels, value] for (name, labels), value
+                             in state.counters.items()],
+                'gauges': [[name, labels, value] for (name, labels), value
+                           in state.gauges.items()],
+            }
+
+    def _path(self, app, state):
+        return os.path.join(app.config['APP_METRICS_DIR'],
+                            'metrics-{}.json'.format(state.token))
+
+    def flush(self, app=None):
+        """Write the snapshot of this process to ``APP_METRICS_DIR``."""
+        app = app or current_app._get_current_object()
+        directory = app.config['APP_METRICS_DIR']
+        if not directory:
+            return
+        state = self._state(app)
+        data = self.snapshot(app)
+        state.flushed_at = time.time()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        _write(self._path(app, state), data)
+
+    def _flush_at_exit(self):
+        for app in list(self._apps):
+            self.flush(app)
+
+    def clear(self):
+        """Remove the snapshots of all processes from ``APP_METRICS_DIR``."""
+        directory = current_app.config['APP_METRICS_DIR']
+        if not directory:
+            return
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            os.remove(path)
+
+    def collect(self):
+        """Add up the snapshots of every process, this one included."""
+        app = current_app._get_current_object()
+        histograms = {}
+        values = {}
+        _add(histograms, values, self.snapshot())
+        directory = app.config['APP_METRICS_DIR']
+        if not directory or not os.path.isdir(directory):
+            return histograms, values
+        own = self._path(app, self._state())
+        archive_path = os.path.join(directory, 'metrics-archive.json')
+        # held while reading too, so a snapshot being archived by another
+        # process is counted exactly once
+        with open(os.path.join(directory, 'metrics-archive.lock'), 'a') \
+                as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive = _load(archive_path) or \
+                {'histograms': [], 'counters': [], 'gauges': []}
+            old_histograms, old_values = {}, {}
+            _add(old_histograms, old_values, archive)
+            exited = []
+            for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+                if path in (own, archive_path):
+                    continue
+                snapshot = _load(path)
+                if snapshot is None:
+                    continue
+                if _alive(snapshot['pid']):
+                    _add(histograms, values, snapshot)
+                else:
+                    _add(old_histograms, old_values, snapshot, gauges=False)
+                    exited.append(path)
+            archive = {
+                'histograms': [[name, labels] + h
+                               for (name, labels), h
+                               in old_histograms.items()],
+                'counters': [[name, labels, value]
+                             for (name, labels), value in old_values.items()],
+                'gauges': [],
+            }
+            if exited:
+                _write(archive_path, archive)
+                for path in exited:
+                    _remove(path)
+        _add(histograms, values, archive)
+        return histograms, values
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        histograms, values = self.collect()
+        lines = []
+        for name in sorted(METRICS):
+            kind, help, _ = METRICS[name]
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            if kind != 'histogram':
+                for key in sorted(k for k in values if k[0] == name):
+                    lines.append('{}{} {}'.format(
+                        name, _labels(key[1]), _number(values[key])))
+                continue
+            for key in sorted(k for k in histograms if k[0] == name):
+                buckets, counts, total = histograms[key]
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], counts):
+                    cumulative += count
+                    lines.append('{}_bucket{} {}'.format(
+                        name, _labels(key[1] + (('le', _number(bound)),)),
+                        cumulative))
+                lines.append('{}_sum{} {}'.format(
+                    name, _labels(key[1]), _number(total)))
+                lines.append('{}_count{} {}'.format(
+                    name, _labels(key[1]), cumulative))
+        return '\n'.join(lines) + '\n'
+
+    def view(self):
+        check_internal()
+        return current_app.response_class(
+            self.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def check_internal():
+    """Abort with a 404 unless the client sent ``APP_METRICS_TOKEN``.
+
+    Also aborts when ``APP_METRICS_ALLOWED_IPS`` is set and the client
+    address is not in it.
+    """
+    token = current_app.config['APP_METRICS_TOKEN']
+    allowed = current_app.config['APP_METRICS_ALLOWED_IPS']
+    sent = request.headers.get('Authorization', '')
+    if not token or not hmac.compare_digest(
+            sent.encode('utf-8'), 'Bearer {}'.format(token).encode('utf-8')):
+        abort(404)
+    if allowed is not None and request.remote_addr not in allowed:
+        abort(404)
+
+
+def _add(histograms, values, snapshot, gauges=True):
+    for name, labels, buckets, counts, total in snapshot['histograms']:
+        key = (name, tuple(tuple(label) for label in labels))
+        histogram = histograms.get(key)
+        if histogram is None:
+            histograms[key] = [buckets, list(counts), total]
+        elif histogram[0] == buckets:
+            histogram[1] = [a + b for a, b in zip(histogram[1], counts)]
+            histogram[2] += total
+    series = snapshot['counters']
+    if gauges:
+        series = series + snapshot['gauges']
+    for name, labels, value in series:
+        key = (name, tuple(tuple(label) for label in labels))
+        values[key] = values.get(key, 0) + value
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _write(path, data):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.rename(path + '.tmp', path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(
+        key, value.replace('\\', '\\\\').replace('"', '\\"')
+        .replace('\n', '\\n')) for key, value in labels) + '}'
@@ -1,15 +1,18 @@
+from collections import defaultdict
 from datetime import datetime
 import hashlib
+import random
+import time
 
-import bleach
-from flask import current_app, request, url_for
+from flask import current_app, has_app_context, request, url_for
 from flask_login import UserMixin, AnonymousUserMixin
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from markdown import markdown
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from app.exceptions import ValidationError
-from . import db, login_manager
+from . import db, follow_graph, fragment_cache, login_manager
+from .cache import LRUCache
+from .rendering import renderer
 
 
 class Permission:
@@ -30,16 +33,81 @@ class Comment(db.Model):
     disabled = db.Column(db.Boolean)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id'))
+    updated_at = db.Column(db.DateTime, index=True, default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
+
+    @staticmethod
+    def on_inserted(mapper, connection, target):
+        from .search import index_row
+        Post.update_comment_count(connection, target.post_id, 1)
+        index_row(connection, 'comments', target.id, target.body)
+
+    @staticmethod
+    def insert_many(comments):
+        """Insert new comments with a fixed number of statements.
+
+        The rows are written with one multi-row insert instead of a flush,
+        which would run the insert listeners once per comment; their work
+        is done here with one counter update per post and one search index
+        insert. The comments get their ids but are not added to the
+        session.
+        """
+        from .search import index_rows
+        table = Comment.__table__
+        now = datetime.utcnow()
+        for comment in comments:
+            comment.timestamp = comment.timestamp or now
+            comment.updated_at = now
+        ids = insert_returning(table, [{
+            'body': comment.body,
+            'body_html': comment.body_html,
+            'timestamp': comment.timestamp,
+            'disabled': comment.disabled,
+            'author_id': comment.author_id,
+            'post_id': comment.post_id,
+            'updated_at': comment.updated_at,
+        } for comment in comments], [table.c.id])
+        counts = defaultdict(int)
+        for comment, row in zip(comments, ids):
+            comment.id = row.id
+            counts[comment.post_id] += 1
+        connection = db.session.connection()
+        for post_id, count in sorted(counts.items()):
+            Post.update_comment_count(connection, post_id, count)
+        index_rows(connection, 'comments',
+                   [(comment.id, comment.body) for comment in comments])
+
+    @staticmethod
+    def on_deleted(mapper, connection, target):
+        from .search import unindex_row
+        Post.update_comment_count(connection, target.post_id, -1)
+        unindex_row(connection, 'comments', target.id)
+
+    @staticmethod
+    def on_updated(mapper, connection, target):
+        if db.inspect(target).attrs.body.history.has_changes():
+            from .search import index_row
+            index_row(connection, 'comments', target.id, target.body,
+                      replace=True)
+
+    @staticmethod
+    def on_created_table(target, connection, **kw):
+        from .search import create_index
+        create_index(connection, 'comments')
+
+    @staticmethod
+    def on_dropping_table(target, connection, **kw):
+        from .search import drop_index
+        drop_index(connection, 'comments')
 
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
+        if value == oldvalue and target.body_html is not None:
+            return
+        fragment_cache.invalidate('comment', target.id)
         allowed_tags = ['a', 'abbr', 'acronym', 'b', 'code', 'em', 'i',
                         'strong']
-        target.body_html = bleach.linkify(bleach.clean(
-            markdown(value, output_format='html'),
-            tags=allowed_tags,
-            strip=True
-        ))
+        target.body_html = renderer.render(value, allowed_tags)
 
     def to_json(self):
         json_comment = {
@@ -61,6 +129,11 @@ class Comment(db.Model):
         return Comment(body=body)
 
 db.event.listen(Comment.body, 'set', Comment.on_changed_body)
+db.event.listen(Comment, 'after_insert', Comment.on_inserted)
+db.event.listen(Comment, 'after_delete', Comment.on_deleted)
+db.event.listen(Comment, 'after_update', Comment.on_updated)
+db.event.listen(Comment.__table__, 'after_create', Comment.on_created_table)
+db.event.listen(Comment.__table__, 'before_drop', Comment.on_dropping_table)
 
 
 class Follow(db.Model):
@@ -78,6 +151,58 @@ class Follow(db.Model):
     )
     timestamp = db.Column(db.DateTime(), default=datetime.utcnow)
 
+    @staticmethod
+    def on_inserted(mapper, connection, target):
+        Follow.update_counts(connection, target, 1)
+
+    @staticmethod
+    def on_deleted(mapper, connection, target):
+        Follow.update_counts(connection, target, -1)
+        TimelineEntry.fan_in(connection, target.followed_id)
+
+    @staticmethod
+    def update_counts(connection, follow, delta):
+        users = User.__table__
+        connection.execute(
+            users.update().where(users.c.id == follow.followed_id)
+            .values(follower_count=users.c.follower_count + delta)
+        )
+        connection.execute(
+            users.update().where(users.c.id == follow.follower_id)
+            .values(followed_count=users.c.followed_count + delta,
+                    followed_version=random.randint(1, 2 ** 31 - 1))
+        )
+        follow_graph.invalidate(follow.follower_id)
+
+db.event.listen(Follow, 'after_insert', Follow.on_inserted)
+db.event.listen(Follow, 'after_delete', Follow.on_deleted)
+
+
+class OutboxMessage(db.Model):
+    __tablename__ = 'outbox_messages'
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(128))
+    sender = db.Column(db.String(128))
+    subject = db.Column(db.String(256))
+    body = db.Column(db.Text)
+    html = db.Column(db.Text)
+    status = db.Column(db.String(16), default=PENDING)
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    claimed_by = db.Column(db.String(32))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    __table_args__ = (
+        db.Index('ix_outbox_messages_status_next_attempt_at',
+                 'status', 'next_attempt_at'),
+    )
+
 
 class Role(db.Model):
     __tablename__ = 'roles'
@@ -116,9 +241,36 @@ class Role(db.Model):
             db.session.add(role)
         db.session.commit()
 
+    @staticmethod
+    def registry():
+        """Return the ``{role_id: permissions}`` map of all roles.
+
+        The map is loaded once per process and reloaded after
+        ``APP_ROLE_REGISTRY_TTL`` seconds, or as soon as this process
+        changes a role.
+        """
+        registry = current_app.extensions.get('role_registry')
+        if registry is None or registry[0] <= time.time():
+            roles = dict(db.session.query(Role.id, Role.permissions))
+            registry = (
+                time.time() + current_app.config['APP_ROLE_REGISTRY_TTL'],
+                roles,
+            )
+            current_app.extensions['role_registry'] = registry
+        return registry[1]
+
+    @staticmethod
+    def on_changed(mapper, connection, target):
+        if has_app_context():
+            current_app.extensions.pop('role_registry', None)
+
     def __repr__(self):
         return '<Role {}>'.format(self.name)
 
+db.event.listen(Role, 'after_insert', Role.on_changed)
+db.event.listen(Role, 'after_update', Role.on_changed)
+db.event.listen(Role, 'after_delete', Role.on_changed)
+
 
 class Post(db.Model):
     __tablename__ = 'posts'
@@ -128,6 +280,9 @@ class Post(db.Model):
     body_html = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    comment_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, index=True, default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
     comments = db.relationship('Comment', backref='post', lazy='dynamic')
 
     @staticmethod
@@ -147,16 +302,106 @@ class Post(db.Model):
             db.session.add(p)
             db.session.commit()
 
+    @staticmethod
+    def on_inserted(mapper, connection, target):
+        from .search import index_row
+        if target.author_id is not None:
+            users = User.__table__
+            connection.execute(
+                users.update().where(users.c.id == target.author_id)
+                .values(post_count=users.c.post_count + 1)
+            )
+        TimelineEntry.fan_out(connection, target.author_id, [target.id])
+        index_row(connection, 'posts', target.id, target.body)
+
+    @staticmethod
+    def insert_many(posts):
+        """Insert new posts with a fixed number of statements.
+
+        The rows are written with one multi-row insert instead of a flush,
+        which would run the insert listeners once per post; their work is
+        done here with one counter update and one fan-out per author and
+        one search index insert. The posts get their ids but are not added
+        to the session.
+        """
+        from .search import index_rows
+        table = Post.__table__
+        users = User.__table__
+        now = datetime.utcnow()
+        for post in posts:
+            post.timestamp = post.timestamp or now
+            post.updated_at = now
+            post.comment_count = 0
+        ids = insert_returning(table, [{
+            'body': post.body,
+            'body_html': post.body_html,
+            'timestamp': post.timestamp,
+            'author_id': post.author_id,
+            'comment_count': 0,
+            'updated_at': post.updated_at,
+        } for post in posts], [table.c.id])
+        authors = defaultdict(list)
+        for post, row in zip(posts, ids):
+            post.id = row.id
+            if post.author_id is not None:
+                authors[post.author_id].append(post.id)
+        connection = db.session.connection()
+        for author_id, post_ids in sorted(authors.items()):
+            connection.execute(
+                users.update().where(users.c.id == author_id)
+                .values(post_count=users.c.post_count + len(post_ids))
+            )
+            TimelineEntry.fan_out(connection, author_id, post_ids)
+        index_rows(connection, 'posts',
+                   [(post.id, post.body) for post in posts])
+
+    @staticmethod
+    def on_deleted(mapper, connection, target):
+        from .search import unindex_row
+        if target.author_id is not None:
+            users = User.__table__
+            connection.execute(
+                users.update().where(users.c.id == target.author_id)
+                .values(post_count=users.c.post_count - 1)
+            )
+        unindex_row(connection, 'posts', target.id)
+
+    @staticmethod
+    def on_updated(mapper, connection, target):
+        if db.inspect(target).attrs.body.history.has_changes():
+            from .search import index_row
+            index_row(connection, 'posts', target.id, target.body,
+                      replace=True)
+
+    @staticmethod
+    def on_created_table(target, connection, **kw):
+        from .search import create_index
+        create_index(connection, 'posts')
+
+    @staticmethod
+    def on_dropping_table(target, connection, **kw):
+        from .search import drop_index
+        drop_index(connection, 'posts')
+
+    @staticmethod
+    def update_comment_count(connection, post_id, delta):
+        if post_id is None:
+            return
+        posts = Post.__table__
+        connection.execute(
+            posts.update().where(posts.c.id == post_id)
+            .values(comment_count=posts.c.comment_count + delta)
+        )
+
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
+        if value == oldvalue and target.body_html is not None:
+            return
+        fragment_cache.invalidate('post', target.id)
         allowed_tags = ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
                         'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
                         'h1', 'h2', 'h3', 'p']
-        target.body_html = bleach.linkify(bleach.clean(
-            markdown(value, output_format='html'),
-            tags=allowed_tags,
-            strip=True,
-        ))
+        target.body_html = renderer.render(value, allowed_tags)
 
     def to_json(self):
         json_post = {
@@ -168,7 +413,7 @@ class Post(db.Model):
                               id=self.author_id, _external=True),
             'comments': url_for('api.get_post_comments',
                                 id=self.id, _external=True),
-            'comment_count': self.comments.count()
+            'comment_count': self.comment_count
         }
         return json_post
 
@@ -180,6 +425,220 @@ class Post(db.Model):
         return Post(body=body)
 
 db.event.listen(Post.body, 'set', Post.on_changed_body)
+db.event.listen(Post, 'after_insert', Post.on_inserted)
+db.event.listen(Post, 'after_delete', Post.on_deleted)
+db.event.listen(Post, 'after_update', Post.on_updated)
+db.event.listen(Post.__table__, 'after_create', Post.on_created_table)
+db.event.listen(Post.__table__, 'before_drop', Post.on_dropping_table)
+
+
+class TimelineEntry(db.Model):
+    __tablename__ = 'timeline_entries'
+    __table_args__ = (
+        db.Index('ix_timeline_entries_user_id_timestamp',
+                 'user_id', 'timestamp', 'post_id'),
+    )
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+    post_id = db.Column(
+        db.Integer,
+        db.ForeignKey('posts.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+    author_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        index=True,
+    )
+    timestamp = db.Column(db.DateTime)
+
+    @staticmethod
+    def fan_out(connection, author_id, post_ids):
+        # Push new posts into the timeline of every follower of their author.
+        # Authors above APP_TIMELINE_FANOUT_LIMIT are switched to pull mode
+        # and their posts are merged in when the timeline is read instead,
+        # until unfollows bring them back under the limit times
+        # APP_TIMELINE_FANIN_RATIO.
+        if author_id is None:
+            return
+        users = User.__table__
+        follows = Follow.__table__
+        posts = Post.__table__
+        author = connection.execute(
+            db.select([users.c.follower_count, users.c.timeline_pull])
+            .where(users.c.id == author_id)
+        ).first()
+        if author is None or author.timeline_pull:
+            return
+        if (author.follower_count or 0) > \
+                current_app.config['APP_TIMELINE_FANOUT_LIMIT']:
+            connection.execute(
+                users.update().where(users.c.id == author_id)
+                .values(timeline_pull=True, timeline_refill=False)
+            )
+            return
+        connection.execute(TimelineEntry.__table__.insert().from_select(
+            ['user_id', 'post_id', 'author_id', 'timestamp'],
+            db.select([
+                follows.c.follower_id,
+                posts.c.id,
+                posts.c.author_id,
+                posts.c.timestamp,
+            ]).select_from(
+                follows.join(posts,
+                             posts.c.author_id == follows.c.followed_id)
+            ).where(db.and_(
+                follows.c.followed_id == author_id,
+                posts.c.id.in_(post_ids),
+            ))
+        ))
+
+    @staticmethod
+    def fan_in(connection, author_id):
+        # Switch an author in pull mode back to fan-out once their follower
+        # count is down to the limit times APP_TIMELINE_FANIN_RATIO, which
+        # keeps authors hovering at the limit from switching back and forth.
+        # New posts are fanned out again at once; the posts published in
+        # pull mode are copied by refill(), and timelines keep pulling them
+        # until it has run.
+        users = User.__table__
+        config = current_app.config
+        author = connection.execute(
+            db.select([users.c.follower_count, users.c.timeline_pull])
+            .where(users.c.id == author_id)
+        ).first()
+        if author is None or not author.timeline_pull or \
+                (author.follower_count or 0) > \
+                config['APP_TIMELINE_FANOUT_LIMIT'] * \
+                config['APP_TIMELINE_FANIN_RATIO']:
+            return
+        connection.execute(
+            users.update().where(users.c.id == author_id)
+            .values(timeline_pull=False, timeline_refill=True)
+        )
+
+    @staticmethod
+    def backfill(user, author):
+        # Copy the posts of a newly followed author into the timeline.
+        if user.id is None or author.id is None or author.timeline_pull:
+            return
+        posts = Post.__table__
+        db.session.execute(TimelineEntry.__table__.insert().from_select(
+            ['user_id', 'post_id', 'author_id', 'timestamp'],
+            db.select([
+                db.literal(user.id),
+                posts.c.id,
+                posts.c.author_id,
+                posts.c.timestamp,
+            ]).where(posts.c.author_id == author.id)
+        ))
+
+    @staticmethod
+    def remove(user, author):
+        if user.id is None or author.id is None:
+            return
+        entries = TimelineEntry.__table__
+        db.session.execute(entries.delete().where(db.and_(
+            entries.c.user_id == user.id,
+            entries.c.author_id == author.id,
+        )))
+
+    @staticmethod
+    def refill(chunk_size=1000, progress=None):
+        """Copy the posts of authors back from pull mode into timelines.
+
+        Works through the followers of each author marked by ``fan_in`` a
+        chunk of ids per transaction, skipping the entries fan-out and
+        follows have added meanwhile, then clears the mark. Returns the
+        number of entries inserted.
+        """
+        users = User.__table__
+        follows = Follow.__table__
+        posts = Post.__table__
+        entries = TimelineEntry.__table__
+
+        authors = [row.id for row in db.session.execute(
+            db.select([users.c.id])
+            .where(users.c.timeline_refill == db.true())
+            .order_by(users.c.id))]
+        db.session.commit()
+        inserted = 0
+        for done, author_id in enumerate(authors, 1):
+            max_id = db.session.execute(
+                db.select([db.func.max(follows.c.follower_id)])
+                .where(follows.c.followed_id == author_id)).scalar() or 0
+            for low in range(0, max_id + 1, chunk_size):
+                result = db.session.execute(entries.insert().from_select(
+                    ['user_id', 'post_id', 'author_id', 'timestamp'],
+                    db.select([
+                        follows.c.follower_id,
+                        posts.c.id,
+                        posts.c.author_id,
+                        posts.c.timestamp,
+                    ]).select_from(follows.join(
+                        posts, posts.c.author_id == follows.c.followed_id)
+                    ).where(db.and_(
+                        follows.c.followed_id == author_id,
+                        follows.c.follower_id >= low,
+                        follows.c.follower_id < low + chunk_size,
+                        ~db.exists().where(db.and_(
+                            entries.c.user_id == follows.c.follower_id,
+                            entries.c.post_id == posts.c.id,
+                        )),
+                    ))
+                ))
+                db.session.commit()
+                inserted += max(result.rowcount, 0)
+            db.session.execute(users.update().where(users.c.id == author_id)
+                               .values(timeline_refill=False))
+            db.session.commit()
+            if progress is not None:
+                progress(done, len(authors), inserted)
+        return inserted
+
+    @staticmethod
+    def rebuild(chunk_size=1000, progress=None):
+        users = User.__table__
+        follows = Follow.__table__
+        posts = Post.__table__
+        entries = TimelineEntry.__table__
+
+        limit = current_app.config['APP_TIMELINE_FANOUT_LIMIT']
+        db.session.execute(users.update().values(
+            timeline_pull=users.c.follower_count > limit,
+            timeline_refill=False))
+        db.session.execute(entries.delete())
+        db.session.commit()
+
+        max_id = db.session.query(db.func.max(User.id)).scalar() or 0
+        inserted = 0
+        for low in range(0, max_id + 1, chunk_size):
+            result = db.session.execute(entries.insert().from_select(
+                ['user_id', 'post_id', 'author_id', 'timestamp'],
+                db.select([
+                    follows.c.follower_id,
+                    posts.c.id,
+                    posts.c.author_id,
+                    posts.c.timestamp,
+                ]).select_from(
+                    follows.join(
+                        posts, posts.c.author_id == follows.c.followed_id
+                    ).join(users, users.c.id == posts.c.author_id)
+                ).where(db.and_(
+                    follows.c.follower_id >= low,
+                    follows.c.follower_id < low + chunk_size,
+                    users.c.timeline_pull == db.false(),
+                ))
+            ))
+            db.session.commit()
+            inserted += max(result.rowcount, 0)
+            if progress is not None:
+                progress(min(low + chunk_size, max_id), max_id, inserted)
+        return inserted
 
 
 class User(UserMixin, db.Model):
@@ -197,6 +656,14 @@ class User(UserMixin, db.Model):
     member_since = db.Column(db.DateTime(), default=datetime.utcnow)
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
     avatar_hash = db.Column(db.String(32))
+    timeline_pull = db.Column(db.Boolean, default=False, index=True)
+    timeline_refill = db.Column(db.Boolean, default=False, index=True)
+    post_count = db.Column(db.Integer, default=0)
+    follower_count = db.Column(db.Integer, default=0)
+    followed_count = db.Column(db.Integer, default=0)
+    followed_version = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow)
     posts = db.relationship('Post', backref='author', lazy='dynamic')
     followed = db.relationship(
         'Follow',
@@ -240,6 +707,34 @@ class User(UserMixin, db.Model):
         return Post.query.join(Follow, Follow.followed_id == Post.author_id)\
             .filter(Follow.follower_id == self.id)
 
+    def timeline(self):
+        """Return the followed posts query and its ``(timestamp, id)`` keys.
+
+        Posts are read from the materialized ``timeline_entries`` table,
+        except for followed authors in pull mode, or not yet refilled since,
+        whose posts are merged in at read time.
+        """
+        pulled = [row.id for row in db.session.query(User.id).join(
+            Follow, Follow.followed_id == User.id
+        ).filter(
+            Follow.follower_id == self.id,
+            db.or_(User.timeline_pull == db.true(),
+                   User.timeline_refill == db.true()),
+        )]
+        if not pulled:
+            query = Post.query.join(
+                TimelineEntry, TimelineEntry.post_id == Post.id
+            ).filter(TimelineEntry.user_id == self.id)
+            return query, (TimelineEntry.timestamp, TimelineEntry.post_id)
+        query = Post.query.outerjoin(TimelineEntry, db.and_(
+            TimelineEntry.post_id == Post.id,
+            TimelineEntry.user_id == self.id,
+        )).filter(db.or_(
+            TimelineEntry.user_id.isnot(None),
+            Post.author_id.in_(pulled),
+        ))
+        return query, (Post.timestamp, Post.id)
+
     def verify_password(self, password):
         return check_password_hash(self.password_hash, password)
 
@@ -299,9 +794,21 @@ class User(UserMixin, db.Model):
         db.session.add(self)
         return True
 
+    @property
+    def permissions(self):
+        # A role already loaded on this instance wins, since it may have
+        # been changed without being flushed yet.
+        role = self.__dict__.get('role')
+        if role is None and self.role_id is not None:
+            permissions = Role.registry().get(self.role_id)
+            if permissions is not None:
+                return permissions
+            role = self.role
+        return role.permissions if role is not None else None
+
     def can(self, permissions):
-        return self.role is not None and \
-               (self.role.permissions & permissions) == permissions
+        granted = self.permissions
+        return granted is not None and (granted & permissions) == permissions
 
     def is_administrator(self):
         return self.can(Permission.ADMINISTER)
@@ -330,27 +837,82 @@ class User(UserMixin, db.Model):
         if not self.is_following(user):
             f = Follow(followed=user)
             self.followed.append(f)
+            TimelineEntry.backfill(self, user)
+            # the follow graph only sees flushed follows
+            db.session.flush()
 
     def unfollow(self, user):
+        if not self.is_following(user):
+            return
         f = self.followed.filter_by(followed_id=user.id).first()
         if f:
             self.followed.remove(f)
+            TimelineEntry.remove(self, user)
+            db.session.flush()
 
     def is_following(self, user):
-        return self.followed.filter_by(
-                followed_id=user.id).first() is not None
+        return user.id is not None and \
+            follow_graph.is_following(self, user.id)
 
     def is_followed_by(self, user):
-        return self.followers.filter_by(
-                follower_id=user.id).first() is not None
+        return self.id is not None and user.id is not None and \
+            follow_graph.is_followed_by(self, user)
+
+    def following_among(self, users):
+        """Return the ids of the given users that this user follows."""
+        return follow_graph.following_among(
+            self, [user.id for user in users if user.id is not None])
 
     @staticmethod
-    def add_self_follows():
-        for user in User.query.all():
-            if not user.is_following(user):
-                user.follow(user)
-                db.session.add(user)
-                db.session.commit()
+    def add_self_follows(chunk_size=10000, progress=None):
+        """Make every user follow themselves and return how many were added.
+
+        Runs a few set-based statements per ``chunk_size`` block of user
+        ids, each block in its own transaction, instead of one round-trip
+        per user.
+        """
+        users = User.__table__
+        follows = Follow.__table__
+        posts = Post.__table__
+        entries = TimelineEntry.__table__
+
+        max_id = db.session.query(db.func.max(User.id)).scalar() or 0
+        added = 0
+        for start in range(0, max_id, chunk_size):
+            missing = db.and_(
+                users.c.id > start,
+                users.c.id <= start + chunk_size,
+                ~db.exists().where(db.and_(
+                    follows.c.follower_id == users.c.id,
+                    follows.c.followed_id == users.c.id,
+                )),
+            )
+            db.session.execute(users.update().where(missing).values(
+                follower_count=users.c.follower_count + 1,
+                followed_count=users.c.followed_count + 1,
+                followed_version=random.randint(1, 2 ** 31 - 1),
+            ))
+            db.session.execute(entries.insert().from_select(
+                ['user_id', 'post_id', 'author_id', 'timestamp'],
+                db.select([
+                    posts.c.author_id.label('user_id'),
+                    posts.c.id,
+                    posts.c.author_id,
+                    posts.c.timestamp,
+                ]).select_from(
+                    posts.join(users, users.c.id == posts.c.author_id))
+                .where(db.and_(missing, users.c.timeline_pull.isnot(True)))
+            ))
+            result = db.session.execute(follows.insert().from_select(
+                ['follower_id', 'followed_id', 'timestamp'],
+                db.select([users.c.id, users.c.id.label('followed_id'),
+                           db.literal(datetime.utcnow())]).where(missing)
+            ))
+            db.session.commit()
+            added += result.rowcount
+            if progress is not None:
+                progress(min(start + chunk_size, max_id), max_id, added)
+        return added
 
     @staticmethod
     def generate_fake(count=100):
@@ -377,15 +939,15 @@ class User(UserMixin, db.Model):
                 db.session.rollback()
 
     def generate_auth_token(self, expiration):
-        s = Serializer(current_app.config['SECRET_KEY'],
-                       expires_in=expiration)
-        return s.dumps({'id': self.id}).decode('ascii')
+        return auth_token_serializer(expiration).dumps({
+            'id': self.id,
+            'permissions': self.permissions or 0,
+        }).decode('ascii')
 
     @staticmethod
     def verify_auth_token(token):
-        s = Serializer(current_app.config['SECRET_KEY'])
         try:
-            data = s.loads(token)
+            data = auth_token_serializer().loads(token)
         except:
             return None
         return User.query.get(data['id'])
@@ -400,7 +962,7 @@ class User(UserMixin, db.Model):
                              id=self.id, _external=True),
             'followed_posts': url_for('api.get_user_followed_posts',
                                       id=self.id, _external=True),
-            'post_count': self.posts.count()
+            'post_count': self.post_count
         }
         return json_user
 
@@ -408,6 +970,65 @@ class User(UserMixin, db.Model):
         return '<User {}>'.format(self.username)
 
 
+def insert_returning(table, rows, columns):
+    """Insert ``rows`` and return their ``columns``, in insertion order.
+
+    Uses a fixed number of statements whatever the number of rows, in the
+    transaction of the session.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        # multi-row VALUES with RETURNING, kept under the limit of 32767
+        # bind parameters per statement
+        size = max(1, 30000 // len(rows[0]))
+        inserted = []
+        for i in range(0, len(rows), size):
+            inserted.extend(db.session.execute(
+                table.insert().values(rows[i:i + size])
+                .returning(*columns)))
+        return inserted
+    # SQLite gives the rows of one statement consecutive ids above the
+    # largest one, and the transaction keeps other writers out until it
+    # commits
+    db.session.execute(table.insert(), rows)
+    last = db.session.execute(db.select([db.func.max(table.c.id)])).scalar()
+    return db.session.execute(
+        db.select(columns).where(table.c.id > last - len(rows))
+        .order_by(table.c.id)).fetchall()
+
+
+def reconcile_counters():
+    """Recompute the denormalized counters and return the rows fixed."""
+    users = User.__table__
+    posts = Post.__table__
+    comments = Comment.__table__
+    follows = Follow.__table__
+
+    def count(table, column, key):
+        return db.select([db.func.count()]).select_from(table)\
+            .where(column == key).as_scalar()
+
+    counters = [
+        (posts, posts.c.comment_count,
+         count(comments, comments.c.post_id, posts.c.id)),
+        (users, users.c.post_count,
+         count(posts, posts.c.author_id, users.c.id)),
+        (users, users.c.follower_count,
+         count(follows, follows.c.followed_id, users.c.id)),
+        (users, users.c.followed_count,
+         count(follows, follows.c.follower_id, users.c.id)),
+    ]
+    fixed = {}
+    for table, column, actual in counters:
+        result = db.session.execute(
+            table.update()
+            .where(db.or_(column.is_(None), column != actual))
+            .values({column.name: actual})
+        )
+        fixed['{}.{}'.format(table.name, column.name)] = result.rowcount
+    db.session.commit()
+    return fixed
+
+
 class AnonymousUser(AnonymousUserMixin):
     def can(self, permissions):
         return False
@@ -418,6 +1039,107 @@ class AnonymousUser(AnonymousUserMixin):
 login_manager.anonymous_user = AnonymousUser
 
 
+def auth_token_serializer(expiration=None):
+    # Serializers are built once per application and token lifetime.
+    serializers = current_app.extensions.setdefault('auth_token_serializers',
+                                                    {})
+    if expiration not in serializers:
+        if expiration is None:
+            serializers[expiration] = Serializer(
+                current_app.config['SECRET_KEY'])
+        else:
+            serializers[expiration] = Serializer(
+                current_app.config['SECRET_KEY'], expires_in=expiration)
+    return serializers[expiration]
+
+
+class Principal(object):
+    """API caller authenticated by token, resolved without a User row.
+
+    Principals are cached per process for APP_AUTH_CACHE_TTL seconds. A
+    change to the role or confirmation of a user, or to the permissions
+    of a role, drops the cached principals of the process that made it
+    only; other processes keep serving the old permissions until their
+    entry expires. Keep APP_AUTH_CACHE_TTL as short as revocations must
+    be.
+    """
+    is_anonymous = False
+    is_authenticated = True
+
+    def __init__(self, id, permissions, confirmed):
+        self.id = id
+        self.permissions = permissions
+        self.confirmed = confirmed
+
+    def can(self, permissions):
+        return (self.permissions & permissions) == permissions
+
+    def is_administrator(self):
+        return self.can(Permission.ADMINISTER)
+
+    def generate_auth_token(self, expiration):
+        return auth_token_serializer(expiration).dumps({
+            'id': self.id,
+            'permissions': self.permissions,
+        }).decode('ascii')
+
+    @staticmethod
+    def cache():
+        if 'auth_principals' not in current_app.extensions:
+            current_app.extensions['auth_principals'] = LRUCache(
+                current_app.config['APP_AUTH_CACHE_SIZE'],
+                default_timeout=current_app.config['APP_AUTH_CACHE_TTL'],
+            )
+        return current_app.extensions['auth_principals']
+
+    @staticmethod
+    def load(user_id):
+        cache = Principal.cache()
+        principal = cache.get(user_id)
+        if principal is None:
+            row = db.session.query(
+                User.id, User.confirmed, Role.permissions
+            ).outerjoin(Role, Role.id == User.role_id)\
+                .filter(User.id == user_id).first()
+            if row is None:
+                return None
+            principal = Principal(row.id, row.permissions or 0,
+                                  bool(row.confirmed))
+            cache.set(user_id, principal)
+        return principal
+
+    @staticmethod
+    def from_token(token):
+        try:
+            data = auth_token_serializer().loads(token)
+        except:
+            return None
+        principal = Principal.load(data.get('id'))
+        if principal is None:
+            return None
+        # tokens issued before a role change are no longer accepted
+        if data.get('permissions', principal.permissions) != \
+                principal.permissions:
+            return None
+        return principal
+
+    @staticmethod
+    def on_updated_user(mapper, connection, target):
+        state = db.inspect(target)
+        if has_app_context() and (
+                state.attrs.role_id.history.has_changes() or
+                state.attrs.confirmed.history.has_changes()):
+            Principal.cache().delete(target.id)
+
+    @staticmethod
+    def on_changed_role(target, value, oldvalue, initiator):
+        if has_app_context():
+            Principal.cache().clear()
+
+db.event.listen(User, 'after_update', Principal.on_updated_user)
+db.event.listen(Role.permissions, 'set', Principal.on_changed_role)
+
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
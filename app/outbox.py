@@ -0,0 +1,286 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_mail import Message
+
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox(object):
+    """Durable queue of outgoing email.
+
+    ``enqueue`` adds a message to the ``outbox_messages`` table in the
+    current database session, so it is committed, or rolled back, together
+    with the changes that caused it; delivery is done by a
+    :class:`WorkerPool`, usually in a separate ``manage.py outbox_worker``
+    process. Failed deliveries are retried with exponential backoff, up to
+    ``APP_OUTBOX_MAX_ATTEMPTS`` times.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('APP_OUTBOX_WORKERS', 4)
+        app.config.setdefault('APP_OUTBOX_BATCH_SIZE', 50)
+        app.config.setdefault('APP_OUTBOX_POLL_INTERVAL', 1)
+        app.config.setdefault('APP_OUTBOX_MAX_ATTEMPTS', 6)
+        app.config.setdefault('APP_OUTBOX_RETRY_DELAY', 30)
+        app.config.setdefault('APP_OUTBOX_RETRY_MAX_DELAY', 3600)
+        app.config.setdefault('APP_OUTBOX_LEASE', 300)
+        app.config.setdefault('APP_OUTBOX_IDLE_TIMEOUT', 30)
+        app.extensions['outbox'] = self
+
+    def enqueue(self, to, subject, body, html=None, sender=None):
+        from . import db
+        from .models import OutboxMessage
+
+        message = OutboxMessage(
+            recipient=to,
+            sender=sender or current_app.config['APP_MAIL_SENDER'],
+            subject=subject,
+            body=body,
+            html=html,
+        )
+        db.session.add(message)
+        return message
+
+    def claim(self, limit, token=None):
+        """Mark up to ``limit`` due messages as sending, return their ids.
+
+        The messages are claimed under ``token``, which their delivery
+        must present. Messages left in the sending state by a worker that
+        went away are claimed again once their ``APP_OUTBOX_LEASE`` has
+        expired.
+        """
+        from . import db
+        from .models import OutboxMessage
+
+        table = OutboxMessage.__table__
+        now = datetime.utcnow()
+        expired = now - timedelta(
+            seconds=current_app.config['APP_OUTBOX_LEASE'])
+        due = db.or_(
+            db.and_(table.c.status == OutboxMessage.PENDING,
+                    table.c.next_attempt_at <= now),
+            db.and_(table.c.status == OutboxMessage.SENDING,
+                    table.c.claimed_at < expired),
+        )
+        token = token or uuid.uuid4().hex
+        with db.engine.begin() as connection:
+            ids = [row[0] for row in connection.execute(
+                db.select([table.c.id]).where(due)
+                .order_by(table.c.next_attempt_at).limit(limit))]
+            if not ids:
+                return []
+            connection.execute(
+                table.update().where(table.c.id.in_(ids)).where(due)
+                .values(status=OutboxMessage.SENDING, claimed_at=now,
+                        claimed_by=token)
+            )
+            return [row[0] for row in connection.execute(
+                db.select([table.c.id]).where(table.c.id.in_(ids))
+                .where(table.c.claimed_by == token)
+                .order_by(table.c.id))]
+
+    def deliver(self, connection, message_id, token):
+        """Send one message claimed under ``token`` over a mail ``connection``.
+
+        The lease is renewed before sending, and nothing is sent once the
+        claim has passed to another worker. Returns False when sending
+        failed, in which case the message is rescheduled and the connection
+        should no longer be used.
+        """
+        from . import db
+        from .models import OutboxMessage
+
+        table = OutboxMessage.__table__
+        claimed = db.and_(table.c.id == message_id,
+                          table.c.status == OutboxMessage.SENDING,
+                          table.c.claimed_by == token)
+        renewed = db.engine.execute(
+            table.update().where(claimed)
+            .values(claimed_at=datetime.utcnow())).rowcount
+        row = db.engine.execute(table.select().where(claimed)).first()
+        if not renewed or row is None:
+            logger.warning('outbox: lost the claim of message %s', message_id)
+            return True
+        try:
+            if connection is None:
+                raise RuntimeError('no mail connection')
+            connection.send(Message(row.subject, sender=row.sender,
+                                    recipients=[row.recipient],
+                                    body=row.body, html=row.html))
+        except Exception as e:
+            self.reschedule(row, token, e)
+            return False
+        sent = db.engine.execute(
+            table.update().where(claimed)
+            .values(status=OutboxMessage.SENT, sent_at=datetime.utcnow(),
+                    attempts=row.attempts + 1, claimed_by=None)
+        ).rowcount
+        if not sent:
+            logger.error('outbox: the lease of message %s expired while it '
+                         'was sent, it may be delivered twice', message_id)
+        return True
+
+    def reschedule(self, row, token, error):
+        from . import db
+        from .models import OutboxMessage
+
+        config = current_app.config
+        attempts = row.attempts + 1
+        values = {'attempts': attempts, 'claimed_by': None,
+                  'last_error': '{}: {}'.format(type(error).__name__, error)}
+        if attempts >= config['APP_OUTBOX_MAX_ATTEMPTS']:
+            values['status'] = OutboxMessage.FAILED
+            logger.error('outbox: giving up on message %s to %s: %s',
+                         row.id, row.recipient, values['last_error'])
+        else:
+            delay = min(config['APP_OUTBOX_RETRY_DELAY'] * 2 ** (attempts - 1),
+                        config['APP_OUTBOX_RETRY_MAX_DELAY'])
+            values['status'] = OutboxMessage.PENDING
+            values['next_attempt_at'] = \
+                datetime.utcnow() + timedelta(seconds=delay)
+        table = OutboxMessage.__table__
+        db.engine.execute(
+            table.update().where(table.c.id == row.id)
+            .where(table.c.claimed_by == token).values(**values))
+
+    def stats(self):
+        """Return the queue depth per status and the oldest pending age."""
+        from . import db
+        from .models import OutboxMessage
+
+        table = OutboxMessage.__table__
+        stats = dict((status, 0) for status in (
+            OutboxMessage.PENDING, OutboxMessage.SENDING,
+            OutboxMessage.SENT, OutboxMessage.FAILED))
+        for status, count in db.engine.execute(
+                db.select([table.c.status, db.func.count()])
+                .group_by(table.c.status)):
+            stats[status] = count
+        oldest = db.engine.execute(
+            db.select([db.func.min(table.c.created_at)])
+            .where(table.c.status == OutboxMessage.PENDING)).scalar()
+        stats['oldest_pending_age'] = (
+            (datetime.utcnow() - oldest).total_seconds()
+            if oldest is not None else 0)
+        return stats
+
+
+class WorkerPool(object):
+    """Fixed number of threads delivering claimed outbox messages.
+
+    Each worker keeps its SMTP connection open between messages and only
+    closes it after ``APP_OUTBOX_IDLE_TIMEOUT`` idle seconds or an error.
+    """
+
+    def __init__(self, app, size=None):
+        self.app = app
+        self.outbox = app.extensions['outbox']
+        self.size = size or app.config['APP_OUTBOX_WORKERS']
+        self.queue = queue.Queue(maxsize=self.size * 2)
+        self.stopping = threading.Event()
+        self.delivered = 0
+        self.errors = 0
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.size):
+            thread = threading.Thread(target=self._work,
+                                      name='outbox-worker-{}'.format(i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self.stopping.set()
+        for thread in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def run(self, once=False, stats_interval=60):
+        """Claim and dispatch messages until stopped.
+
+        With ``once`` the pool stops as soon as nothing is due.
+        """
+        config = self.app.config
+        self.start()
+        reported = time.time()
+        try:
+            with self.app.app_context():
+                while not self.stopping.is_set():
+                    free = self.queue.maxsize - self.queue.qsize()
+                    token = uuid.uuid4().hex
+                    ids = self.outbox.claim(
+                        min(free, config['APP_OUTBOX_BATCH_SIZE']), token)
+                    for id in ids:
+                        self.queue.put((id, token))
+                    if stats_interval and \
+                            time.time() - reported >= stats_interval:
+                        logger.info('outbox: %s', self.stats())
+                        reported = time.time()
+                    if not ids:
+                        if once and not self.queue.unfinished_tasks:
+                            break
+                        self.stopping.wait(
+                            config['APP_OUTBOX_POLL_INTERVAL'])
+        finally:
+            self.stop()
+
+    def stats(self):
+        stats = self.outbox.stats()
+        stats.update(workers=self.size, queued=self.queue.qsize(),
+                     delivered=self.delivered, errors=self.errors)
+        return stats
+
+    def _work(self):
+        from . import mail
+
+        idle_timeout = self.app.config['APP_OUTBOX_IDLE_TIMEOUT']
+        connection = None
+        with self.app.app_context():
+            while True:
+                try:
+                    item = self.queue.get(timeout=idle_timeout)
+                except queue.Empty:
+                    connection = self._close(connection)
+                    continue
+                try:
+                    if item is None:
+                        break
+                    if connection is None:
+                        try:
+                            connection = mail.connect().__enter__()
+                        except Exception as e:
+                            logger.warning('outbox: cannot connect: %s', e)
+                    if self.outbox.deliver(connection, *item):
+                        with self._lock:
+                            self.delivered += 1
+                    else:
+                        with self._lock:
+                            self.errors += 1
+                        connection = self._close(connection)
+                finally:
+                    self.queue.task_done()
+            self._close(connection)
+
+    @staticmethod
+    def _close(connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+        return None
@@ -0,0 +1,163 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import request, url_for
+
+from . import db
+from .exceptions import ValidationError
+
+
+_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+class KeysetPagination(object):
+    """Page of results positioned by opaque ``(timestamp, id)`` cursors.
+
+    Mirrors the parts of Flask-SQLAlchemy's ``Pagination`` used by the views
+    and templates, but never counts the rows of the underlying query.
+    """
+    cursor_based = True
+    total = None
+
+    def __init__(self, items, per_page, prev_cursor=None, next_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(direction, values):
+    values = [{'dt': v.strftime(_DATETIME_FORMAT)}
+              if isinstance(v, datetime) else v for v in values]
+    data = json.dumps([direction, values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def _is_a(value, kind):
+    if isinstance(value, bool):
+        return False
+    if kind is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, kind)
+
+
+def decode_cursor(cursor, kinds=(datetime, int)):
+    """Return the ``(direction, values)`` of ``cursor``.
+
+    Raises ``ValidationError`` unless the values are instances of
+    ``kinds``, so tampered cursors never reach the keyset comparison.
+    """
+    try:
+        direction, values = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        values = [datetime.strptime(v['dt'], _DATETIME_FORMAT)
+                  if isinstance(v, dict) else v for v in values]
+    except (TypeError, ValueError, KeyError, UnicodeError):
+        raise ValidationError('invalid cursor')
+    if direction not in ('next', 'prev') or len(values) != len(kinds) or \
+            not all(_is_a(v, kind) for v, kind in zip(values, kinds)):
+        raise ValidationError('invalid cursor')
+    return direction, values
+
+
+def _order_by(keys, ascending):
+    return [key.asc() if ascending else key.desc() for key in keys]
+
+
+def _after(keys, values, ascending):
+    timestamp, id = keys
+    timestamp_value, id_value = values
+    if ascending:
+        return db.or_(timestamp > timestamp_value, db.and_(
+            timestamp == timestamp_value, id > id_value))
+    return db.or_(timestamp < timestamp_value, db.and_(
+        timestamp == timestamp_value, id < id_value))
+
+
+def keyset_paginate(query, keys, cursor, per_page, ascending=False):
+    """Return the page of ``query`` that follows ``cursor``.
+
+    ``keys`` are the ``(timestamp, id)`` columns the query is ordered by;
+    the items returned must expose matching ``timestamp`` and ``id``
+    attributes.
+    """
+    direction, values = 'next', None
+    if cursor:
+        direction, values = decode_cursor(cursor)
+    forward = direction == 'next'
+    scan_ascending = ascending == forward
+    if values is not None:
+        query = query.filter(_after(keys, values, scan_ascending))
+    items = query.order_by(*_order_by(keys, scan_ascending))\
+        .limit(per_page + 1).all()
+    more = len(items) > per_page
+    items = items[:per_page]
+    if not forward:
+        items.reverse()
+    has_next = more if forward else values is not None
+    has_prev = values is not None if forward else more
+    prev_cursor = next_cursor = None
+    if items and has_prev:
+        prev_cursor = encode_cursor(
+            'prev', [items[0].timestamp, items[0].id])
+    if items and has_next:
+        next_cursor = encode_cursor(
+            'next', [items[-1].timestamp, items[-1].id])
+    return KeysetPagination(items, per_page, prev_cursor, next_cursor)
+
+
+def paginate(query, keys, per_page, ascending=False):
+    """Paginate ``query`` from the ``cursor`` or ``page`` request argument.
+
+    Requests that still use ``?page=`` get the offset based pagination
+    object from Flask-SQLAlchemy, everything else is keyset paginated.
+    """
+    if 'page' in request.args and 'cursor' not in request.args:
+        return query.order_by(*_order_by(keys, ascending)).paginate(
+            request.args.get('page', 1, type=int),
+            per_page=per_page,
+            error_out=False,
+        )
+    return keyset_paginate(query, keys, request.args.get('cursor'),
+                           per_page, ascending)
+
+
+def envelope(pagination, endpoint, **values):
+    """Return the pagination fields of an API list response.
+
+    ``count`` is the total number of items for ``?page=`` requests only;
+    cursor paginated responses are never counted and return ``null``.
+    """
+    prev_url = next_url = prev_cursor = next_cursor = None
+    if getattr(pagination, 'cursor_based', False):
+        prev_cursor = pagination.prev_cursor
+        next_cursor = pagination.next_cursor
+        if prev_cursor:
+            prev_url = url_for(endpoint, cursor=prev_cursor,
+                               _external=True, **values)
+        if next_cursor:
+            next_url = url_for(endpoint, cursor=next_cursor,
+                               _external=True, **values)
+    else:
+        if pagination.has_prev:
+            prev_url = url_for(endpoint, page=pagination.prev_num,
+                               _external=True, **values)
+        if pagination.has_next:
+            next_url = url_for(endpoint, page=pagination.next_num,
+                               _external=True, **values)
+    return {
+        'prev': prev_url,
+        'next': next_url,
+        'prev_cursor': prev_cursor,
+        'next_cursor': next_cursor,
+        'count': pagination.total,
+    }
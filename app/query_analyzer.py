@@ -0,0 +1,188 @@
+import re
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+from flask_sqlalchemy import get_debug_queries
+
+from .cache import LRUCache
+from .metrics import check_internal
+
+
+_COMMENT = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAMETER = re.compile(r'%\(\w+\)s|%s|(?<!:):\w+|\?')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """Normalize ``statement`` so queries that differ only in values match.
+
+    Literals and bound parameters become ``?`` and lists of them, as in
+    ``IN (?, ?, ?)``, become ``(...)``.
+    """
+    statement = _COMMENT.sub(' ', statement)
+    statement = _STRING.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    statement = _PARAMETER.sub('?', statement)
+    statement = _LIST.sub('(...)', statement)
+    return _SPACE.sub(' ', statement).strip()
+
+
+class _State(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fingerprints = LRUCache(1024)
+        # [(start time, {(endpoint, fingerprint): [count, duration,
+        #   requests, max repeats]}, flagged keys)], oldest first
+        self.slots = []
+
+
+class QueryAnalyzer(object):
+    """Groups the queries of each request by fingerprint and endpoint.
+
+    Every request adds the count and time of each fingerprint it ran to a
+    rolling ``APP_QUERY_REPORT_WINDOW`` second window, split in
+    ``APP_QUERY_REPORT_SLOTS`` slots that expire one at a time. A
+    fingerprint repeated ``APP_QUERY_REPEAT_THRESHOLD`` times in one
+    request is logged as a likely N+1 query, once per endpoint and slot,
+    and statements slower than ``APP_SLOW_DB_QUERY_TIME`` are logged as
+    before. The top fingerprints of the window, per process, are served
+    as JSON at ``/metrics/queries``.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('APP_SLOW_DB_QUERY_TIME', 0.5)
+        app.config.setdefault('APP_QUERY_REPEAT_THRESHOLD', 10)
+        app.config.setdefault('APP_QUERY_REPORT_WINDOW', 600)
+        app.config.setdefault('APP_QUERY_REPORT_SLOTS', 10)
+        app.config.setdefault('APP_QUERY_REPORT_SIZE', 20)
+        app.extensions['query_analyzer'] = _State()
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown)
+        app.add_url_rule('/metrics/queries', 'query_report', self.view)
+
+    def _state(self):
+        return current_app.extensions['query_analyzer']
+
+    def _fingerprint(self, state, statement):
+        result = state.fingerprints.get(statement)
+        if result is None:
+            result = fingerprint(statement)
+            state.fingerprints.set(statement, result)
+        return result
+
+    def _slot(self, state, now):
+        # Called with the lock held; returns the slot ``now`` falls in.
+        config = current_app.config
+        length = float(config['APP_QUERY_REPORT_WINDOW']) / \
+            config['APP_QUERY_REPORT_SLOTS']
+        start = now - now % length
+        if not state.slots or state.slots[-1][0] != start:
+            state.slots.append((start, {}, set()))
+        window_start = now - config['APP_QUERY_REPORT_WINDOW']
+        while state.slots[0][0] + length <= window_start:
+            state.slots.pop(0)
+        return state.slots[-1]
+
+    def record(self, endpoint, queries):
+        """Add the queries run by one request to the report."""
+        config = current_app.config
+        state = self._state()
+        slow_time = config['APP_SLOW_DB_QUERY_TIME']
+        groups = {}
+        for query in queries:
+            key = self._fingerprint(state, query.statement)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [0, 0.0]
+            group[0] += 1
+            group[1] += query.duration
+            if query.duration >= slow_time:
+                current_app.logger.warning(
+                    'Slow query: {}\nParameters: {}\nDuration: {}\n'
+                    'Context: {}\n'.format(query.statement, query.parameters,
+                                           query.duration, query.context)
+                )
+        threshold = config['APP_QUERY_REPEAT_THRESHOLD']
+        repeated = []
+        with state.lock:
+            start, stats, flagged = self._slot(state, time.time())
+            for key, (count, duration) in groups.items():
+                entry = stats.get((endpoint, key))
+                if entry is None:
+                    entry = stats[(endpoint, key)] = [0, 0.0, 0, 0]
+                entry[0] += count
+                entry[1] += duration
+                entry[2] += 1
+                entry[3] = max(entry[3], count)
+                if count >= threshold and (endpoint, key) not in flagged:
+                    flagged.add((endpoint, key))
+                    repeated.append((key, count, duration))
+        for key, count, duration in repeated:
+            current_app.logger.warning(
+                'Possible N+1 query in {}: {} runs taking {:.3f}s of\n'
+                '{}\n'.format(endpoint, count, duration, key)
+            )
+
+    def report(self, size=None, order='duration'):
+        """Return the top fingerprints of the rolling window.
+
+        Entries are ordered by ``duration``, ``count`` or ``repeats``
+        (the most runs in a single request), highest first.
+        """
+        size = size or current_app.config['APP_QUERY_REPORT_SIZE']
+        state = self._state()
+        totals = {}
+        with state.lock:
+            self._slot(state, time.time())
+            for start, stats, flagged in state.slots:
+                for key, (count, duration, requests, repeats) in \
+                        stats.items():
+                    total = totals.get(key)
+                    if total is None:
+                        total = totals[key] = [0, 0.0, 0, 0]
+                    total[0] += count
+                    total[1] += duration
+                    total[2] += requests
+                    total[3] = max(total[3], repeats)
+        entries = [{
+            'endpoint': endpoint,
+            'fingerprint': key,
+            'count': count,
+            'duration': duration,
+            'requests': requests,
+            'per_request': float(count) / requests,
+            'repeats': repeats,
+        } for (endpoint, key), (count, duration, requests, repeats)
+            in totals.items()]
+        entries.sort(key=lambda entry: entry[order], reverse=True)
+        return entries[:size]
+
+    def _before_request(self):
+        # the recorded queries belong to the application context, which
+        # can outlive a request
+        g.query_analyzer_offset = len(get_debug_queries())
+
+    def _teardown(self, exc):
+        if 'query_analyzer_offset' in g and \
+                current_app.config.get('SQLALCHEMY_RECORD_QUERIES'):
+            self.record(request.endpoint or '',
+                        get_debug_queries()[g.query_analyzer_offset:])
+
+    def view(self):
+        check_internal()
+        order = request.args.get('order', 'duration')
+        if order not in ('duration', 'count', 'repeats'):
+            order = 'duration'
+        return jsonify({
+            'window': current_app.config['APP_QUERY_REPORT_WINDOW'],
+            'queries': self.report(request.args.get('size', type=int),
+                                   order),
+        })
@@ -0,0 +1,57 @@
+import hashlib
+import threading
+
+import bleach
+from markdown import markdown
+
+from .cache import LRUCache
+
+
+# Bump whenever the Markdown/bleach pipeline changes its output, so cached
+# renderings from the previous pipeline are no longer used.
+RENDERER_VERSION = 1
+
+
+class BodyRenderer(object):
+    """Markdown to sanitized HTML renderer with a content-addressed cache.
+
+    Results are keyed by a hash of the body, the allowed tags and the
+    renderer version, so identical bodies are only rendered once per
+    process.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.cache = LRUCache(maxsize)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(body, allowed_tags):
+        data = u'\0'.join([u'{}'.format(RENDERER_VERSION),
+                           u','.join(sorted(allowed_tags)), body])
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def render(self, body, allowed_tags):
+        key = self.key(body, allowed_tags)
+        html = self.cache.get(key)
+        with self._lock:
+            if html is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if html is None:
+            html = bleach.linkify(bleach.clean(
+                markdown(body, output_format='html'),
+                tags=allowed_tags,
+                strip=True,
+            ))
+            self.cache.set(key, html)
+        return html
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.cache)}
+
+
+renderer = BodyRenderer()
@@ -0,0 +1,204 @@
+import re
+
+from flask import current_app
+
+from . import db
+from .exceptions import ValidationError
+from .models import Comment, Post
+from .pagination import KeysetPagination, decode_cursor, encode_cursor
+
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+# Text search configuration of the PostgreSQL indexes; queries must use the
+# same one for the planner to pick the index up.
+LANGUAGE = 'english'
+
+# Searchable models by kind, with the name of their SQLite FTS5 table and
+# PostgreSQL GIN index.
+KINDS = {
+    'posts': (Post, 'posts_fts', 'ix_posts_body_tsv'),
+    'comments': (Comment, 'comments_fts', 'ix_comments_body_tsv'),
+}
+
+
+def _dialect(bind=None):
+    return (bind or db.engine).dialect.name
+
+
+def _model(kind):
+    try:
+        return KINDS[kind]
+    except KeyError:
+        raise ValidationError('cannot search {}'.format(kind))
+
+
+def terms(q):
+    return _WORD.findall(q or '')
+
+
+def _tsvector(table):
+    return "to_tsvector('{}', coalesce({}.body, ''))".format(LANGUAGE, table)
+
+
+def create_index(connection, kind):
+    """Create the full-text index of ``kind`` for the connected database."""
+    model, fts_table, gin_index = _model(kind)
+    table = model.__tablename__
+    dialect = _dialect(connection)
+    if dialect == 'sqlite':
+        connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS {} USING "
+            "fts5(body, tokenize='porter unicode61')".format(fts_table))
+    elif dialect == 'postgresql':
+        # checked by hand, CREATE INDEX IF NOT EXISTS needs PostgreSQL 9.5
+        exists = connection.execute(db.text(
+            "SELECT 1 FROM pg_class WHERE relname = :name AND relkind = 'i'"
+        ), name=gin_index).first()
+        if exists is None:
+            connection.execute('CREATE INDEX {} ON {} USING gin ({})'.format(
+                gin_index, table, _tsvector(table)))
+
+
+def drop_index(connection, kind):
+    model, fts_table, gin_index = _model(kind)
+    if _dialect(connection) == 'sqlite':
+        connection.execute('DROP TABLE IF EXISTS {}'.format(fts_table))
+
+
+def rebuild(kind, chunk_size=10000, progress=None):
+    """Rebuild the full-text index of ``kind`` and return the rows indexed.
+
+    SQLite copies bodies into the FTS5 table a chunk of ids at a time;
+    PostgreSQL's expression index is rebuilt with ``REINDEX``.
+    """
+    model, fts_table, gin_index = _model(kind)
+    table = model.__table__
+    dialect = _dialect()
+    if dialect == 'postgresql':
+        with db.engine.begin() as connection:
+            create_index(connection, kind)
+            connection.execute('REINDEX INDEX {}'.format(gin_index))
+        return None
+    if dialect != 'sqlite':
+        return None
+    with db.engine.begin() as connection:
+        create_index(connection, kind)
+        connection.execute('DELETE FROM {}'.format(fts_table))
+    max_id = db.session.query(db.func.max(table.c.id)).scalar() or 0
+    indexed = 0
+    for start in range(0, max_id, chunk_size):
+        with db.engine.begin() as connection:
+            result = connection.execute(db.text(
+                'INSERT INTO {} (rowid, body) SELECT id, body FROM {} '
+                'WHERE id > :start AND id <= :end AND body IS NOT NULL'
+                .format(fts_table, table.name)),
+                start=start, end=start + chunk_size)
+            indexed += result.rowcount
+        if progress is not None:
+            progress(kind, min(start + chunk_size, max_id), max_id)
+    return indexed
+
+
+def index_row(connection, kind, id, body, replace=False):
+    """Add one row to the SQLite FTS5 table of ``kind``.
+
+    ``replace`` drops the entry indexed for the row before. Other
+    databases index the table itself and need nothing here.
+    """
+    if _dialect(connection) != 'sqlite':
+        return
+    if replace:
+        unindex_row(connection, kind, id)
+    if body is not None:
+        connection.execute(db.text(
+            'INSERT INTO {} (rowid, body) VALUES (:id, :body)'
+            .format(_model(kind)[1])), id=id, body=body)
+
+
+def index_rows(connection, kind, rows):
+    """Add ``(id, body)`` rows to the SQLite FTS5 table with one insert."""
+    rows = [{'id': id, 'body': body} for id, body in rows
+            if body is not None]
+    if _dialect(connection) != 'sqlite' or not rows:
+        return
+    connection.execute(db.text(
+        'INSERT INTO {} (rowid, body) VALUES (:id, :body)'
+        .format(_model(kind)[1])), rows)
+
+
+def unindex_row(connection, kind, id):
+    if _dialect(connection) != 'sqlite':
+        return
+    connection.execute(db.text(
+        'DELETE FROM {} WHERE rowid = :id'.format(_model(kind)[1])), id=id)
+
+
+def _matches(kind, words):
+    # Returns a selectable of (id, score) pairs, lower scores rank first.
+    # Scores go into cursors and are compared with the scores of the next
+    # query, so they must survive the round trip through JSON exactly.
+    model, fts_table, gin_index = _model(kind)
+    table = model.__tablename__
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        match = ' '.join('"{}"'.format(word) for word in words)
+        return db.text(
+            'SELECT rowid AS id, bm25({0}) AS score FROM {0} '
+            'WHERE {0} MATCH :match'.format(fts_table)
+        ).bindparams(match=match)\
+            .columns(db.column('id'), db.column('score'))
+    if dialect == 'postgresql':
+        # ts_rank returns a real, whose text form is rounded; rank by
+        # millionths as a bigint instead
+        return db.text(
+            "SELECT id, -round(ts_rank({0}, plainto_tsquery('{2}', :match))"
+            " * 1000000)::bigint AS score FROM {1} "
+            "WHERE {0} @@ plainto_tsquery('{2}', :match)"
+            .format(_tsvector(table), table, LANGUAGE)
+        ).bindparams(match=' '.join(words))\
+            .columns(db.column('id'), db.column('score'))
+    # no full-text support, fall back to scanning
+    columns = model.__table__.c
+    return db.select([columns.id.label('id'),
+                      db.literal(0.0).label('score')])\
+        .where(db.and_(*[columns.body.contains(word) for word in words]))
+
+
+def search(kind, q, cursor=None, per_page=None):
+    """Return a page of ``kind`` matching the words of ``q``, best first.
+
+    Results are keyset paginated on ``(score, id)``; only forward
+    cursors are issued.
+    """
+    model = _model(kind)[0]
+    words = terms(q)
+    per_page = per_page or current_app.config['APP_SEARCH_RESULTS_PER_PAGE']
+    if not words:
+        return KeysetPagination([], per_page)
+    matches = _matches(kind, words).alias('matches')
+    query = db.select([matches.c.id, matches.c.score])
+    if kind == 'comments':
+        comments = Comment.__table__
+        query = query.select_from(matches.join(
+            comments, comments.c.id == matches.c.id))\
+            .where(comments.c.disabled.isnot(True))
+    if cursor:
+        direction, (score, id) = decode_cursor(cursor, (float, int))
+        if direction != 'next':
+            raise ValidationError('invalid cursor')
+        query = query.where(db.or_(
+            matches.c.score > score,
+            db.and_(matches.c.score == score, matches.c.id > id)))
+    rows = db.session.execute(
+        query.order_by(matches.c.score, matches.c.id).limit(per_page + 1)
+    ).fetchall()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    objects = dict((item.id, item) for item in model.query.filter(
+        model.id.in_([row.id for row in rows]))) if rows else {}
+    items = [objects[row.id] for row in rows if row.id in objects]
+    next_cursor = None
+    if more:
+        next_cursor = encode_cursor('next', [rows[-1].score, rows[-1].id])
+    return KeysetPagination(items, per_page, next_cursor=next_cursor)
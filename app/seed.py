@@ -0,0 +1,253 @@
+import bisect
+import hashlib
+import itertools
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+from forgery_py import dictionaries_loader
+from werkzeug.security import generate_password_hash
+
+from . import db, search
+from .models import (Comment, Follow, Post, Role, TimelineEntry, User,
+                     insert_returning)
+
+
+class Seeder(object):
+    """Bulk generator of synthetic users, follows, posts and comments.
+
+    Rows are written with core ``executemany`` inserts of ``batch_size``
+    rows, bypassing the ORM and its per-row events; the ids of new users
+    and posts are read back from the database rather than predicted. The
+    denormalized counters are tallied while generating and written in
+    bulk, and the timelines are rebuilt once at the end. The same
+    ``seed``, ``now`` and sizes always produce the same dataset.
+
+    Follows and authorship follow a Zipf-like distribution: a few users
+    attract most followers and write most posts, as on real networks.
+    """
+
+    def __init__(self, seed=0, batch_size=5000, skew=1.1, days=365,
+                 password='password', now=None, progress=None):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.skew = skew
+        self.days = days
+        self.password = password
+        self.now = now or datetime.utcnow()
+        self.progress = progress
+        self.counts = dict((name, Counter()) for name in (
+            'post_count', 'follower_count', 'followed_count',
+            'comment_count'))
+        self.sentences = [s.strip() for s in
+                          dictionaries_loader.get_dictionary('lorem_ipsum')]
+        self.first_names = [n.strip() for n in
+                            dictionaries_loader.get_dictionary(
+                                'male_first_names') +
+                            dictionaries_loader.get_dictionary(
+                                'female_first_names')]
+        self.last_names = [n.strip() for n in
+                           dictionaries_loader.get_dictionary('last_names')]
+        self.cities = [c.strip() for c in
+                       dictionaries_loader.get_dictionary('cities')]
+
+    def run(self, users=1000, posts=10000, comments=20000, follows=20,
+            chunk_size=1000):
+        """Generate a full dataset and return the ids of the new users."""
+        Role.insert_roles()
+        user_ids = self.users(users)
+        self.follows(user_ids, follows)
+        post_ids = self.posts(user_ids, posts)
+        self.comments(user_ids, post_ids, comments)
+        self.write_counts()
+        TimelineEntry.rebuild(
+            chunk_size=chunk_size,
+            progress=lambda done, total, inserted: self._report(
+                'timelines', done, total))
+        # rows are inserted without the ORM, so the search listeners did
+        # not see them
+        for kind in ('posts', 'comments'):
+            search.rebuild(kind, progress=lambda kind, done, total:
+                           self._report('search ' + kind, done, total))
+        return user_ids
+
+    def users(self, count):
+        table = User.__table__
+        role_id = Role.query.filter_by(default=True).first().id
+        password_hash = generate_password_hash(self.password)
+        # only numbers the usernames; ids are whatever the database assigns
+        first = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+
+        def rows():
+            for n in range(first, first + count):
+                email = 'user{}@example.com'.format(n)
+                member_since = self._timestamp()
+                yield {
+                    'email': email,
+                    'username': 'user{}'.format(n),
+                    'password_hash': password_hash,
+                    'role_id': role_id,
+                    'confirmed': True,
+                    'name': '{} {}'.format(
+                        self.random.choice(self.first_names),
+                        self.random.choice(self.last_names)),
+                    'location': self.random.choice(self.cities),
+                    'about_me': self.random.choice(self.sentences),
+                    'member_since': member_since,
+                    'last_seen': member_since,
+                    'avatar_hash': hashlib.md5(
+                        email.encode('utf-8')).hexdigest(),
+                    'timeline_pull': False,
+                    'timeline_refill': False,
+                    'post_count': 0,
+                    'follower_count': 0,
+                    'followed_count': 0,
+                }
+
+        return [row[0] for row in self._insert(
+            'users', table, rows(), count, returning=[table.c.id])]
+
+    def follows(self, user_ids, mean):
+        """Make every user follow itself and a power-law sample of others.
+
+        Out-degrees are Pareto distributed around ``mean``; targets are
+        drawn with probability proportional to a per-user popularity.
+        """
+        if not user_ids:
+            return
+        choose = self._chooser(user_ids)
+        limit = len(user_ids) - 1
+
+        def rows():
+            for user_id in user_ids:
+                yield {'follower_id': user_id, 'followed_id': user_id,
+                       'timestamp': self.now}
+                self._count_follow(user_id, user_id)
+                degree = min(limit, int(
+                    self.random.paretovariate(2.0) * mean / 2.0))
+                followed = set()
+                for attempt in range(degree * 3):
+                    if len(followed) >= degree:
+                        break
+                    target = choose()
+                    if target != user_id:
+                        followed.add(target)
+                for target in sorted(followed):
+                    yield {'follower_id': user_id, 'followed_id': target,
+                           'timestamp': self._timestamp()}
+                    self._count_follow(user_id, target)
+
+        self._insert('follows', Follow.__table__, rows())
+
+    def posts(self, user_ids, count):
+        table = Post.__table__
+        choose = self._chooser(user_ids)
+
+        def rows():
+            for i in range(count):
+                body = self._text(1, 4)
+                author_id = choose()
+                self.counts['post_count'][author_id] += 1
+                yield {
+                    'body': body,
+                    'body_html': '<p>{}</p>'.format(body),
+                    'timestamp': self._timestamp(),
+                    'author_id': author_id,
+                    'comment_count': 0,
+                }
+
+        return [tuple(row) for row in self._insert(
+            'posts', table, rows(), count,
+            returning=[table.c.id, table.c.timestamp])]
+
+    def comments(self, user_ids, posts, count):
+        if not posts:
+            return
+        choose_author = self._chooser(user_ids)
+        choose_post = self._chooser(posts)
+
+        def rows():
+            for i in range(count):
+                post_id, posted = choose_post()
+                self.counts['comment_count'][post_id] += 1
+                body = self._text(1, 2)
+                age = (self.now - posted).total_seconds()
+                yield {
+                    'body': body,
+                    'body_html': '<p>{}</p>'.format(body),
+                    'timestamp': posted + timedelta(
+                        seconds=self.random.uniform(0, age)),
+                    'disabled': False,
+                    'author_id': choose_author(),
+                    'post_id': post_id,
+                }
+
+        self._insert('comments', Comment.__table__, rows(), count)
+
+    def write_counts(self):
+        """Store the tallied counters with one ``UPDATE`` per batch."""
+        for name, counts in sorted(self.counts.items()):
+            table = (Post if name == 'comment_count' else User).__table__
+            ids = sorted(counts)
+            for i in range(0, len(ids), self.batch_size):
+                chunk = dict((id, counts[id])
+                             for id in ids[i:i + self.batch_size])
+                db.session.execute(
+                    table.update().where(table.c.id.in_(list(chunk)))
+                    .values({name: db.case(chunk, value=table.c.id)})
+                )
+                db.session.commit()
+                self._report(name, min(i + self.batch_size, len(ids)),
+                             len(ids))
+
+    def _count_follow(self, follower_id, followed_id):
+        self.counts['followed_count'][follower_id] += 1
+        self.counts['follower_count'][followed_id] += 1
+
+    def _chooser(self, items):
+        # Zipf weights over a shuffled order, so popularity is not tied to
+        # ids; bisect over the cumulative weights picks in O(log n).
+        order = list(items)
+        self.random.shuffle(order)
+        weights = list(itertools.accumulate(
+            1.0 / (rank + 1) ** self.skew for rank in range(len(order))))
+        total = weights[-1] if weights else 0
+        last = len(order) - 1
+
+        def choose():
+            return order[min(last, bisect.bisect(
+                weights, self.random.random() * total))]
+        return choose
+
+    def _timestamp(self):
+        return self.now - timedelta(
+            seconds=self.random.randint(0, self.days * 86400))
+
+    def _text(self, low, high):
+        return ' '.join(self.random.choice(self.sentences)
+                        for i in range(self.random.randint(low, high)))
+
+    def _insert(self, name, table, rows, total=None, returning=None):
+        """Insert ``rows`` a batch per transaction.
+
+        With ``returning`` columns, returns their values for the inserted
+        rows, in insertion order.
+        """
+        inserted = []
+        done = 0
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                break
+            if returning is None:
+                db.session.execute(table.insert(), batch)
+            else:
+                inserted.extend(insert_returning(table, batch, returning))
+            db.session.commit()
+            done += len(batch)
+            self._report(name, done, total or done)
+        return inserted
+
+    def _report(self, stage, done, total):
+        if self.progress is not None:
+            self.progress(stage, done, total)
@@ -0,0 +1 @@
+"""Performance benchmarks, run with ``manage.py bench``."""
@@ -0,0 +1,451 @@
+import base64
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from http.client import BadStatusLine, HTTPConnection
+from urllib.parse import urlencode, urlsplit
+
+from .stats import compare, summarize
+
+
+# scenario: weight in the default traffic mix
+DEFAULT_MIX = {
+    'timeline': 30,
+    'profile': 15,
+    'post': 20,
+    'api_timeline': 20,
+    'comment': 10,
+    'token': 5,
+}
+
+_CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+_QUERY_SAMPLE = re.compile(
+    r'^app_request_queries_(sum|count)\{endpoint="([^"]*)"\} (\S+)$', re.M)
+
+
+class WSGISession(object):
+    """A user of the application object, through the Werkzeug client."""
+
+    def __init__(self, app):
+        self.client = app.test_client(use_cookies=True)
+
+    def request(self, method, path, headers=None, data=None):
+        response = self.client.open(path, method=method,
+                                    headers=headers or {}, data=data)
+        return response.status_code, response.get_data()
+
+
+class HTTPSession(object):
+    """A user of a running server, over one keep-alive connection."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, method, path, headers=None, data=None):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(
+                '{}={}'.format(k, v) for k, v in self.cookies.items())
+        if isinstance(data, dict):
+            data = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        for attempt in (1, 2):
+            reused = self.connection is not None
+            if not reused:
+                self.connection = HTTPConnection(self.host, self.port)
+            try:
+                self.connection.request(method, self.prefix + path,
+                                        body=data, headers=headers)
+            except (IOError, OSError):
+                # the server closed the kept-alive connection before the
+                # request went out
+                self._close()
+                if reused:
+                    continue
+                raise
+            try:
+                response = self.connection.getresponse()
+                body = response.read()
+                break
+            except (IOError, OSError, BadStatusLine):
+                # The server may have closed the kept-alive connection
+                # without reading the request, but it may as well have
+                # handled it: only requests that are safe to send twice
+                # are retried.
+                self._close()
+                if not reused or method not in ('GET', 'HEAD'):
+                    raise
+        for cookie in response.msg.get_all('Set-Cookie') or []:
+            name, _, value = cookie.split(';', 1)[0].partition('=')
+            self.cookies[name.strip()] = value.strip()
+        return response.status, body
+
+    def _close(self):
+        self.connection.close()
+        self.connection = None
+
+
+def _basic_auth(username, password=''):
+    credentials = '{}:{}'.format(username, password).encode('utf-8')
+    return {'Authorization': 'Basic ' + base64.b64encode(credentials)
+            .decode('ascii'), 'Accept': 'application/json'}
+
+
+class VirtualUser(object):
+    """A seeded user logged in to both the web pages and the API."""
+
+    def __init__(self, session, user, password):
+        self.session = session
+        self.id, self.email, self.username = user
+        self.password = password
+        self.token = None
+
+    def login(self):
+        status, body = self.session.request('GET', '/auth/login')
+        form = {'email': self.email, 'password': self.password}
+        match = _CSRF_TOKEN.search(body.decode('utf-8'))
+        if match:
+            form['csrf_token'] = match.group(1)
+        status, body = self.session.request('POST', '/auth/login',
+                                            data=form)
+        # a successful login redirects, a failed one renders the form again
+        if status != 302 or self.fetch_token() != 200:
+            raise ValueError(
+                'cannot log in as {}; the benchmark expects users seeded with '
+                'the password {!r}'.format(self.email, self.password))
+        self.session.request('GET', '/followed')
+
+    def fetch_token(self):
+        status, body = self.session.request(
+            'GET', '/api/v1.0/token',
+            headers=_basic_auth(self.email, self.password))
+        if status == 200:
+            self.token = json.loads(body.decode('utf-8'))['token']
+        return status
+
+    def api(self, method, path, data=None):
+        headers = _basic_auth(self.token or '')
+        if data is not None:
+            headers['Content-Type'] = 'application/json'
+            data = json.dumps(data)
+        return self.session.request(method, '/api/v1.0' + path, headers,
+                                    data)[0]
+
+
+def timeline(user, dataset, rng):
+    return user.session.request('GET', '/')[0]
+
+
+def profile(user, dataset, rng):
+    return user.session.request(
+        'GET', '/user/' + rng.choice(dataset['users'])[2])[0]
+
+
+def post(user, dataset, rng):
+    return user.session.request(
+        'GET', '/post/{}'.format(rng.choice(dataset['posts'])))[0]
+
+
+def api_timeline(user, dataset, rng):
+    return user.api('GET', '/users/{}/timeline/'.format(user.id))
+
+
+def comment(user, dataset, rng):
+    return user.api('POST', '/posts/{}/comments/'.format(
+        rng.choice(dataset['posts'])), {'body': 'Benchmark comment'})
+
+
+def token(user, dataset, rng):
+    return user.fetch_token()
+
+
+SCENARIOS = {
+    'timeline': timeline,
+    'profile': profile,
+    'post': post,
+    'api_timeline': api_timeline,
+    'comment': comment,
+    'token': token,
+}
+
+
+def parse_mix(value):
+    """Parse ``timeline=30,post=20`` into a scenario weight dict."""
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError('unknown scenario {}'.format(name))
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def scrape_queries(session, token):
+    """Return ``{endpoint: [queries, requests]}`` from ``/metrics``."""
+    status, body = session.request(
+        'GET', '/metrics', {'Authorization': 'Bearer {}'.format(token)})
+    totals = {}
+    if status != 200:
+        return totals
+    for kind, endpoint, value in _QUERY_SAMPLE.findall(
+            body.decode('utf-8')):
+        if endpoint.startswith('metrics') or endpoint == 'query_report':
+            continue
+        total = totals.setdefault(endpoint, [0.0, 0])
+        if kind == 'sum':
+            total[0] += float(value)
+        else:
+            total[1] += int(value)
+    return totals
+
+
+def _query_delta(before, after):
+    delta = {}
+    for endpoint, (queries, requests) in after.items():
+        old_queries, old_requests = before.get(endpoint, (0.0, 0))
+        if requests > old_requests:
+            delta[endpoint] = [queries - old_queries,
+                               requests - old_requests]
+    return delta
+
+
+def _worker(options):
+    rng = random.Random(options['seed'])
+    dataset = options['dataset']
+    token = options['metrics_token']
+    if options['url']:
+        def new_session():
+            return HTTPSession(options['url'])
+    else:
+        from app import create_app
+        app = create_app(options['config'])
+        if not app.config['APP_METRICS_TOKEN']:
+            app.config['APP_METRICS_TOKEN'] = uuid.uuid4().hex
+        # keep the snapshots of the deployment and of the other benchmark
+        # processes out of the queries this process reports
+        app.config['APP_METRICS_DIR'] = None
+        token = app.config['APP_METRICS_TOKEN']
+
+        def new_session():
+            return WSGISession(app)
+    names = sorted(options['mix'])
+    weights = [options['mix'][name] for name in names]
+    cumulative = [sum(weights[:i + 1]) for i in range(len(weights))]
+
+    def pick():
+        r = rng.uniform(0, cumulative[-1])
+        for name, bound in zip(names, cumulative):
+            if r <= bound:
+                return name
+        return names[-1]
+
+    barrier = options['barrier']
+    try:
+        users = [VirtualUser(new_session(), user, options['password'])
+                 for user in rng.sample(dataset['users'],
+                                        min(options['sessions'],
+                                            len(dataset['users'])))]
+        for user in users:
+            user.login()
+        for i in range(options['warmup']):
+            SCENARIOS[pick()](rng.choice(users), dataset, rng)
+    except BaseException:
+        if barrier is not None:
+            barrier.abort()
+        raise
+    if barrier is not None:
+        # every worker has warmed up; the parent scrapes /metrics and
+        # releases them
+        barrier.wait()
+        barrier.wait()
+    before = None if options['url'] else \
+        scrape_queries(users[0].session, token)
+    latencies = dict((name, []) for name in names)
+    errors = dict((name, 0) for name in names)
+    deadline = time.time() + options['duration']
+    while time.time() < deadline:
+        name = pick()
+        start = time.time()
+        try:
+            status = SCENARIOS[name](rng.choice(users), dataset, rng)
+        except (IOError, OSError):
+            status = None
+        latencies[name].append(time.time() - start)
+        if status is None or status >= 400:
+            errors[name] += 1
+    queries = None
+    if before is not None:
+        queries = _query_delta(before,
+                               scrape_queries(users[0].session, token))
+    return latencies, errors, queries
+
+
+def _scrape_after_warmup(scraper, token, barrier, outcome):
+    try:
+        barrier.wait()
+        try:
+            before = scrape_queries(scraper, token)
+        except BaseException:
+            barrier.abort()
+            raise
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        # a worker failed, raise its error instead
+        outcome.get()
+        raise
+    return before
+
+
+def load_dataset(limit=1000):
+    """Sample the seeded users and posts the virtual users will use."""
+    from app import db
+    from app.models import Post, User
+
+    users = [tuple(row) for row in db.session.query(
+        User.id, User.email, User.username).filter(User.confirmed.is_(True))
+        .order_by(db.func.random()).limit(limit)]
+    posts = [row[0] for row in db.session.query(Post.id)
+             .order_by(db.func.random()).limit(limit)]
+    return {'users': users, 'posts': posts}
+
+
+def run(config='default', url=None, processes=4, duration=30, mix=None,
+        sessions=10, warmup=20, password='password', seed=0, dataset=None,
+        metrics_token=None, progress=None):
+    """Replay a traffic mix and return the results as a JSON-able dict.
+
+    Without ``url`` every process drives its own instance of the
+    application through the WSGI interface; with it, requests go to a
+    running server. Each process runs ``sessions`` logged in users and
+    issues one request at a time for ``duration`` seconds. Queries per
+    request are read from ``/metrics``; a running server is only scraped
+    when ``metrics_token`` matches its ``APP_METRICS_TOKEN``.
+    """
+    mix = parse_mix(mix) if not isinstance(mix, dict) else mix
+    dataset = dataset or load_dataset()
+    if not dataset['users'] or not dataset['posts']:
+        raise ValueError('the database has no users or posts to use')
+    scraper = manager = barrier = None
+    if url:
+        # the workers wait for each other after the warmup, so that
+        # /metrics of the server can be scraped before the measured run
+        scraper = HTTPSession(url)
+        manager = multiprocessing.Manager()
+        barrier = manager.Barrier(processes + 1)
+    options = [{
+        'config': config,
+        'url': url,
+        'dataset': dataset,
+        'mix': mix,
+        'sessions': sessions,
+        'warmup': warmup,
+        'duration': duration,
+        'password': password,
+        'seed': seed * 1000 + i,
+        'metrics_token': metrics_token,
+        'barrier': barrier,
+    } for i in range(processes)]
+    if progress is not None:
+        progress('Running {} processes for {}s'.format(processes, duration))
+    start = time.time()
+    pool = multiprocessing.Pool(processes)
+    try:
+        outcome = pool.map_async(_worker, options)
+        if scraper is not None:
+            before = _scrape_after_warmup(scraper, metrics_token, barrier,
+                                          outcome)
+        outcomes = outcome.get()
+    finally:
+        pool.close()
+        pool.join()
+        if manager is not None:
+            manager.shutdown()
+    elapsed = time.time() - start
+    latencies = dict((name, []) for name in mix)
+    errors = dict((name, 0) for name in mix)
+    queries = {}
+    for worker_latencies, worker_errors, worker_queries in outcomes:
+        for name in mix:
+            latencies[name].extend(worker_latencies[name])
+            errors[name] += worker_errors[name]
+        for endpoint, (count, requests) in (worker_queries or {}).items():
+            total = queries.setdefault(endpoint, [0.0, 0])
+            total[0] += count
+            total[1] += requests
+    if scraper is not None:
+        queries = _query_delta(before, scrape_queries(scraper,
+                                                      metrics_token))
+    scenarios = {}
+    for name in sorted(mix):
+        scenarios[name] = summarize(latencies[name])
+        scenarios[name]['errors'] = errors[name]
+        scenarios[name]['rps'] = len(latencies[name]) / float(duration)
+    everything = [value for values in latencies.values() for value in values]
+    scenarios['all'] = summarize(everything)
+    scenarios['all']['errors'] = sum(errors.values())
+    scenarios['all']['rps'] = len(everything) / float(duration)
+    all_queries = [sum(q[0] for q in queries.values()),
+                   sum(q[1] for q in queries.values())]
+    queries['all'] = all_queries
+    return {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'target': url or 'wsgi',
+            'config': config,
+            'processes': processes,
+            'sessions': sessions,
+            'duration': duration,
+            'elapsed': elapsed,
+            'mix': mix,
+            'users': len(dataset['users']),
+            'posts': len(dataset['posts']),
+        },
+        'scenarios': scenarios,
+        'queries_per_request': dict(
+            (endpoint, count / requests if requests else None)
+            for endpoint, (count, requests) in queries.items()),
+    }
+
+
+def format_results(results):
+    lines = ['{:<14} {:>8} {:>7} {:>8} {:>9} {:>9} {:>9}'.format(
+        'scenario', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms',
+        'p99 ms')]
+    for name, row in sorted(results['scenarios'].items(),
+                            key=lambda item: item[0] == 'all'):
+        if not row['count']:
+            continue
+        lines.append('{:<14} {:>8} {:>7} {:>8.1f} {:>9.1f} {:>9.1f} '
+                     '{:>9.1f}'.format(name, row['count'], row['errors'],
+                                       row['rps'], row['p50'] * 1000,
+                                       row['p95'] * 1000, row['p99'] * 1000))
+    lines.append('')
+    lines.append('{:<40} {:>8}'.format('endpoint', 'queries'))
+    for endpoint, value in sorted(results['queries_per_request'].items()):
+        if value is not None:
+            lines.append('{:<40} {:>8.1f}'.format(endpoint, value))
+    return '\n'.join(lines)
+
+
+# (metric, higher is better)
+COMPARED_METRICS = (('p50', False), ('p95', False), ('p99', False),
+                    ('rps', True))
+
+
+def compare_results(results, baseline, threshold=10.0):
+    return compare(results['scenarios'], baseline['scenarios'],
+                   COMPARED_METRICS, threshold)
@@ -0,0 +1,288 @@
+import gc
+import itertools
+import platform
+import random
+import timeit
+from datetime import datetime
+
+from .stats import change, mann_whitney, percentile
+
+
+BODY_SIZES = (100, 1000, 10000)
+BATCH_SIZES = (1, 20, 100)
+
+# registered benchmarks: (name, params, factory)
+BENCHMARKS = []
+
+_WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+          'eiusmod tempor incididunt ut labore et dolore magna aliqua').split()
+
+
+def benchmark(name, params=(None,)):
+    """Register ``factory(param)``, which returns the callable to time."""
+    def decorator(factory):
+        BENCHMARKS.append((name, params, factory))
+        return factory
+    return decorator
+
+
+def _markdown(size, rng):
+    # paragraphs with the inline markup, links and lists posts use
+    parts = []
+    length = 0
+    while length < size:
+        words = [rng.choice(_WORDS) for i in range(rng.randint(8, 20))]
+        words[rng.randrange(len(words))] = '*{}*'.format(rng.choice(_WORDS))
+        words[rng.randrange(len(words))] = 'http://example.com/{}'.format(
+            rng.choice(_WORDS))
+        if rng.random() < 0.3:
+            part = '\n'.join('- ' + word for word in words[:4])
+        else:
+            part = ' '.join(words)
+        parts.append(part)
+        length += len(part) + 2
+    return '\n\n'.join(parts)[:size]
+
+
+def _unique_bodies(size):
+    # a different body on every call, so the renderer cache never hits
+    body = _markdown(size, random.Random(size))
+    for i in itertools.count():
+        yield '{} {}'.format(body, i)
+
+
+@benchmark('render_post', BODY_SIZES)
+def render_post(size):
+    from app.models import Post
+
+    bodies = _unique_bodies(size)
+    post = Post()
+    return lambda: Post.on_changed_body(post, next(bodies), None, None)
+
+
+@benchmark('render_post_cached', BODY_SIZES)
+def render_post_cached(size):
+    from app.models import Post
+
+    body = _markdown(size, random.Random(size))
+    post = Post()
+    return lambda: Post.on_changed_body(post, body, None, None)
+
+
+@benchmark('render_comment', BODY_SIZES)
+def render_comment(size):
+    from app.models import Comment
+
+    bodies = _unique_bodies(size)
+    comment = Comment()
+    return lambda: Comment.on_changed_body(comment, next(bodies), None, None)
+
+
+def _posts(count):
+    from app.models import Post
+
+    posts = []
+    for i in range(count):
+        post = Post(id=i + 1, author_id=1, body='post *{}*'.format(i),
+                    timestamp=datetime(2016, 1, 1), comment_count=i)
+        posts.append(post)
+    return posts
+
+
+@benchmark('post_to_json', BATCH_SIZES)
+def post_to_json(count):
+    posts = _posts(count)
+    return lambda: [post.to_json() for post in posts]
+
+
+@benchmark('comment_to_json', BATCH_SIZES)
+def comment_to_json(count):
+    from app.models import Comment
+
+    comments = [Comment(id=i + 1, author_id=1, post_id=1, body='comment',
+                        timestamp=datetime(2016, 1, 1))
+                for i in range(count)]
+    return lambda: [comment.to_json() for comment in comments]
+
+
+def _users(count, **kwargs):
+    from app import db
+    from app.models import User
+
+    # new users join the session through their role; keep them out of it
+    with db.session.no_autoflush:
+        users = [User(id=i + 1, username='user{}'.format(i), post_count=i,
+                      member_since=datetime(2016, 1, 1),
+                      last_seen=datetime(2016, 1, 1), **kwargs)
+                 for i in range(count)]
+    db.session.rollback()
+    return users
+
+
+@benchmark('user_to_json', BATCH_SIZES)
+def user_to_json(count):
+    users = _users(count)
+    return lambda: [user.to_json() for user in users]
+
+
+@benchmark('gravatar', ('stored_hash', 'email_hash'))
+def gravatar(kind):
+    user = _users(1, email='john@example.com')[0]
+    if kind == 'email_hash':
+        user.avatar_hash = None
+    return lambda: user.gravatar(size=40)
+
+
+@benchmark('generate_auth_token')
+def generate_auth_token(param):
+    from app.models import User
+
+    user = User.query.first()
+    return lambda: user.generate_auth_token(expiration=3600)
+
+
+@benchmark('verify_auth_token', ('principal', 'user'))
+def verify_auth_token(kind):
+    from app.models import Principal, User
+
+    user = User.query.first()
+    token = user.generate_auth_token(expiration=3600)
+    if kind == 'principal':
+        return lambda: Principal.from_token(token)
+    return lambda: User.verify_auth_token(token)
+
+
+def case_name(name, param):
+    return name if param is None else '{}[{}]'.format(name, param)
+
+
+def _time(func, number):
+    loops = range(number)
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = timeit.default_timer()
+        for i in loops:
+            func()
+        return timeit.default_timer() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def measure(func, repeat=20, warmup=3, min_time=0.02):
+    """Time ``func`` and return per call samples, one per repetition.
+
+    The number of calls per repetition is doubled until one repetition
+    takes ``min_time`` seconds; ``warmup`` repetitions are run and
+    discarded before the ``repeat`` that are kept.
+    """
+    # the first call pays for lazy imports and cache fills
+    func()
+    number = 1
+    while _time(func, number) < min_time and number < 1000000:
+        number *= 2
+    for i in range(warmup):
+        _time(func, number)
+    return number, [_time(func, number) / number for i in range(repeat)]
+
+
+def _setup():
+    from app import db
+    from app.models import Role, User
+
+    db.create_all()
+    Role.insert_roles()
+    db.session.add(User(email='john@example.com', username='john',
+                        password='cat', confirmed=True))
+    db.session.commit()
+
+
+def run(config='testing', only=None, repeat=20, warmup=3, progress=None):
+    """Run the registered benchmarks and return JSON-able results.
+
+    The application runs against a private in-memory database inside a
+    test request context. ``only`` keeps the cases whose name contains
+    it.
+    """
+    from app import create_app
+
+    app = create_app(config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    results = {}
+    with app.test_request_context('/'):
+        _setup()
+        for name, params, factory in BENCHMARKS:
+            for param in params:
+                case = case_name(name, param)
+                if only and only not in case:
+                    continue
+                number, samples = measure(factory(param), repeat, warmup)
+                values = sorted(samples)
+                results[case] = {
+                    'number': number,
+                    'min': values[0],
+                    'median': percentile(values, 50),
+                    'mean': sum(values) / len(values),
+                    'stdev': _stdev(values),
+                    'samples': samples,
+                }
+                if progress is not None:
+                    progress(case, results[case])
+    return {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'repeat': repeat,
+            'warmup': warmup,
+        },
+        'benchmarks': results,
+    }
+
+
+def _stdev(values):
+    if len(values) < 2:
+        return 0.0
+    mean = sum(values) / len(values)
+    return (sum((v - mean) ** 2 for v in values) /
+            (len(values) - 1)) ** 0.5
+
+
+def compare_results(results, baseline, threshold=5.0, alpha=0.05):
+    """Compare medians with a baseline run.
+
+    Returns ``(case, baseline median, median, change, p-value, verdict)``
+    rows. A case is only called slower or faster when its median moved
+    by more than ``threshold`` percent and the Mann-Whitney test rejects
+    equal distributions at ``alpha``.
+    """
+    rows = []
+    old_results = baseline['benchmarks']
+    for case, new in sorted(results['benchmarks'].items()):
+        old = old_results.get(case)
+        if old is None:
+            continue
+        delta = change(new['median'], old['median'])
+        p = mann_whitney(old['samples'], new['samples'])
+        verdict = 'same'
+        if p is not None and p < alpha and delta is not None and \
+                abs(delta) > threshold:
+            verdict = 'slower' if delta > 0 else 'faster'
+        rows.append((case, old['median'], new['median'], delta, p, verdict))
+    return rows
+
+
+def format_result(case, result):
+    return '{:<32} {:>12.3f} us  +- {:>9.3f} us  ({} calls x {})'.format(
+        case, result['median'] * 1e6, result['stdev'] * 1e6,
+        result['number'], len(result['samples']))
+
+
+def format_comparison(rows):
+    lines = ['{:<32} {:>12} {:>12} {:>9} {:>8}'.format(
+        'benchmark', 'baseline us', 'current us', 'change', 'p')]
+    for case, old, new, delta, p, verdict in rows:
+        lines.append('{:<32} {:>12.3f} {:>12.3f} {:>+8.1f}% {:>8.4f} {}'
+                     .format(case, old * 1e6, new * 1e6, delta, p,
+                             '' if verdict == 'same' else verdict.upper()))
+    return '\n'.join(lines)
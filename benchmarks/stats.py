@@ -0,0 +1,108 @@
+import json
+import math
+
+
+def percentile(values, p):
+    """Return the ``p``th percentile of sorted ``values``, interpolated."""
+    if not values:
+        return None
+    k = (len(values) - 1) * p / 100.0
+    lower = int(math.floor(k))
+    upper = int(math.ceil(k))
+    if lower == upper:
+        return values[lower]
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+def summarize(latencies):
+    """Return the count, mean and p50/p95/p99 of a list of seconds."""
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else None,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+    }
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def change(current, baseline):
+    """Return the relative change from ``baseline`` in percent."""
+    if current is None or not baseline:
+        return None
+    return (current - baseline) * 100.0 / baseline
+
+
+def compare(current, baseline, metrics, threshold):
+    """Compare two ``{name: {metric: value}}`` results.
+
+    ``metrics`` maps each metric to True when higher values are better.
+    Returns ``(name, metric, baseline, current, change, regressed)``
+    tuples, where ``regressed`` means the metric got worse by more than
+    ``threshold`` percent.
+    """
+    rows = []
+    for name in sorted(current):
+        if name not in baseline:
+            continue
+        for metric, higher_is_better in metrics:
+            old = baseline[name].get(metric)
+            new = current[name].get(metric)
+            delta = change(new, old)
+            if delta is None:
+                continue
+            worse = -delta if higher_is_better else delta
+            rows.append((name, metric, old, new, delta, worse > threshold))
+    return rows
+
+
+def format_comparison(rows):
+    lines = ['{:<24} {:<8} {:>12} {:>12} {:>9}'.format(
+        'name', 'metric', 'baseline', 'current', 'change')]
+    for name, metric, old, new, delta, regressed in rows:
+        lines.append('{:<24} {:<8} {:>12.6g} {:>12.6g} {:>+8.1f}%{}'.format(
+            name, metric, old, new, delta, ' REGRESSION' if regressed else ''))
+    return '\n'.join(lines)
+
+
+def mann_whitney(a, b):
+    """Return the two-sided p-value of a Mann-Whitney U test.
+
+    Uses the normal approximation with a tie correction, which is sound
+    for the 10 or more samples per side the benchmarks collect.
+    """
+    n1, n2 = len(a), len(b)
+    if not n1 or not n2:
+        return None
+    combined = sorted([(value, 0) for value in a] +
+                      [(value, 1) for value in b])
+    n = n1 + n2
+    rank_sum = 0.0
+    ties = 0
+    i = 0
+    while i < n:
+        j = i
+        while j + 1 < n and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        rank = (i + j) / 2.0 + 1
+        rank_sum += rank * sum(1 for k in range(i, j + 1)
+                               if combined[k][1] == 0)
+        ties += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+    u = rank_sum - n1 * (n1 + 1) / 2.0
+    variance = n1 * n2 / 12.0 * ((n + 1) - ties / float(n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = max(abs(u - n1 * n2 / 2.0) - 0.5, 0) / math.sqrt(variance)
+    return math.erfc(z / math.sqrt(2))
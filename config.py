@@ -21,8 +21,35 @@ class Config:
     APP_FOLLOWERS_PER_PAGE = 20
     APP_FOLLOWING_PER_PAGE = 20
     APP_COMMENTS_PER_PAGE = 20
+    APP_TIMELINE_FANOUT_LIMIT = 10000
+    APP_TIMELINE_FANIN_RATIO = 0.9
+    APP_FRAGMENT_CACHE = os.environ.get('APP_FRAGMENT_CACHE') or 'lru'
+    APP_FRAGMENT_CACHE_SIZE = 10000
+    APP_FOLLOW_GRAPH_SIZE = 10000
+    APP_LAST_SEEN_GRANULARITY = 60
+    APP_LAST_SEEN_FLUSH_INTERVAL = 10
+    APP_ROLE_REGISTRY_TTL = 300
+    APP_AUTH_CACHE_TTL = 60
+    APP_AUTH_CACHE_SIZE = 10000
+    APP_CREDENTIAL_CACHE_TTL = 300
+    APP_CREDENTIAL_CACHE_SIZE = 10000
+    APP_EXPORT_BATCH_SIZE = 1000
+    APP_SEARCH_RESULTS_PER_PAGE = 20
+    APP_API_BATCH_SIZE = 1000
+    APP_OUTBOX_WORKERS = 4
+    APP_OUTBOX_BATCH_SIZE = 50
+    APP_OUTBOX_MAX_ATTEMPTS = 6
+    APP_OUTBOX_RETRY_DELAY = 30
     BOOTSTRAP_SERVE_LOCAL = True
+    APP_COMPRESS_LEVEL = 6
+    APP_COMPRESS_MIN_SIZE = 500
+    APP_PRECOMPRESSED_DIR = os.path.join(basedir, 'precompressed')
     APP_SLOW_DB_QUERY_TIME = 0.5
+    APP_QUERY_REPEAT_THRESHOLD = 10
+    APP_QUERY_REPORT_WINDOW = 600
+    APP_METRICS_DIR = os.environ.get('APP_METRICS_DIR')
+    APP_METRICS_FLUSH_INTERVAL = 5
+    APP_METRICS_TOKEN = os.environ.get('APP_METRICS_TOKEN')
 
     @classmethod
     def init_app(cls, app):
@@ -40,6 +67,7 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data-test.sqlite')
     WTF_CSRF_ENABLED = False
+    APP_LAST_SEEN_FLUSH_INTERVAL = 0
 
 
 class ProductionConfig(Config):
@@ -56,20 +56,202 @@ def profile(length=25, profile_dir=None):
     app.run()
 
 
+@manager.command
+def rebuild_timelines(chunk_size=1000, pending=False):
+    """Rebuild the materialized timelines from follows and posts.
+
+    With --pending, only copy the posts of authors back from pull mode.
+    """
+    from app.models import TimelineEntry
+
+    def progress(done, total, inserted):
+        print('{} {}/{}, {} timeline entries'.format(
+            'Authors' if pending else 'Users', done, total, inserted))
+
+    rebuild = TimelineEntry.refill if pending else TimelineEntry.rebuild
+    rebuild(chunk_size=int(chunk_size), progress=progress)
+
+
+@manager.command
+def seed(users=1000, posts=10000, comments=20000, follows=20, seed=0,
+         batch_size=5000, now=None):
+    """Bulk insert a synthetic dataset for load testing.
+
+    Pass the same --seed and --now (YYYY-MM-DDTHH:MM:SS) to reproduce a
+    dataset; timestamps are spread over the year before --now.
+    """
+    from datetime import datetime
+    from app.seed import Seeder
+
+    def progress(stage, done, total):
+        print('{}: {}/{}'.format(stage, done, total))
+
+    if now is not None:
+        now = datetime.strptime(now, '%Y-%m-%dT%H:%M:%S')
+    Seeder(seed=int(seed), batch_size=int(batch_size), now=now,
+           progress=progress).run(
+        users=int(users), posts=int(posts), comments=int(comments),
+        follows=int(follows))
+
+
+@manager.command
+def reindex(kind=None, chunk_size=10000):
+    """Rebuild the full-text search index of posts and comments."""
+    from app.search import KINDS, rebuild
+
+    def progress(kind, done, total):
+        print('{}: {}/{}'.format(kind, done, total))
+
+    for kind in [kind] if kind else sorted(KINDS):
+        indexed = rebuild(kind, chunk_size=int(chunk_size), progress=progress)
+        if indexed is not None:
+            print('{}: {} rows indexed'.format(kind, indexed))
+
+
+@manager.command
+def reconcile_counters():
+    """Recompute the denormalized post, comment and follow counters."""
+    from app.models import reconcile_counters
+
+    for counter, fixed in sorted(reconcile_counters().items()):
+        print('{}: {} rows fixed'.format(counter, fixed))
+
+
+@manager.command
+def outbox_worker(workers=None, once=False):
+    """Deliver queued email from the outbox."""
+    import logging
+    import signal
+    from app.outbox import WorkerPool
+
+    logging.basicConfig(level=logging.INFO)
+    pool = WorkerPool(app, size=int(workers) if workers else None)
+    signal.signal(signal.SIGTERM, lambda signum, frame: pool.stopping.set())
+    try:
+        pool.run(once=once)
+    except KeyboardInterrupt:
+        pass
+
+
+@manager.command
+def outbox_status():
+    """Show the depth of the email outbox."""
+    from app import outbox
+
+    for key, value in sorted(outbox.stats().items()):
+        print('{}: {}'.format(key, value))
+
+
+@manager.command
+def export(kind, output=None, since=None, author=None, batch_size=1000):
+    """Export posts, comments or users as newline-delimited JSON."""
+    import sys
+    from app.export import export_ndjson, export_query, parse_since
+
+    query = export_query(kind, since=parse_since(since),
+                         author=int(author) if author else None)
+    out = open(output, 'w') if output else sys.stdout
+    try:
+        for chunk in export_ndjson(query, int(batch_size)):
+            out.write(chunk)
+    finally:
+        if output:
+            out.close()
+
+
+@manager.command
+def compress_static():
+    """Write gzip copies of the static files."""
+    from app import compress
+
+    def progress(endpoint, filename, size, compressed):
+        print('{}/{}: {} -> {} bytes'.format(endpoint, filename, size,
+                                              compressed))
+
+    written = compress.compress_static(app, progress=progress)
+    print('{} files compressed'.format(written))
+
+
+@manager.command
+def bench(url=None, processes=4, duration=30, mix=None, sessions=10,
+          warmup=20, users=1000, posts=10000, comments=20000, output=None,
+          baseline=None, threshold=10.0):
+    """Load test the application with a mix of page and API traffic.
+
+    Exits with status 1 when ``baseline`` is given and a metric regressed.
+    """
+    import sys
+    from benchmarks import load, stats
+    from app.seed import Seeder
+
+    if User.query.count() == 0:
+        Seeder(progress=lambda stage, done, total: print(
+            '{}: {}/{}'.format(stage, done, total))).run(
+            users=int(users), posts=int(posts), comments=int(comments))
+    results = load.run(
+        config=os.getenv('FLASK_CONFIG') or 'default', url=url,
+        processes=int(processes), duration=float(duration), mix=mix,
+        sessions=int(sessions), warmup=int(warmup),
+        metrics_token=os.getenv('APP_METRICS_TOKEN'), progress=print)
+    print(load.format_results(results))
+    if output:
+        stats.save(output, results)
+        print('Results saved to {}'.format(output))
+    if baseline:
+        rows = load.compare_results(results, stats.load(baseline),
+                                    float(threshold))
+        print(stats.format_comparison(rows))
+        if any(row[5] for row in rows):
+            sys.exit(1)
+
+
+@manager.command
+def microbench(only=None, repeat=20, warmup=3, output=None, baseline=None,
+               threshold=5.0):
+    """Time rendering, serialization and token hot paths of the models.
+
+    Exits with status 1 when ``baseline`` is given and a case got slower.
+    """
+    import sys
+    from benchmarks import micro, stats
+
+    results = micro.run(
+        config=os.getenv('FLASK_CONFIG') or 'default', only=only,
+        repeat=int(repeat), warmup=int(warmup),
+        progress=lambda case, result: print(micro.format_result(case,
+                                                                result)))
+    if output:
+        stats.save(output, results)
+        print('Results saved to {}'.format(output))
+    if baseline:
+        rows = micro.compare_results(results, stats.load(baseline),
+                                     float(threshold))
+        print(micro.format_comparison(rows))
+        if any(row[5] == 'slower' for row in rows):
+            sys.exit(1)
+
+
 @manager.command
 def deploy():
     """Run deployment tasks."""
     from flask_migrate import upgrade
+    from app import metrics
     from app.models import Role, User
 
     # migrate database to the latest version
     upgrade()
 
+    # start the metrics of the new release from zero
+    metrics.clear()
+
     # create user roles
     Role.insert_roles()
 
     # Create self-follows for all users
-    User.add_self_follows()
+    def progress(done, total, added):
+        print('Self-follows: users {}/{}, {} added'.format(done, total, added))
+
+    User.add_self_follows(progress=progress)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,42 @@
+"""Full-text search indexes
+
+Revision ID: 9d3f6b2e8a41
+Revises: 4a7c9e2d6b15
+Create Date: 2016-02-14 16:21:37.250614
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9d3f6b2e8a41'
+down_revision = '4a7c9e2d6b15'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+TABLES = (('posts', 'posts_fts', 'ix_posts_body_tsv'),
+          ('comments', 'comments_fts', 'ix_comments_body_tsv'))
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for table, fts_table, gin_index in TABLES:
+        if dialect == 'sqlite':
+            op.execute("CREATE VIRTUAL TABLE {} USING "
+                       "fts5(body, tokenize='porter unicode61')"
+                       .format(fts_table))
+            op.execute('INSERT INTO {} (rowid, body) SELECT id, body FROM {} '
+                       'WHERE body IS NOT NULL'.format(fts_table, table))
+        elif dialect == 'postgresql':
+            op.execute("CREATE INDEX {0} ON {1} USING gin (to_tsvector("
+                       "'english', coalesce({1}.body, '')))"
+                       .format(gin_index, table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table, fts_table, gin_index in TABLES:
+        if dialect == 'sqlite':
+            op.execute('DROP TABLE {}'.format(fts_table))
+        elif dialect == 'postgresql':
+            op.drop_index(gin_index, table_name=table)
@@ -0,0 +1,83 @@
+import json
+import unittest
+
+from base64 import b64encode
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import create_app, db
+from app.models import Principal, Role, User
+
+
+class APIAuthTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.user = User(email='name@example.com', username='name',
+                         password='cat', confirmed=True)
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_api_headers(self, username, password):
+        return {
+            'Authorization': 'Basic ' + b64encode(
+                (username + ':' + password).encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+
+    def get_token(self):
+        response = self.client.get(
+            '/api/v1.0/token',
+            headers=self.get_api_headers('name@example.com', 'cat'))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data.decode('utf-8'))['token']
+
+    def test_token_carries_permissions(self):
+        principal = Principal.from_token(self.get_token())
+        self.assertEqual(principal.id, self.user.id)
+        self.assertEqual(principal.permissions, self.user.role.permissions)
+        self.assertTrue(principal.confirmed)
+
+    def test_cached_principal_needs_no_queries(self):
+        token = self.get_token()
+        headers = self.get_api_headers(token, '')
+        self.assertEqual(
+            self.client.get('/api/v1.0/posts/', headers=headers).status_code,
+            200)
+        before = len(get_debug_queries())
+        response = self.client.post(
+            '/api/v1.0/posts/', headers=headers,
+            data=json.dumps({'body': 'from the api'}))
+        self.assertEqual(response.status_code, 201)
+        queries = [q.statement for q in get_debug_queries()[before:]]
+        self.assertFalse([q for q in queries if 'FROM users' in q and
+                          'roles' in q])
+
+    def test_role_change_invalidates_tokens(self):
+        token = self.get_token()
+        self.assertIsNotNone(Principal.from_token(token))
+        self.user.role = Role.query.filter_by(name='Moderator').first()
+        db.session.commit()
+        self.assertIsNone(Principal.from_token(token))
+        response = self.client.get('/api/v1.0/posts/',
+                                   headers=self.get_api_headers(token, ''))
+        self.assertEqual(response.status_code, 401)
+
+    def test_unconfirm_is_seen_immediately(self):
+        token = self.get_token()
+        self.assertTrue(Principal.from_token(token).confirmed)
+        self.user.confirmed = False
+        db.session.commit()
+        response = self.client.get('/api/v1.0/posts/',
+                                   headers=self.get_api_headers(token, ''))
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,159 @@
+import json
+import unittest
+from base64 import b64encode
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import create_app, db
+from app.models import Comment, Post, Role, User
+from app.search import search
+
+
+class BatchAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.user = User(email='john@example.com', username='john',
+                         password='cat', confirmed=True)
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_api_headers(self):
+        return {
+            'Authorization': 'Basic ' + b64encode(
+                'john@example.com:cat'.encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+        }
+
+    def post_json(self, url, data):
+        response = self.client.post(url, headers=self.get_api_headers(),
+                                    data=json.dumps(data))
+        return response, json.loads(response.data.decode('utf-8'))
+
+    def test_new_posts(self):
+        bodies = ['post *{}*'.format(i) for i in range(20)]
+        response, json_response = self.post_json(
+            '/api/v1.0/posts/batch', {'posts': [{'body': b} for b in bodies]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([p['body'] for p in json_response['posts']], bodies)
+        self.assertEqual(json_response['posts'][3]['body_html'],
+                         '<p>post <em>3</em></p>')
+        self.assertEqual(Post.query.count(), 20)
+        self.assertEqual(User.query.get(self.user.id).post_count, 20)
+
+    def test_invalid_items_reject_the_batch(self):
+        response, json_response = self.post_json(
+            '/api/v1.0/posts/batch',
+            {'posts': [{'body': 'ok'}, {'body': ''}, 'text', {'body': 'ok'}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([e['index'] for e in json_response['errors']],
+                         [1, 2])
+        self.assertEqual(Post.query.count(), 0)
+        for data in ({'posts': []}, {'posts': {'body': 'x'}}, ['x']):
+            response, json_response = self.post_json(
+                '/api/v1.0/posts/batch', data)
+            self.assertEqual(response.status_code, 400)
+        self.app.config['APP_API_BATCH_SIZE'] = 2
+        response, json_response = self.post_json(
+            '/api/v1.0/posts/batch', {'posts': [{'body': 'x'}] * 3})
+        self.assertEqual(response.status_code, 400)
+
+    def test_new_post_comments(self):
+        post = Post(body='post', author=self.user)
+        db.session.add(post)
+        db.session.commit()
+        post_id = post.id
+        response, json_response = self.post_json(
+            '/api/v1.0/posts/{}/comments/batch'.format(post_id),
+            {'comments': [{'body': 'c{}'.format(i)} for i in range(5)]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([c['body'] for c in json_response['comments']],
+                         ['c0', 'c1', 'c2', 'c3', 'c4'])
+        self.assertEqual(Comment.query.filter_by(post_id=post_id).count(), 5)
+        self.assertEqual(Post.query.get(post_id).comment_count, 5)
+        response, json_response = self.post_json(
+            '/api/v1.0/posts/12345/comments/batch', {'comments': [{}]})
+        self.assertEqual(response.status_code, 404)
+
+    def test_single_transaction(self):
+        self.post_json('/api/v1.0/posts/batch', {'posts': [{'body': 'x'}]})
+        commits = []
+
+        def on_commit(connection):
+            commits.append(connection)
+
+        db.event.listen(db.engine, 'commit', on_commit)
+        try:
+            self.post_json('/api/v1.0/posts/batch',
+                           {'posts': [{'body': 'x'}] * 50})
+        finally:
+            db.event.remove(db.engine, 'commit', on_commit)
+        self.assertEqual(len(commits), 1)
+
+    def test_statements_do_not_grow_with_the_batch(self):
+        follower = User(email='susan@example.com', username='susan',
+                        password='dog')
+        db.session.add(follower)
+        db.session.commit()
+        follower.follow(self.user)
+        db.session.commit()
+        self.post_json('/api/v1.0/posts/batch', {'posts': [{'body': 'x'}]})
+        post_id = Post.query.first().id
+        counts = []
+        for size in (2, 40):
+            for url, key in (
+                    ('/api/v1.0/posts/batch', 'posts'),
+                    ('/api/v1.0/posts/{}/comments/batch'.format(post_id),
+                     'comments')):
+                queries = len(get_debug_queries())
+                response, json_response = self.post_json(
+                    url, {key: [{'body': 'x'}] * size})
+                self.assertEqual(response.status_code, 201)
+                counts.append(len(get_debug_queries()) - queries)
+        self.assertEqual(counts[:2], counts[2:])
+        self.assertEqual(User.query.get(self.user.id).post_count, 43)
+        self.assertEqual(Post.query.get(post_id).comment_count, 42)
+        self.assertEqual(len(follower.timeline()[0].all()), 43)
+        self.assertEqual(self.user.timeline()[0].count(), 43)
+        self.assertEqual(len(search('posts', 'x', per_page=100).items), 43)
+
+    def test_get_many(self):
+        posts = [Post(body='post {}'.format(i), author=self.user)
+                 for i in range(3)]
+        db.session.add_all(posts)
+        db.session.commit()
+        ids = [p.id for p in posts]
+        self.client.get('/api/v1.0/posts/?ids=1',
+                        headers=self.get_api_headers())
+        queries = len(get_debug_queries())
+        response = self.client.get(
+            '/api/v1.0/posts/?ids={},999,{},{}'.format(ids[2], ids[0],
+                                                       ids[2]),
+            headers=self.get_api_headers())
+        self.assertEqual(response.status_code, 200)
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(
+            [p and p['body'] for p in json_response['posts']],
+            ['post 2', None, 'post 0', 'post 2'])
+        self.assertEqual(json_response['not_found'], [999])
+        self.assertLessEqual(len(get_debug_queries()) - queries, 4)
+        response = self.client.get(
+            '/api/v1.0/users/?ids={},7'.format(self.user.id),
+            headers=self.get_api_headers())
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['users'][0]['username'], 'john')
+        self.assertEqual(json_response['not_found'], [7])
+        for url in ('/api/v1.0/users/', '/api/v1.0/comments/?ids=1,x',
+                    '/api/v1.0/posts/?ids='):
+            response = self.client.get(url, headers=self.get_api_headers())
+            self.assertEqual(response.status_code, 400)
@@ -0,0 +1,91 @@
+import json
+import unittest
+from base64 import b64encode
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import create_app, db
+from app.models import Comment, Post, Role, User
+
+
+class RepresentationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.users = [User(email='user{}@example.com'.format(i),
+                           username='user{}'.format(i), password='cat',
+                           confirmed=True) for i in range(5)]
+        db.session.add_all(self.users)
+        self.posts = [Post(body='post {}'.format(i), author=u)
+                      for i, u in enumerate(self.users)]
+        db.session.add_all(self.posts)
+        db.session.add_all([Comment(body='comment', post=p, author=u)
+                            for p in self.posts for u in self.users[:2]])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url):
+        headers = {
+            'Authorization': 'Basic ' + b64encode(
+                'user0@example.com:cat'.encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json',
+        }
+        response = self.client.get(url, headers=headers)
+        return response, json.loads(response.data.decode('utf-8'))
+
+    def test_fields(self):
+        response, json_response = self.get('/api/v1.0/posts/?fields=body,url')
+        self.assertEqual(response.status_code, 200)
+        for post in json_response['posts']:
+            self.assertEqual(sorted(post), ['body', 'url'])
+        response, json_response = self.get(
+            '/api/v1.0/users/{}?fields=username'.format(self.users[1].id))
+        self.assertEqual(json_response, {'username': 'user1'})
+        response, json_response = self.get('/api/v1.0/posts/?fields=nope')
+        self.assertEqual(response.status_code, 400)
+
+    def test_expand(self):
+        self.get('/api/v1.0/posts/')
+        queries = len(get_debug_queries())
+        response, json_response = self.get('/api/v1.0/posts/?expand=author')
+        expanded_queries = len(get_debug_queries()) - queries
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(p['author']['username'] for p in json_response['posts']),
+            ['user0', 'user1', 'user2', 'user3', 'user4'])
+        queries = len(get_debug_queries())
+        self.get('/api/v1.0/posts/')
+        self.assertLessEqual(expanded_queries,
+                             len(get_debug_queries()) - queries + 1)
+
+        response, json_response = self.get(
+            '/api/v1.0/comments/?expand=post&fields=body,post,author.username')
+        self.assertEqual(response.status_code, 200)
+        for comment in json_response['comments']:
+            self.assertEqual(sorted(comment), ['author', 'body', 'post'])
+            self.assertEqual(list(comment['author']), ['username'])
+            self.assertTrue(comment['post']['body'].startswith('post'))
+        response, json_response = self.get(
+            '/api/v1.0/users/{}?expand=author'.format(self.users[0].id))
+        self.assertEqual(response.status_code, 400)
+
+    def test_expand_etags_cover_embedded_objects(self):
+        url = '/api/v1.0/posts/{}?expand=author'.format(self.posts[0].id)
+        response, json_response = self.get(url)
+        etag = response.headers['ETag']
+        author = User.query.get(self.posts[0].author_id)
+        author.username = 'renamed'
+        db.session.commit()
+        response, json_response = self.get(url)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        response, json_response = self.get(
+            '/api/v1.0/posts/{}?fields=body'.format(self.posts[0].id))
+        self.assertIsNotNone(response.headers.get('ETag'))
@@ -0,0 +1,58 @@
+import unittest
+
+from app import create_app, db
+from app.models import Role
+from app.seed import Seeder
+from benchmarks import load, stats
+
+
+class StatsTestCase(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(stats.percentile(values, 50), 50.5)
+        self.assertEqual(stats.percentile(values, 100), 100)
+        self.assertAlmostEqual(stats.percentile(values, 99), 99.01)
+        self.assertIsNone(stats.percentile([], 50))
+
+    def test_compare(self):
+        baseline = {'all': {'p50': 0.1, 'rps': 100.0}}
+        current = {'all': {'p50': 0.125, 'rps': 95.0}}
+        rows = stats.compare(current, baseline,
+                             (('p50', False), ('rps', True)), 10.0)
+        self.assertEqual([(row[1], row[5]) for row in rows],
+                         [('p50', True), ('rps', False)])
+        self.assertAlmostEqual(rows[0][4], 25.0)
+
+
+class LoadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        Seeder(seed=1).run(users=10, posts=30, comments=30, follows=3)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_run(self):
+        results = load.run(config='testing', processes=1, duration=0.5,
+                           sessions=2, warmup=2)
+        all = results['scenarios']['all']
+        self.assertGreater(all['count'], 0)
+        self.assertEqual(all['errors'], 0)
+        self.assertLessEqual(all['p50'], all['p99'])
+        self.assertIn('main.index', results['queries_per_request'])
+        self.assertIn('timeline', load.format_results(results))
+        rows = load.compare_results(results, results)
+        self.assertFalse(any(row[5] for row in rows))
+        with self.assertRaises(ValueError):
+            load.parse_mix('timeline=1,nope=2')
+
+    def test_run_fails_when_users_cannot_log_in(self):
+        with self.assertRaises(ValueError):
+            load.run(config='testing', processes=1, duration=0.1,
+                     sessions=1, warmup=0, password='wrong')
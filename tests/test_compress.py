@@ -0,0 +1,90 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+from base64 import b64encode
+
+from app import compress, create_app, db
+from app.models import Post, Role, User
+
+
+class CompressTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.precompressed = tempfile.mkdtemp()
+        self.app.config['APP_PRECOMPRESSED_DIR'] = self.precompressed
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        user = User(email='john@example.com', username='john',
+                    password='cat', confirmed=True)
+        db.session.add(user)
+        db.session.add_all([Post(body='post {}'.format(i), author=user)
+                            for i in range(10)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.precompressed)
+
+    def get(self, url, encoding=None):
+        headers = {'Authorization': 'Basic ' + b64encode(
+            b'john@example.com:cat').decode('utf-8')}
+        if encoding:
+            headers['Accept-Encoding'] = encoding
+        return self.client.get(url, headers=headers)
+
+    def test_negotiated_compression(self):
+        plain = self.get('/api/v1.0/posts/')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+        response = self.get('/api/v1.0/posts/', 'gzip, deflate')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+        self.assertTrue(len(response.data) < len(plain.data))
+        self.assertTrue(response.headers['ETag'].startswith('W/'))
+
+        response = self.get('/api/v1.0/posts/', 'deflate')
+        self.assertEqual(response.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(zlib.decompress(response.data), plain.data)
+
+        response = self.get('/api/v1.0/posts/', 'gzip;q=0, identity')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_small_responses_are_not_compressed(self):
+        self.app.config['APP_COMPRESS_MIN_SIZE'] = 100000
+        response = self.get('/api/v1.0/posts/', 'gzip')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertNotIn('Accept-Encoding', response.headers.get('Vary', ''))
+
+    def test_precompressed_static(self):
+        url = '/static/css/styles.css'
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        # nothing precompressed yet, served as is
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        response.close()
+
+        self.assertTrue(compress.compress_static(self.app) > 0)
+        self.assertTrue(os.path.exists(os.path.join(
+            self.precompressed, 'static', 'css', 'styles.css.gz')))
+        self.assertEqual(compress.compress_static(self.app), 0)
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.mimetype, 'text/css')
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+        response.close()
+        plain.close()
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+        plain.close()
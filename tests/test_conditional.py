@@ -0,0 +1,129 @@
+import json
+import unittest
+from base64 import b64encode
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import create_app, db
+from app.models import Comment, Post, Role, User
+
+
+class ConditionalGetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.user = User(email='john@example.com', username='john',
+                         password='cat', confirmed=True)
+        db.session.add(self.user)
+        self.post = Post(body='body', author=self.user)
+        db.session.add(self.post)
+        db.session.add(Comment(body='comment', post=self.post,
+                               author=self.user))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url, **headers):
+        headers['Authorization'] = 'Basic ' + b64encode(
+            b'john@example.com:cat').decode('utf-8')
+        return self.client.get(url, headers=headers)
+
+    def test_etag_round_trip(self):
+        for url in ['/api/v1.0/posts/{}'.format(self.post.id),
+                    '/api/v1.0/posts/',
+                    '/api/v1.0/comments/',
+                    '/api/v1.0/posts/{}/comments/'.format(self.post.id),
+                    '/api/v1.0/users/{}'.format(self.user.id),
+                    '/api/v1.0/users/{}/posts/'.format(self.user.id),
+                    '/api/v1.0/users/{}/timeline/'.format(self.user.id)]:
+            response = self.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers['ETag']
+            response = self.get(url, **{'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.data, b'')
+            self.assertEqual(response.headers['ETag'], etag)
+
+    def test_not_modified_costs_one_query(self):
+        url = '/api/v1.0/posts/{}'.format(self.post.id)
+        etag = self.get(url).headers['ETag']
+        # a fresh session, as every request gets outside of tests
+        db.session.remove()
+        before = len(get_debug_queries())
+        self.assertEqual(
+            self.get(url, **{'If-None-Match': etag}).status_code, 304)
+        queries = [q.statement for q in get_debug_queries()[before:]]
+        self.assertEqual(len([q for q in queries if 'FROM posts' in q]), 1)
+
+    def test_changes_invalidate(self):
+        url = '/api/v1.0/posts/{}'.format(self.post.id)
+        list_url = '/api/v1.0/posts/'
+        etag = self.get(url).headers['ETag']
+        list_etag = self.get(list_url).headers['ETag']
+        comments_url = '/api/v1.0/posts/{}/comments/'.format(self.post.id)
+        comments_etag = self.get(comments_url).headers['ETag']
+
+        db.session.add(Comment(body='another', post=self.post,
+                               author=self.user))
+        db.session.commit()
+        self.assertEqual(
+            self.get(url, **{'If-None-Match': etag}).status_code, 200)
+        self.assertEqual(self.get(
+            comments_url, **{'If-None-Match': comments_etag}).status_code,
+            200)
+
+        post = Post.query.get(self.post.id)
+        post.body = 'edited'
+        db.session.commit()
+        response = self.get(list_url, **{'If-None-Match': list_etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.data.decode('utf-8'))['posts'][0]['body'],
+            'edited')
+
+    def test_lists_are_not_probed(self):
+        for url in ['/api/v1.0/posts/', '/api/v1.0/posts/?ids=1',
+                    '/api/v1.0/users/{}/timeline/'.format(self.user.id)]:
+            before = len(get_debug_queries())
+            self.assertEqual(self.get(url).status_code, 200)
+            queries = [q.statement.lower()
+                       for q in get_debug_queries()[before:]]
+            self.assertEqual([q for q in queries if 'count(' in q], [], url)
+
+    def test_deletes_invalidate_lists(self):
+        url = '/api/v1.0/users/{}/timeline/'.format(self.user.id)
+        etag = self.get(url).headers['ETag']
+        post = Post(body='second', author=self.user)
+        db.session.add(post)
+        db.session.commit()
+        second = self.get(url)
+        self.assertNotEqual(second.headers['ETag'], etag)
+        self.assertIsNone(second.headers.get('Last-Modified'))
+        db.session.delete(post)
+        db.session.commit()
+        self.assertEqual(self.get(
+            url, **{'If-None-Match': second.headers['ETag']}).status_code,
+            200)
+        self.assertEqual(self.get(
+            url, **{'If-None-Match': etag}).status_code, 304)
+
+    def test_if_modified_since(self):
+        url = '/api/v1.0/users/{}'.format(self.user.id)
+        last_modified = self.get(url).headers['Last-Modified']
+        self.assertEqual(self.get(
+            url, **{'If-Modified-Since': last_modified}).status_code, 304)
+        self.assertEqual(self.get(
+            url, **{'If-Modified-Since': 'Thu, 01 Jan 2015 00:00:00 GMT'}
+        ).status_code, 200)
+
+    def test_missing_resource(self):
+        self.assertEqual(self.get('/api/v1.0/posts/12345').status_code, 404)
+        self.assertEqual(self.get('/api/v1.0/users/12345/timeline/')
+                         .status_code, 404)
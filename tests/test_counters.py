@@ -0,0 +1,58 @@
+import unittest
+
+from app import create_app, db
+from app.models import Comment, Post, Role, User, reconcile_counters
+
+
+class CountersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_counters_follow_writes(self):
+        u1 = User(email='one@example.com', username='one', password='cat')
+        u2 = User(email='two@example.com', username='two', password='dog')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        self.assertEqual((u1.follower_count, u1.followed_count), (1, 1))
+
+        u1.follow(u2)
+        p = Post(body='post', author=u2)
+        db.session.add_all([u1, p])
+        db.session.commit()
+        db.session.add_all([Comment(body='comment', post=p, author=u1),
+                            Comment(body='comment', post=p, author=u2)])
+        db.session.commit()
+        self.assertEqual(p.comment_count, 2)
+        self.assertEqual(u2.post_count, 1)
+        self.assertEqual(u2.follower_count, 2)
+        self.assertEqual(u1.followed_count, 2)
+
+        u1.unfollow(u2)
+        db.session.add(u1)
+        db.session.commit()
+        self.assertEqual(u2.follower_count, 1)
+        self.assertEqual(u1.followed_count, 1)
+
+    def test_reconcile(self):
+        u = User(email='one@example.com', username='one', password='cat')
+        p = Post(body='post', author=u)
+        db.session.add_all([u, p])
+        db.session.commit()
+        Post.query.update({'comment_count': 7})
+        User.query.update({'post_count': None})
+        db.session.commit()
+        fixed = reconcile_counters()
+        self.assertEqual(fixed['posts.comment_count'], 1)
+        self.assertEqual(fixed['users.post_count'], 1)
+        self.assertEqual(fixed['users.follower_count'], 0)
+        self.assertEqual(p.comment_count, 0)
+        self.assertEqual(u.post_count, 1)
@@ -0,0 +1,92 @@
+import unittest
+
+from base64 import b64encode
+
+from werkzeug.security import generate_password_hash
+
+from app import create_app, db
+from app.credentials import credential_cache
+from app.models import Role, User
+
+
+class CredentialCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.user = User(email='name@example.com', username='name',
+                         password='cat', confirmed=True)
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, email, password, url='/api/v1.0/posts/'):
+        return self.client.get(url, headers={
+            'Authorization': 'Basic ' + b64encode(
+                (email + ':' + password).encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json',
+        })
+
+    def test_verified_credentials_skip_hashing(self):
+        cache = credential_cache()
+        self.assertEqual(self.get('name@example.com', 'cat').status_code,
+                         200)
+        self.assertEqual(cache.hash_count, 1)
+        self.assertEqual(self.get('name@example.com', 'cat').status_code,
+                         200)
+        self.assertEqual(self.get('name@example.com', 'cat',
+                                  '/api/v1.0/token').status_code, 200)
+        self.assertEqual(cache.hash_count, 1)
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertTrue(cache.stats()['hash_time'] > 0)
+
+    def test_wrong_password_is_not_cached(self):
+        cache = credential_cache()
+        self.assertEqual(self.get('name@example.com', 'dog').status_code,
+                         401)
+        self.assertEqual(self.get('name@example.com', 'dog').status_code,
+                         401)
+        self.assertEqual(cache.hash_count, 2)
+        self.assertEqual(len(cache.cache), 0)
+
+    def test_password_change_invalidates(self):
+        self.assertEqual(self.get('name@example.com', 'cat').status_code,
+                         200)
+        self.user.password = 'dog'
+        db.session.commit()
+        self.assertEqual(self.get('name@example.com', 'cat').status_code,
+                         401)
+        self.assertEqual(self.get('name@example.com', 'dog').status_code,
+                         200)
+
+    def test_password_change_by_another_process(self):
+        self.assertEqual(self.get('name@example.com', 'cat').status_code,
+                         200)
+        # written without the ORM, as another worker's change would be
+        users = User.__table__
+        db.session.execute(users.update().where(users.c.id == self.user.id)
+                           .values(password_hash=generate_password_hash(
+                               'dog')))
+        db.session.commit()
+        self.assertEqual(self.get('name@example.com', 'cat').status_code,
+                         401)
+        self.assertEqual(self.get('name@example.com', 'dog').status_code,
+                         200)
+
+    def test_keys_do_not_contain_credentials(self):
+        cache = credential_cache()
+        key = cache.key('name@example.com', 'cat', 'hash')
+        self.assertNotIn('cat', key)
+        self.assertNotEqual(key, cache.key('name@example.com', 'cat2',
+                                           'hash'))
+        self.assertNotEqual(key, cache.key('name@example.co', 'mcat',
+                                           'hash'))
+        self.assertNotEqual(key, cache.key('name@example.com', 'cat',
+                                           'hash2'))
@@ -0,0 +1,89 @@
+import json
+import unittest
+from base64 import b64encode
+from datetime import datetime
+
+from app import create_app, db
+from app.export import export_ndjson, export_query, parse_since
+from app.exceptions import ValidationError
+from app.models import Comment, Post, Role, User
+
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        admin_role = Role.query.filter_by(name='Administrator').first()
+        self.admin = User(email='admin@example.com', username='admin',
+                          password='cat', confirmed=True, role=admin_role)
+        self.user = User(email='user@example.com', username='user',
+                         password='dog', confirmed=True)
+        db.session.add_all([self.admin, self.user])
+        db.session.commit()
+        for i in range(5):
+            post = Post(body='post {}'.format(i), author=self.user,
+                        timestamp=datetime(2016, 1, i + 1))
+            db.session.add(post)
+            db.session.add(Comment(body='comment', post=post,
+                                   author=self.admin))
+        db.session.add(Post(body='admin post', author=self.admin,
+                            timestamp=datetime(2016, 2, 1)))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url, email='admin@example.com', password='cat'):
+        return self.client.get(url, headers={'Authorization': 'Basic ' + (
+            b64encode((email + ':' + password).encode('utf-8'))
+            .decode('utf-8'))})
+
+    def rows(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        return [json.loads(line) for line in
+                response.data.decode('utf-8').splitlines()]
+
+    def test_export_posts(self):
+        rows = self.rows(self.get('/api/v1.0/export/posts'))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual([r['id'] for r in rows],
+                         sorted(r['id'] for r in rows))
+        self.assertEqual(rows[0]['body'], 'post 0')
+        self.assertEqual(rows[0]['timestamp'], '2016-01-01T00:00:00')
+
+    def test_filters(self):
+        rows = self.rows(self.get(
+            '/api/v1.0/export/posts?since=2016-01-04&author={}'.format(
+                self.user.id)))
+        self.assertEqual([r['body'] for r in rows], ['post 3', 'post 4'])
+        rows = self.rows(self.get(
+            '/api/v1.0/export/comments?author={}'.format(self.admin.id)))
+        self.assertEqual(len(rows), 5)
+        rows = self.rows(self.get('/api/v1.0/export/users'))
+        self.assertEqual(set(r['username'] for r in rows),
+                         set(['admin', 'user']))
+        self.assertNotIn('email', rows[0])
+        self.assertEqual(
+            self.get('/api/v1.0/export/posts?since=yesterday').status_code,
+            400)
+        self.assertEqual(self.get('/api/v1.0/export/users?author=1')
+                         .status_code, 400)
+
+    def test_requires_admin(self):
+        response = self.get('/api/v1.0/export/posts', 'user@example.com',
+                            'dog')
+        self.assertEqual(response.status_code, 403)
+
+    def test_chunks(self):
+        chunks = list(export_ndjson(export_query('posts'), batch_size=4))
+        self.assertEqual([chunk.count('\n') for chunk in chunks], [4, 2])
+        self.assertEqual(parse_since('2016-01-02T03:04:05'),
+                         datetime(2016, 1, 2, 3, 4, 5))
+        self.assertRaises(ValidationError, export_query, 'roles')
@@ -0,0 +1,121 @@
+import unittest
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import create_app, db
+from app.models import Follow, Role, User
+
+
+class FollowGraphTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def make_users(self, count, prefix='user'):
+        users = [User(email='{}{}@example.com'.format(prefix, i),
+                      username='{}{}'.format(prefix, i), password='cat',
+                      confirmed=True)
+                 for i in range(count)]
+        db.session.add_all(users)
+        db.session.commit()
+        return users
+
+    def test_membership_and_batch(self):
+        u1, u2, u3, u4 = self.make_users(4)
+        u1.follow(u2)
+        u1.follow(u3)
+        db.session.commit()
+        self.assertTrue(u1.is_following(u2))
+        self.assertFalse(u1.is_following(u4))
+        self.assertTrue(u2.is_followed_by(u1))
+        self.assertFalse(u2.is_followed_by(u3))
+        self.assertEqual(u1.following_among([u1, u2, u3, u4]),
+                         set([u1.id, u2.id, u3.id]))
+
+    def test_followed_by_does_not_load_the_follower(self):
+        u1, u2, u3 = self.make_users(3)
+        u1.follow(u2)
+        db.session.commit()
+        cache = self.app.extensions['follow_graph']
+        cache.clear()
+        self.assertTrue(u2.is_followed_by(u1))
+        self.assertFalse(u2.is_followed_by(u3))
+        self.assertIsNone(cache.get(u1.id))
+        self.assertIsNone(cache.get(u3.id))
+
+    def test_reads_do_not_flush(self):
+        u1, u2 = self.make_users(2)
+        u1.name = 'changed'
+        self.assertFalse(u1.is_following(u2))
+        self.assertIn(u1, db.session.dirty)
+
+    def test_checks_are_cached(self):
+        u1, u2, u3 = self.make_users(3)
+        u1.follow(u2)
+        db.session.commit()
+        self.assertTrue(u1.is_following(u2))
+        u3.id
+        before = len(get_debug_queries())
+        for i in range(10):
+            self.assertTrue(u1.is_following(u2))
+            self.assertFalse(u1.is_following(u3))
+        self.assertEqual(len(get_debug_queries()), before)
+
+    def test_follow_and_unfollow_change_version(self):
+        u1, u2 = self.make_users(2)
+        self.assertFalse(u1.is_following(u2))
+        version = u1.followed_version
+        u1.follow(u2)
+        self.assertTrue(u1.is_following(u2))
+        db.session.commit()
+        self.assertNotEqual(u1.followed_version, version)
+        self.assertTrue(u1.is_following(u2))
+        u1.unfollow(u2)
+        self.assertFalse(u1.is_following(u2))
+        db.session.commit()
+        self.assertFalse(u1.is_following(u2))
+
+    def test_stale_entries_from_other_processes(self):
+        u1, u2 = self.make_users(2)
+        self.assertFalse(u1.is_following(u2))
+        # another process follows and bumps the version
+        db.session.execute(Follow.__table__.insert().values(
+            follower_id=u1.id, followed_id=u2.id))
+        db.session.execute(User.__table__.update()
+                           .where(User.__table__.c.id == u1.id)
+                           .values(followed_version=12345))
+        db.session.commit()
+        self.assertTrue(u1.is_following(u2))
+
+    def test_follower_list_buttons_need_no_queries(self):
+        def count(followers):
+            user = User.query.filter_by(username='star').first()
+            for follower in followers:
+                follower.follow(user)
+            db.session.commit()
+            before = len(get_debug_queries())
+            response = self.client.get('/followers/star')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data.count(b'btn-xs'),
+                             star.follower_count - 1)
+            return len(get_debug_queries()) - before
+
+        star, = self.make_users(1, prefix='star')
+        star.username = 'star'
+        me, = self.make_users(1, prefix='me')
+        self.client.post('/auth/login', data={
+            'email': 'me0@example.com', 'password': 'cat'})
+        count([])
+        few = count(self.make_users(2, prefix='a'))
+        many = count(self.make_users(8, prefix='b'))
+        self.assertEqual(few, many)
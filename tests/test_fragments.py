@@ -0,0 +1,62 @@
+import unittest
+
+from app import create_app, db, fragment_cache
+from app.cache import LRUCache
+from app.models import Post, Role, User
+
+
+class FragmentCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_lru_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertTrue(cache.delete('a'))
+        self.assertEqual(len(cache), 1)
+
+    def test_post_fragments(self):
+        u = User(email='name@example.com', username='name', password='cat')
+        p = Post(body='first *version*', author=u)
+        db.session.add_all([u, p])
+        db.session.commit()
+
+        response = self.client.get('/')
+        self.assertTrue(b'<em>version</em>' in response.data)
+        key = fragment_cache.key('post', p.id)
+        self.assertIsNotNone(fragment_cache.backend.get(key))
+
+        # a cached fragment is served as stored
+        version, html = fragment_cache.backend.get(key)
+        fragment_cache.backend.set(key, (version, html + 'from-cache'))
+        response = self.client.get('/')
+        self.assertTrue(b'from-cache' in response.data)
+
+        # editing the body drops the fragment
+        p.body = 'second version'
+        db.session.commit()
+        self.assertIsNone(fragment_cache.backend.get(key))
+        response = self.client.get('/')
+        self.assertTrue(b'second version' in response.data)
+        self.assertFalse(b'from-cache' in response.data)
+
+        # author changes are part of the fragment version
+        u.username = 'renamed'
+        db.session.commit()
+        response = self.client.get('/')
+        self.assertTrue(b'renamed' in response.data)
@@ -0,0 +1,94 @@
+import unittest
+from unittest import mock
+
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+from app import create_app, db, last_seen
+from app.models import Role, User
+
+
+class LastSeenTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_user(self, email, seen_ago):
+        u = User(email=email, password='cat',
+                 last_seen=datetime.utcnow() - timedelta(seconds=seen_ago))
+        db.session.add(u)
+        db.session.commit()
+        return u
+
+    def test_pings_are_coalesced_and_flushed_in_bulk(self):
+        u1 = self.add_user('one@example.com', seen_ago=3600)
+        u2 = self.add_user('two@example.com', seen_ago=3600)
+        u3 = self.add_user('three@example.com', seen_ago=5)
+        before = u1.last_seen
+        self.assertTrue(last_seen.ping(u1))
+        self.assertFalse(last_seen.ping(u1))
+        self.assertTrue(last_seen.ping(u2))
+        self.assertFalse(last_seen.ping(u3))
+        self.assertEqual(last_seen.flush(), 2)
+        self.assertEqual(last_seen.flush(), 0)
+        db.session.expire_all()
+        self.assertTrue(u1.last_seen > before)
+        self.assertTrue(
+            (datetime.utcnow() - u2.last_seen).total_seconds() < 3)
+
+    def test_failed_flushes_keep_the_timestamps(self):
+        u1 = self.add_user('one@example.com', seen_ago=3600)
+        u2 = self.add_user('two@example.com', seen_ago=3600)
+        last_seen.ping(u1)
+        last_seen.ping(u2)
+        pending = dict(self.app.extensions['last_seen'].pending)
+        newer = pending[u2.id] + timedelta(seconds=1)
+
+        def begin():
+            # seen again while the failing flush runs
+            self.app.extensions['last_seen'].pending[u2.id] = newer
+            raise OperationalError('UPDATE', {}, Exception('locked'))
+
+        with mock.patch.object(db.engine, 'begin', begin):
+            with self.assertRaises(OperationalError):
+                last_seen.flush()
+        self.assertEqual(self.app.extensions['last_seen'].pending,
+                         {u1.id: pending[u1.id], u2.id: newer})
+        self.assertEqual(last_seen.flush(), 2)
+
+    def test_one_exit_hook_for_all_applications(self):
+        app = create_app('testing')
+        self.assertIn(self.app, last_seen._apps)
+        self.assertIn(app, last_seen._apps)
+        u = self.add_user('one@example.com', seen_ago=3600)
+        last_seen.ping(u)
+        last_seen._flush_at_exit()
+        self.assertEqual(self.app.extensions['last_seen'].pending, {})
+
+    def test_requests_record_last_seen(self):
+        u = User(email='name@example.com', username='name', password='cat',
+                 confirmed=True,
+                 last_seen=datetime.utcnow() - timedelta(hours=1))
+        db.session.add(u)
+        db.session.commit()
+        client = self.app.test_client(use_cookies=True)
+        client.post('/auth/login', data={'email': 'name@example.com',
+                                         'password': 'cat'})
+        client.get('/user/name')
+        # written by the flushing thread the request started
+        thread = self.app.extensions['last_seen'].thread
+        if thread is not None:
+            thread.join(5)
+        self.assertEqual(self.app.extensions['last_seen'].pending, {})
+        db.session.expire_all()
+        self.assertTrue(
+            (datetime.utcnow() - u.last_seen).total_seconds() < 3)
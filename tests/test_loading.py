@@ -0,0 +1,49 @@
+import unittest
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import create_app, db
+from app.models import Comment, Post, Role, User
+
+
+class LoadingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_posts(self, prefix, users, count):
+        users = [User(email='{}{}@example.com'.format(prefix, i),
+                      username='{}{}'.format(prefix, i), password='cat')
+                 for i in range(users)]
+        db.session.add_all(users)
+        posts = [Post(body='post', author=users[i % len(users)])
+                 for i in range(count)]
+        db.session.add_all(posts)
+        db.session.add_all([Comment(body='comment', post=posts[0],
+                                    author=users[i % len(users)])
+                            for i in range(count)])
+        db.session.commit()
+
+    def count_queries(self, url):
+        # requests share the test's app context, where queries are recorded
+        before = len(get_debug_queries())
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(get_debug_queries()) - before
+
+    def test_constant_queries_per_page(self):
+        self.add_posts('a', users=2, count=2)
+        small_index = self.count_queries('/')
+        small_post = self.count_queries('/post/1')
+        self.add_posts('b', users=10, count=15)
+        self.assertEqual(self.count_queries('/'), small_index)
+        self.assertEqual(self.count_queries('/post/1'), small_post)
@@ -0,0 +1,98 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import create_app, db, metrics
+from app.models import Role
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.metrics_dir = tempfile.mkdtemp()
+        self.app.config['APP_METRICS_DIR'] = self.metrics_dir
+        self.app.config['APP_METRICS_FLUSH_INTERVAL'] = 0
+        self.app.config['APP_METRICS_TOKEN'] = 'secret'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.metrics_dir)
+
+    def get_metrics(self):
+        response = self.client.get(
+            '/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        return response.get_data(as_text=True)
+
+    def test_request_metrics(self):
+        for i in range(3):
+            self.client.get('/')
+        self.client.get('/user/nobody')
+        data = self.get_metrics()
+        self.assertIn('app_requests_total{endpoint="main.index",'
+                      'method="GET",status="200"} 3', data)
+        self.assertIn('app_requests_total{endpoint="main.user",'
+                      'method="GET",status="404"} 1', data)
+        self.assertIn('app_request_duration_seconds_bucket{'
+                      'endpoint="main.index",le="+Inf"} 3', data)
+        self.assertIn('app_request_duration_seconds_count{'
+                      'endpoint="main.index"} 3', data)
+        self.assertIn('app_request_queries_count{endpoint="main.index"} 3',
+                      data)
+        self.assertIn('app_template_render_seconds_count{'
+                      'template="index.html"} 3', data)
+        # the metrics request itself is in flight
+        self.assertIn('app_requests_in_flight 1', data)
+
+    def test_workers_are_aggregated(self):
+        self.client.get('/')
+        snapshot = metrics.snapshot()
+        # one worker still running, one that has exited
+        for name, pid in (('live', os.getpid()), ('dead', 2 ** 22 + 1)):
+            snapshot['pid'] = pid
+            with open(os.path.join(self.metrics_dir,
+                                   'metrics-{}.json'.format(name)), 'w') as f:
+                json.dump(snapshot, f)
+        for i in range(2):
+            data = self.get_metrics()
+            # the exited worker still counts, folded into the archive
+            self.assertIn('app_requests_total{endpoint="main.index",'
+                          'method="GET",status="200"} 3', data)
+            self.assertIn('app_request_duration_seconds_count{'
+                          'endpoint="main.index"} 3', data)
+            # in flight: this request, plus the live worker's snapshot
+            # taken while nothing was running
+            self.assertIn('app_requests_in_flight 1', data)
+            self.assertNotIn('metrics-dead.json',
+                             os.listdir(self.metrics_dir))
+            self.assertIn('metrics-archive.json',
+                          os.listdir(self.metrics_dir))
+        metrics.clear()
+        self.assertEqual([name for name in os.listdir(self.metrics_dir)
+                          if name.endswith('.json')], [])
+
+    def test_internal_only(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            '/metrics', headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 404)
+        self.app.config['APP_METRICS_ALLOWED_IPS'] = ['127.0.0.1']
+        response = self.client.get(
+            '/metrics', headers={'Authorization': 'Bearer secret'},
+            environ_base={'REMOTE_ADDR': '10.1.2.3'})
+        self.assertEqual(response.status_code, 404)
+        self.app.config['APP_METRICS_TOKEN'] = None
+        response = self.client.get(
+            '/metrics', headers={'Authorization': 'Bearer None'})
+        self.assertEqual(response.status_code, 404)
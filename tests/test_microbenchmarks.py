@@ -0,0 +1,29 @@
+import unittest
+
+from benchmarks import micro
+
+
+class MicroBenchmarkTestCase(unittest.TestCase):
+    def test_measure(self):
+        calls = []
+        number, samples = micro.measure(lambda: calls.append(1), repeat=5,
+                                        warmup=1, min_time=0.001)
+        self.assertEqual(len(samples), 5)
+        self.assertGreater(number, 1)
+        # first call, calibration up to number, warmup and repetitions
+        self.assertEqual(len(calls), 1 + (2 * number - 1) + number * 6)
+
+    def test_run_and_compare(self):
+        results = micro.run(config='testing', only='gravatar', repeat=10,
+                            warmup=0)
+        self.assertEqual(sorted(results['benchmarks']),
+                         ['gravatar[email_hash]', 'gravatar[stored_hash]'])
+        rows = micro.compare_results(results, results)
+        self.assertEqual([row[5] for row in rows], ['same', 'same'])
+        slower = {'benchmarks': dict(
+            (case, dict(result, samples=[s * 2 for s in result['samples']],
+                        median=result['median'] * 2))
+            for case, result in results['benchmarks'].items())}
+        rows = micro.compare_results(slower, results)
+        self.assertEqual([row[5] for row in rows], ['slower', 'slower'])
+        self.assertIn('SLOWER', micro.format_comparison(rows))
@@ -0,0 +1,160 @@
+import socketserver
+import threading
+import unittest
+from datetime import datetime
+
+from app import create_app, db, outbox
+from app.models import OutboxMessage
+from app.outbox import WorkerPool
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    # Just enough of RFC 5321 for smtplib.sendmail.
+
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 localhost')
+        data = None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if data is not None:
+                if line.rstrip(b'\r\n') == b'.':
+                    with server.lock:
+                        server.messages.append(b''.join(data))
+                    data = None
+                    self.reply('250 OK')
+                else:
+                    data.append(line)
+                continue
+            command = line.decode('ascii').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 localhost')
+            elif command.startswith('RCPT') and server.refuse:
+                self.reply('451 try again later')
+            elif command.startswith('DATA'):
+                data = []
+                self.reply('354 go ahead')
+            elif command.startswith('QUIT'):
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(
+            self, ('127.0.0.1', 0), SMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = []
+        self.refuse = False
+
+
+class OutboxTestCase(unittest.TestCase):
+    def setUp(self):
+        self.smtp = SMTPServer()
+        threading.Thread(target=self.smtp.serve_forever).start()
+        self.app = create_app('testing')
+        self.app.config['APP_OUTBOX_POLL_INTERVAL'] = 0.01
+        state = self.app.extensions['mail']
+        state.server, state.port = self.smtp.server_address
+        state.use_tls = False
+        state.username = None
+        state.suppress = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.smtp.shutdown()
+        self.smtp.server_close()
+
+    def enqueue(self, *args, **kwargs):
+        message = outbox.enqueue(*args, **kwargs)
+        db.session.commit()
+        return message
+
+    def test_enqueue_does_not_send(self):
+        message = self.enqueue('a@example.com', 'subject', 'body')
+        self.assertEqual(message.status, OutboxMessage.PENDING)
+        self.assertEqual(self.smtp.messages, [])
+        self.assertEqual(outbox.stats()['pending'], 1)
+
+    def test_pool_reuses_connections(self):
+        for i in range(20):
+            outbox.enqueue('user{}@example.com'.format(i), 'hi',
+                           'body {}'.format(i), html='<p>body</p>')
+        db.session.commit()
+        WorkerPool(self.app, size=3).run(once=True)
+        self.assertEqual(len(self.smtp.messages), 20)
+        self.assertTrue(self.smtp.connections <= 3)
+        stats = outbox.stats()
+        self.assertEqual(stats['sent'], 20)
+        self.assertEqual(stats['pending'], 0)
+        self.assertEqual(stats['oldest_pending_age'], 0)
+
+    def test_failed_delivery_backs_off(self):
+        self.smtp.refuse = True
+        id = self.enqueue('a@example.com', 'subject', 'body').id
+        WorkerPool(self.app, size=1).run(once=True)
+        message = OutboxMessage.query.get(id)
+        self.assertEqual(message.status, OutboxMessage.PENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertIn('451', message.last_error)
+        self.assertTrue(message.next_attempt_at > datetime.utcnow())
+
+        self.smtp.refuse = False
+        message.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        WorkerPool(self.app, size=1).run(once=True)
+        message = OutboxMessage.query.get(id)
+        self.assertEqual(message.status, OutboxMessage.SENT)
+        self.assertEqual(message.attempts, 2)
+        self.assertEqual(len(self.smtp.messages), 1)
+
+    def test_gives_up_after_max_attempts(self):
+        self.smtp.refuse = True
+        self.app.config['APP_OUTBOX_MAX_ATTEMPTS'] = 1
+        id = self.enqueue('a@example.com', 'subject', 'body').id
+        WorkerPool(self.app, size=1).run(once=True)
+        message = OutboxMessage.query.get(id)
+        self.assertEqual(message.status, OutboxMessage.FAILED)
+        self.assertEqual(outbox.stats()['failed'], 1)
+
+    def test_enqueue_joins_the_session_transaction(self):
+        outbox.enqueue('a@example.com', 'subject', 'body')
+        db.session.rollback()
+        self.assertEqual(outbox.stats()['pending'], 0)
+
+    def test_expired_claims_are_reclaimed(self):
+        message = self.enqueue('a@example.com', 'subject', 'body')
+        self.assertEqual(outbox.claim(10), [message.id])
+        self.assertEqual(outbox.claim(10), [])
+        self.app.config['APP_OUTBOX_LEASE'] = -1
+        self.assertEqual(outbox.claim(10), [message.id])
+
+    def test_lost_claims_are_not_delivered(self):
+        message = self.enqueue('a@example.com', 'subject', 'body')
+        self.assertEqual(outbox.claim(10, 'first'), [message.id])
+        self.app.config['APP_OUTBOX_LEASE'] = -1
+        self.assertEqual(outbox.claim(10, 'second'), [message.id])
+        self.assertTrue(outbox.deliver(None, message.id, 'first'))
+        db.session.expire_all()
+        message = OutboxMessage.query.get(message.id)
+        self.assertEqual(message.status, OutboxMessage.SENDING)
+        self.assertEqual(message.claimed_by, 'second')
+        self.assertEqual(message.attempts, 0)
@@ -0,0 +1,83 @@
+import json
+import unittest
+
+from datetime import datetime, timedelta
+
+from app import create_app, db
+from app.exceptions import ValidationError
+from app.models import Post, Role, User
+from app.pagination import decode_cursor, encode_cursor, keyset_paginate
+
+
+class PaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        u = User(email='name@example.com', username='name', password='cat',
+                 confirmed=True)
+        db.session.add(u)
+        start = datetime(2016, 1, 1)
+        # two posts share every timestamp to exercise the id tie-breaker
+        self.posts = [Post(body='post {}'.format(i), author=u,
+                           timestamp=start + timedelta(minutes=i // 2))
+                      for i in range(9)]
+        db.session.add_all(self.posts)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_cursor_round_trip(self):
+        values = [datetime(2016, 1, 2, 3, 4, 5, 6), 42]
+        self.assertEqual(decode_cursor(encode_cursor('next', values)),
+                         ('next', values))
+        with self.assertRaises(ValidationError):
+            decode_cursor('not-a-cursor')
+        for values in (['2016-01-02', 42], [datetime(2016, 1, 2), '42'],
+                       [[1], 42], [datetime(2016, 1, 2), True]):
+            with self.assertRaises(ValidationError):
+                decode_cursor(encode_cursor('next', values))
+        self.assertEqual(
+            decode_cursor(encode_cursor('next', [1, 2]), (float, int)),
+            ('next', [1, 2]))
+
+    def test_walk_forward_and_back(self):
+        keys = (Post.timestamp, Post.id)
+        expected = sorted(self.posts, key=lambda p: (p.timestamp, p.id),
+                          reverse=True)
+        pages = []
+        cursor = None
+        while True:
+            pagination = keyset_paginate(Post.query, keys, cursor, 4)
+            pages.append(pagination.items)
+            if not pagination.has_next:
+                break
+            cursor = pagination.next_cursor
+        self.assertEqual([p for page in pages for p in page], expected)
+        self.assertEqual([len(page) for page in pages], [4, 4, 1])
+        self.assertFalse(keyset_paginate(Post.query, keys, None, 4).has_prev)
+
+        pagination = keyset_paginate(Post.query, keys, cursor, 4)
+        back = keyset_paginate(Post.query, keys, pagination.prev_cursor, 4)
+        self.assertEqual(back.items, pages[1])
+        self.assertTrue(back.has_next)
+
+    def test_api_cursor_and_page_envelopes(self):
+        response = self.client.get('/api/v1.0/posts/')
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(json_response['posts']), 9)
+        self.assertIsNone(json_response['count'])
+        self.assertIsNone(json_response['next_cursor'])
+
+        response = self.client.get('/api/v1.0/posts/?page=1')
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['count'], 9)
+
+        response = self.client.get('/api/v1.0/posts/?cursor=bogus')
+        self.assertEqual(response.status_code, 400)
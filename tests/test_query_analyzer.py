@@ -0,0 +1,89 @@
+import json
+import unittest
+
+from app import create_app, db, query_analyzer
+from app.models import Post, Role, User
+from app.query_analyzer import fingerprint
+
+
+class FingerprintTestCase(unittest.TestCase):
+    def test_values_are_normalized(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM users  WHERE id = 12 AND name = 'o''k'"),
+            'SELECT * FROM users WHERE id = ? AND name = ?')
+        self.assertEqual(
+            fingerprint('SELECT users_1.id FROM users AS users_1\n'
+                        'WHERE users_1.id IN (?, ?, ?) LIMIT ? -- comment'),
+            fingerprint('SELECT users_1.id FROM users AS users_1 '
+                        'WHERE users_1.id IN (%(id_1)s, %(id_2)s) LIMIT 20'))
+        self.assertEqual(
+            fingerprint('SELECT :x::text /* hint */'), 'SELECT ?::text')
+
+
+class QueryAnalyzerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['APP_QUERY_REPEAT_THRESHOLD'] = 5
+        self.app.config['APP_METRICS_TOKEN'] = 'secret'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.warnings = []
+        self.app.logger.warning = self.warnings.append
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_repeated_queries_are_flagged(self):
+        users = [User(email='u{}@example.com'.format(i),
+                      username='u{}'.format(i), password='cat')
+                 for i in range(8)]
+        db.session.add_all(users)
+        db.session.add_all([Post(body='post', author=u) for u in users])
+        db.session.commit()
+
+        @self.app.route('/n-plus-one')
+        def n_plus_one():
+            db.session.expire_all()
+            return ','.join(post.author.username
+                            for post in Post.query.all())
+
+        for i in range(3):
+            self.client.get('/n-plus-one')
+        flagged = [w for w in self.warnings if 'N+1' in w]
+        self.assertEqual(len(flagged), 1)
+        self.assertIn('n_plus_one: 8 runs', flagged[0])
+        top = query_analyzer.report(order='repeats')[0]
+        self.assertEqual(top['endpoint'], 'n_plus_one')
+        self.assertEqual(top['count'], 24)
+        self.assertEqual(top['requests'], 3)
+        self.assertEqual(top['per_request'], 8)
+        self.assertIn('WHERE users.id = ?', top['fingerprint'])
+
+    def test_report_view(self):
+        self.client.get('/')
+        self.client.get('/user/nobody')
+        response = self.client.get(
+            '/metrics/queries?order=count&size=2',
+            headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(json_response['queries']), 2)
+        counts = [q['count'] for q in json_response['queries']]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        response = self.client.get('/metrics/queries')
+        self.assertEqual(response.status_code, 404)
+
+    def test_window_expires(self):
+        self.app.config['APP_QUERY_REPORT_WINDOW'] = 0.2
+        self.app.config['APP_QUERY_REPORT_SLOTS'] = 2
+        self.client.get('/')
+        self.assertTrue(query_analyzer.report())
+        state = self.app.extensions['query_analyzer']
+        state.slots = [(start - 1, stats, flagged)
+                       for start, stats, flagged in state.slots]
+        self.assertEqual(query_analyzer.report(), [])
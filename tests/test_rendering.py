@@ -0,0 +1,39 @@
+import unittest
+
+from app import create_app, db
+from app.models import Post
+from app.rendering import BodyRenderer, renderer
+
+
+class RenderingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_cache_hits_and_misses(self):
+        r = BodyRenderer(maxsize=10)
+        html = r.render('*hello* <script>x</script>', ['em'])
+        self.assertEqual(html, '<em>hello</em> x')
+        self.assertEqual(r.render('*hello* <script>x</script>', ['em']), html)
+        self.assertEqual(r.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+        # the allowed tags are part of the key
+        self.assertEqual(r.render('*hello* <script>x</script>', []), 'hello x')
+        self.assertEqual(r.stats()['misses'], 2)
+
+    def test_unchanged_body_is_not_rendered(self):
+        p = Post(body='some *body*')
+        db.session.add(p)
+        db.session.commit()
+        self.assertEqual(p.body_html, '<p>some <em>body</em></p>')
+        stats = renderer.stats()
+        p.body = 'some *body*'
+        self.assertEqual(renderer.stats(), stats)
+        p.body = 'other *body*'
+        self.assertEqual(p.body_html, '<p>other <em>body</em></p>')
@@ -0,0 +1,61 @@
+import unittest
+
+from flask_sqlalchemy import get_debug_queries
+
+from app import create_app, db
+from app.models import Permission, Role, User
+
+
+class RoleRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_checks_need_no_role_queries(self):
+        db.session.add_all([
+            User(email='{}@example.com'.format(i), username='u{}'.format(i),
+                 password='cat')
+            for i in range(5)])
+        db.session.commit()
+        db.session.expunge_all()
+        users = User.query.all()
+        Role.registry()
+        before = len(get_debug_queries())
+        for user in users:
+            self.assertTrue(user.can(Permission.WRITE_ARTICLES))
+            self.assertFalse(user.can(Permission.MODERATE_COMMENTS))
+            self.assertFalse(user.is_administrator())
+        self.assertEqual(len(get_debug_queries()), before)
+
+    def test_refreshed_when_roles_change(self):
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        self.assertFalse(u.can(Permission.MODERATE_COMMENTS))
+        role = Role.query.filter_by(default=True).first()
+        role.permissions |= Permission.MODERATE_COMMENTS
+        db.session.commit()
+        self.assertTrue(u.can(Permission.MODERATE_COMMENTS))
+        Role.insert_roles()
+        self.assertFalse(u.can(Permission.MODERATE_COMMENTS))
+
+    def test_unflushed_role_change(self):
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        u.role = Role.query.filter_by(name='Administrator').first()
+        self.assertTrue(u.is_administrator())
+
+    def test_expires(self):
+        self.app.config['APP_ROLE_REGISTRY_TTL'] = 0
+        registry = Role.registry()
+        self.assertIsNot(Role.registry(), registry)
+        self.assertEqual(Role.registry(), registry)
@@ -0,0 +1,114 @@
+import json
+import unittest
+from base64 import b64encode
+
+from app import create_app, db, search
+from app.exceptions import ValidationError
+from app.models import Comment, Post, Role, User
+
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.user = User(email='john@example.com', username='john',
+                         password='cat', confirmed=True)
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_api_headers(self):
+        return {
+            'Authorization': 'Basic ' + b64encode(
+                'john@example.com:cat'.encode('utf-8')).decode('utf-8'),
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+        }
+
+    def test_index_follows_changes(self):
+        p = Post(body='the quick brown fox', author=self.user)
+        db.session.add(p)
+        db.session.commit()
+        self.assertEqual(search.search('posts', 'foxes').items, [p])
+        p.body = 'a lazy dog'
+        db.session.add(p)
+        db.session.commit()
+        self.assertEqual(search.search('posts', 'fox').items, [])
+        self.assertEqual(search.search('posts', 'dog').items, [p])
+        db.session.delete(p)
+        db.session.commit()
+        self.assertEqual(search.search('posts', 'dog').items, [])
+
+    def test_ranking_and_pagination(self):
+        posts = [Post(body='apple ' * i + 'banana', author=self.user)
+                 for i in range(1, 6)]
+        db.session.add_all(posts)
+        db.session.add(Post(body='cherry', author=self.user))
+        db.session.commit()
+        seen = []
+        cursor = None
+        while True:
+            page = search.search('posts', 'apple', cursor, per_page=2)
+            seen.extend(page.items)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, list(reversed(posts)))
+        self.assertEqual(search.search('posts', 'apple cherry').items, [])
+        with self.assertRaises(ValidationError):
+            search.search('posts', 'apple', 'not a cursor')
+
+    def test_query_syntax_is_not_interpreted(self):
+        db.session.add(Post(body='near or not', author=self.user))
+        db.session.commit()
+        for q in ('NEAR(', '"', 'not*', 'body:or', '-'):
+            search.search('posts', q)
+        self.assertEqual(len(search.search('posts', 'NOT OR').items), 1)
+        self.assertEqual(search.search('posts', '').items, [])
+
+    def test_disabled_comments(self):
+        p = Post(body='post', author=self.user)
+        c1 = Comment(body='great post', post=p, author=self.user)
+        c2 = Comment(body='great spam', post=p, author=self.user,
+                     disabled=True)
+        db.session.add_all([p, c1, c2])
+        db.session.commit()
+        self.assertEqual(search.search('comments', 'great').items, [c1])
+
+    def test_rebuild(self):
+        db.session.add(Post(body='indexed later', author=self.user))
+        db.session.commit()
+        with db.engine.begin() as connection:
+            connection.execute('DELETE FROM posts_fts')
+        self.assertEqual(search.search('posts', 'later').items, [])
+        self.assertEqual(search.rebuild('posts', chunk_size=1), 1)
+        self.assertEqual(len(search.search('posts', 'later').items), 1)
+
+    def test_views(self):
+        db.session.add(Post(body='searchable words', author=self.user))
+        db.session.commit()
+        response = self.client.get('/search?q=searchable')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'searchable words', response.data)
+        response = self.client.get('/search?q=searchable&kind=comments')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b'searchable words', response.data)
+        response = self.client.get(
+            '/api/v1.0/search?q=words', headers=self.get_api_headers())
+        self.assertEqual(response.status_code, 200)
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['posts'][0]['body'],
+                         'searchable words')
+        self.assertIsNone(json_response['next'])
+        response = self.client.get(
+            '/api/v1.0/search?q=words&kind=users',
+            headers=self.get_api_headers())
+        self.assertEqual(response.status_code, 400)
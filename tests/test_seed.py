@@ -0,0 +1,72 @@
+import unittest
+from datetime import datetime
+
+from app import create_app, db
+from app.models import (Comment, Follow, Post, Role, TimelineEntry, User,
+                        reconcile_counters)
+from app.seed import Seeder
+
+
+class SeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def seed(self, seed=1):
+        return Seeder(seed=seed, batch_size=70,
+                      now=datetime(2016, 2, 1)).run(
+            users=50, posts=300, comments=400, follows=5)
+
+    def snapshot(self):
+        return (
+            [(u.username, u.name, u.location) for u in
+             User.query.order_by(User.id)],
+            [(f.follower_id, f.followed_id) for f in
+             Follow.query.order_by(Follow.follower_id, Follow.followed_id)],
+            [(p.author_id, p.body, p.timestamp) for p in
+             Post.query.order_by(Post.id)],
+        )
+
+    def test_sizes_and_counters(self):
+        user_ids = self.seed()
+        self.assertEqual(len(user_ids), 50)
+        self.assertEqual(Post.query.count(), 300)
+        self.assertEqual(Comment.query.count(), 400)
+        for user in User.query:
+            self.assertTrue(user.is_following(user))
+            self.assertTrue(user.verify_password('password'))
+        self.assertTrue(all(n == 0 for n in reconcile_counters().values()))
+        self.assertTrue(TimelineEntry.query.count() > 0)
+        self.assertEqual(Role.query.filter_by(default=True).count(), 1)
+
+    def test_returns_the_inserted_ids(self):
+        first = self.seed()
+        second = self.seed(seed=2)
+        self.assertEqual(len(set(first + second)), 100)
+        self.assertEqual(
+            sorted(id for id, in db.session.query(User.id)),
+            sorted(first + second))
+
+    def test_follow_graph_is_skewed(self):
+        self.seed()
+        counts = sorted((u.follower_count for u in User.query), reverse=True)
+        self.assertTrue(counts[0] > 3 * counts[len(counts) // 2])
+
+    def test_deterministic(self):
+        self.seed(seed=7)
+        first = self.snapshot()
+        db.drop_all()
+        db.create_all()
+        self.seed(seed=7)
+        self.assertEqual(self.snapshot(), first)
+        db.drop_all()
+        db.create_all()
+        self.seed(seed=8)
+        self.assertNotEqual(self.snapshot(), first)
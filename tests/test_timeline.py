@@ -0,0 +1,146 @@
+import unittest
+
+from app import create_app, db
+from app.models import (Post, Role, TimelineEntry, User,
+                        reconcile_counters)
+
+
+class TimelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def timeline_posts(self, user):
+        query, (timestamp, post_id) = user.timeline()
+        return query.order_by(timestamp.desc(), post_id.desc()).all()
+
+    def make_users(self):
+        u1 = User(email='one@example.com', username='one', password='cat')
+        u2 = User(email='two@example.com', username='two', password='dog')
+        db.session.add_all([u1, u2])
+        db.session.commit()
+        return u1, u2
+
+    def test_post_fans_out_to_followers(self):
+        u1, u2 = self.make_users()
+        u1.follow(u2)
+        db.session.commit()
+        p = Post(body='hello', author=u2)
+        db.session.add(p)
+        db.session.commit()
+        self.assertEqual(self.timeline_posts(u1), [p])
+        self.assertEqual(self.timeline_posts(u2), [p])
+        self.assertEqual(TimelineEntry.query.count(), 2)
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        u1, u2 = self.make_users()
+        p1 = Post(body='first', author=u2)
+        db.session.add(p1)
+        db.session.commit()
+        self.assertEqual(self.timeline_posts(u1), [])
+        u1.follow(u2)
+        db.session.commit()
+        self.assertEqual(self.timeline_posts(u1), [p1])
+        u1.unfollow(u2)
+        db.session.commit()
+        self.assertEqual(self.timeline_posts(u1), [])
+        self.assertEqual(self.timeline_posts(u2), [p1])
+
+    def test_pull_mode_for_popular_authors(self):
+        self.app.config['APP_TIMELINE_FANOUT_LIMIT'] = 1
+        u1, u2 = self.make_users()
+        u1.follow(u2)
+        db.session.commit()
+        p = Post(body='popular', author=u2)
+        db.session.add(p)
+        db.session.commit()
+        self.assertTrue(u2.timeline_pull)
+        self.assertEqual(TimelineEntry.query.count(), 0)
+        self.assertEqual(self.timeline_posts(u1), [p])
+        self.assertEqual(self.timeline_posts(u2), [p])
+
+    def test_pull_mode_ends_below_the_limit(self):
+        self.app.config['APP_TIMELINE_FANOUT_LIMIT'] = 2
+        self.app.config['APP_TIMELINE_FANIN_RATIO'] = 0.5
+        u1, u2 = self.make_users()
+        u3 = User(email='three@example.com', username='three',
+                  password='cat')
+        db.session.add(u3)
+        u1.follow(u2)
+        u3.follow(u2)
+        db.session.commit()
+        p1 = Post(body='popular', author=u2)
+        db.session.add(p1)
+        db.session.commit()
+        self.assertTrue(u2.timeline_pull)
+        # back at the limit, but not below the ratio of it
+        u3.unfollow(u2)
+        db.session.commit()
+        p2 = Post(body='still popular', author=u2)
+        db.session.add(p2)
+        db.session.commit()
+        db.session.refresh(u2)
+        self.assertTrue(u2.timeline_pull)
+        self.assertEqual(TimelineEntry.query.count(), 0)
+        # the posts are only copied by refill, timelines pull them until then
+        u1.unfollow(u2)
+        db.session.commit()
+        db.session.refresh(u2)
+        self.assertFalse(u2.timeline_pull)
+        self.assertTrue(u2.timeline_refill)
+        self.assertEqual(TimelineEntry.query.count(), 0)
+        self.assertEqual(self.timeline_posts(u1), [])
+        self.assertEqual(set(self.timeline_posts(u2)), set([p1, p2]))
+        p3 = Post(body='quiet', author=u2)
+        db.session.add(p3)
+        db.session.commit()
+        self.assertEqual(TimelineEntry.query.count(), 1)
+        self.assertEqual(TimelineEntry.refill(chunk_size=1), 2)
+        db.session.refresh(u2)
+        self.assertFalse(u2.timeline_refill)
+        self.assertEqual(set(self.timeline_posts(u2)), set([p1, p2, p3]))
+        self.assertEqual(self.timeline_posts(u3), [])
+
+    def test_rebuild(self):
+        u1, u2 = self.make_users()
+        u1.follow(u2)
+        db.session.commit()
+        posts = [Post(body='post {}'.format(i), author=u2) for i in range(3)]
+        db.session.add_all(posts)
+        db.session.commit()
+        TimelineEntry.query.delete()
+        db.session.commit()
+        self.assertEqual(self.timeline_posts(u1), [])
+        self.assertEqual(TimelineEntry.rebuild(chunk_size=1), 6)
+        self.assertEqual(set(self.timeline_posts(u1)), set(posts))
+
+    def test_add_self_follows(self):
+        u1, u2 = self.make_users()
+        p = Post(body='mine', author=u2)
+        db.session.add(p)
+        db.session.commit()
+        for user in (u1, u2):
+            user.unfollow(user)
+        db.session.commit()
+        self.assertFalse(u2.is_following(u2))
+        self.assertEqual(self.timeline_posts(u2), [])
+        progress = []
+        self.assertEqual(User.add_self_follows(
+            chunk_size=1, progress=lambda *args: progress.append(args)), 2)
+        self.assertEqual(progress, [(1, 2, 1), (2, 2, 2)])
+        db.session.expire_all()
+        self.assertTrue(u1.is_following(u1))
+        self.assertTrue(u2.is_following(u2))
+        self.assertEqual(self.timeline_posts(u2), [p])
+        self.assertEqual(u2.follower_count, 1)
+        self.assertEqual(u2.followed_count, 1)
+        self.assertTrue(all(n == 0 for n in reconcile_counters().values()))
+        self.assertEqual(User.add_self_follows(), 0)